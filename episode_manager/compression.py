@@ -2,8 +2,9 @@ import os
 import io
 import shutil
 import importlib
+from contextlib import contextmanager, suppress
 from subprocess import run, Popen, PIPE
-from typing import BinaryIO, IO
+from typing import BinaryIO, IO, Generator
 
 from .config import debug
 
@@ -21,6 +22,25 @@ def compress_file(source:str, destination:str) -> bool:
 	return _compressor['compress'](_compressor, source, destination)
 
 
+@contextmanager
+def writer(destination:str) -> Generator[BinaryIO, None, None]:
+	"""A file object compressing what's written to it into 'destination' (while writing)."""
+	with io.open(destination, 'wb') as dfp:
+		if not _compressor:
+			yield dfp
+			return
+
+		cfp = _compressor['writer'](_compressor, dfp)
+		try:
+			yield cfp
+		except BaseException:
+			with suppress(Exception):
+				cfp.close()
+			raise
+		# flushes the compressor (raises if that failed)
+		cfp.close()
+
+
 def open(source:str) -> BinaryIO:
 	if not _compressor:
 		return io.open(source, 'rb')
@@ -51,6 +71,11 @@ def _zstandard_compress(method:dict, source:str, destination:str) -> bool:
 	os.remove(source)
 	return True
 
+def _zstandard_writer(method:dict, dfp:BinaryIO) -> IO[bytes]:
+	import zstandard
+	compressor = zstandard.ZstdCompressor(level=method['level'])
+	return compressor.stream_writer(dfp)
+
 def _zstandard_open(method:dict, source:str) -> BinaryIO:
 	import zstandard
 	fp = io.open(source, 'rb')
@@ -69,6 +94,10 @@ def _gzip_compress(method:dict, source:str, destination:str) -> bool:
 	os.remove(source)
 	return True
 
+def _gzip_writer(method:dict, dfp:BinaryIO) -> IO[bytes]:
+	import gzip
+	return gzip.GzipFile(fileobj=dfp, mode='wb', compresslevel=method['level'])
+
 def _gzip_open(method:dict, source:str) -> IO[bytes]|None:
 	import gzip
 	fp = gzip.open(source)
@@ -87,6 +116,10 @@ def _xz_compress(method:dict, source:str, destination:str) -> bool:
 	os.remove(source)
 	return True
 
+def _xz_writer(method:dict, dfp:BinaryIO) -> IO[bytes]:
+	import lzma
+	return lzma.LZMAFile(dfp, 'wb', preset=method['level'])
+
 def _xz_open(method:dict, source:str) -> IO[bytes]|None:
 	import lzma
 	return lzma.open(source)
@@ -120,6 +153,28 @@ def _compress_external(method:dict, source:str, destination:str) -> bool:
 	return success
 
 
+class _PipeWriter:
+	# writes to the stdin of an external compressor
+	def __init__(self, command_line:list[str], dfp:BinaryIO):
+		self._proc = Popen(command_line, stdin=PIPE, stdout=dfp)
+
+	def write(self, data:bytes) -> int:
+		assert self._proc.stdin is not None
+		return self._proc.stdin.write(data)
+
+	def close(self) -> None:
+		assert self._proc.stdin is not None
+		self._proc.stdin.close()
+		exit_code = self._proc.wait()
+		if exit_code != 0:
+			raise RuntimeError('exit code: %d' % exit_code)
+
+def _writer_external(method:dict, dfp:BinaryIO) -> _PipeWriter:
+	command_line = [ method['binary'] ] # type: ignore
+	command_line += method.get('args', [])
+	return _PipeWriter(command_line, dfp)
+
+
 def _open_external(method:dict, source:str) -> IO[bytes]|None:
 	command_line = [method['binary']] + method['unargs'] + method['pipe'] # type: ignore
 	sfp = io.open(source, 'rb')
@@ -168,12 +223,14 @@ _compressors:list[dict] = [
 		'detect': _detect_package('zstandard'),
 		'level': ZSTD_LEVEL,
 		'compress': _zstandard_compress,
+		'writer': _zstandard_writer,
 		'open': _zstandard_open,
 		'extension': '.zst',
 	},
 	{
 	    'detect': _detect_external('zstd'),
 		'compress': _compress_external,
+		'writer': _writer_external,
 		'open': _open_external,
 		'args': [ f'-{ZSTD_LEVEL}', '--quiet', '--threads=0' ],
 		'unargs': [ '--decompress', '--quiet', '--threads=0' ],
@@ -183,6 +240,7 @@ _compressors:list[dict] = [
 	{
 	    'detect': _detect_external('lz4'),
 		'compress': _compress_external,
+		'writer': _writer_external,
 		'open': _open_external,
 		'args': [ f'-{LZ4_LEVEL}', '--quiet' ],
 		'unargs': [ '--decompress', '--quiet' ],
@@ -194,12 +252,14 @@ _compressors:list[dict] = [
 		'detect': _detect_package('lzma'),
 		'level': XZ_LEVEL,
 		'compress': _xz_compress,
+		'writer': _xz_writer,
 		'open': _xz_open,
 		'extension': '.xz',
 	},
 	{
 	    'detect': _detect_external('xz'),
 		'compress': _compress_external,
+		'writer': _writer_external,
 		'open': _open_external,
 		'args': [ f'-{XZ_LEVEL}', '--quiet' ],
 		'unargs': [ '--decompress', '--quiet' ],
@@ -211,12 +271,14 @@ _compressors:list[dict] = [
 		'detect': _detect_package('gzip'),
 		'level': GZIP_LEVEL,
 		'compress': _gzip_compress,
+		'writer': _gzip_writer,
 		'open': _gzip_open,
 		'extension': '.gz',
 	},
 	{
 	    'detect': _detect_external('gzip'),
 		'compress': _compress_external,
+		'writer': _writer_external,
 		'open': _open_external,
 		'args': [ f'-{GZIP_LEVEL}', '--quiet' ],
 		'unargs': [ '--decompress', '--quiet' ],
@@ -11,11 +11,20 @@ from .styles import _00, _f, _o, _0, _E
 
 default_max_refresh_age = 2  # days
 default_max_hits = 10
+default_parallel_requests = 16
+default_rate_limit = 40  # requests/second
+default_retries = 3
+default_deadline = 300  # seconds
 
 env_config_path = 'EPM_CONFIG'
 env_series_db_path = 'EPM_SERIES_DB'
 env_series_cache_path = 'EPM_SERIES_CACHE'
 env_debug = 'EPM_DEBUG'
+# offline use of the TMDb client (see module 'transport')
+env_tmdb_api_root = 'EPM_TMDB_API_ROOT'
+env_tmdb_record = 'EPM_TMDB_RECORD'
+env_tmdb_replay = 'EPM_TMDB_REPLAY'
+env_tmdb_latency = 'EPM_TMDB_LATENCY'
 
 user_config_home = os.getenv('XDG_CONFIG_HOME') or pexpand(pjoin('$HOME', '.config'))
 user_cache_home = os.getenv('XDG_CACHE_HOME') or pexpand(pjoin('$HOME', '.cache'))
@@ -32,10 +41,29 @@ _configuration_defaults:dict[str, ValueType] = {
 			'num_weeks': 1,
 		},
 	},
-	'num-backups': 10,
+	'storage': 'json',  # or 'sqlite'
+	'series-storage': 'files',  # or 'pack' (series data with 'json' storage)
+	'num-backups': 10,  # with 'sqlite' storage: previous versions (see undo)
 	'num-update-history': 5,
+	'journal-max-entries': 50,  # database changes saved in the journal before a full write (0: always full)
 	'lookup': {
 		'max-hits': default_max_hits,
+		'parallel': default_parallel_requests,
+		'rate-limit': default_rate_limit,
+		'retries': default_retries,
+		'deadline': default_deadline,
+		'append-to-response': True,
+		'hedge-budget': 0,  # % of extra requests, duplicating slow ones (0: disabled)
+		'cache': {
+			'enabled': True,
+			'max-size': 64,   # MiB
+			'ttl': {          # hours
+				'search': 24,
+				'details': 12,
+				'season': 12,
+				'changes': 1,
+			},
+		},
 	},
 }
 
@@ -1,7 +1,7 @@
 import sys
 import time
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from os.path import dirname, exists as pexists, join as pjoin
 from collections import UserDict
 import shutil
@@ -12,16 +12,18 @@ from multiprocessing.pool import ApplyResult
 
 from . import config, compression, tmdb
 from .config import debug
-from .utils import read_json_obj, write_json, now_datetime, now_stamp
+from .utils import read_json_obj, dump_json, now_datetime, now_stamp, decode_json, encode_json
 from .styles import _0, _b, _f, _E, _00
 
-from typing import Any, Callable, TypeVar, Generator
+from typing import Any, Callable, TypeVar, Generator, Iterable
 
 DB_VERSION = 5
 
 _SAVE_DISABLED = False #True
 
 _REMOVE_DATA_AFTER = timedelta(days=30)
+# 'last used' stamps are only updated (and saved) when older than this
+_LAST_USED_RESOLUTION = timedelta(days=1)
 
 _dirty = True
 
@@ -49,6 +51,19 @@ def cache_path():
 def active_file(uncompressed:bool=False) -> str:
 	return _filename_slot(base_filename(), 0)
 
+def journal_file() -> str:
+	return base_filename() + '.journal'
+
+def storage() -> str:
+	"""How the database is stored: 'json' (compressed files; the default) or 'sqlite' (see db_sqlite)."""
+	return str(config.get('storage', 'json'))
+
+def sqlite_file() -> str:
+	return base_filename() + '.sqlite'
+
+def series_storage() -> str:
+	return str(config.get('series-storage', 'files'))
+
 
 s_mp_writer_pool = None
 s_mp_writer_pool_results:list[ApplyResult] = []
@@ -107,6 +122,37 @@ class SeriesCache:
 		return data
 
 
+	def merge_seasons(self, title_id:str, series:dict, seasons:dict[int, list[dict]]) -> dict|None:
+		"""Stored data of a series with new 'series' details and the episodes of 'seasons' replaced (not saved)."""
+
+		current = self.get(title_id)
+		if not current:
+			return None
+
+		# seasons that (still) exist, regular ones first, specials last
+		season_keys:list[int|str] = list(range(1, series.get('total_seasons', 1) + 1))
+		if series.get('specials'):
+			season_keys.append('S')
+
+		by_season:dict[int|str, list[dict]] = {}
+		for ep in current.get('episodes', []):
+			by_season.setdefault(ep.get('season'), []).append(ep)
+		for season, episodes in seasons.items():
+			by_season['S' if season == 0 else season] = episodes
+
+		all_episodes = [
+			ep
+			for season in season_keys
+			for ep in by_season.get(season, [])
+		]
+		tmdb.finalize_episodes(series, all_episodes)
+
+		return {
+			**series,
+			'episodes': all_episodes,
+		}
+
+
 	def set(self, title_id:str, data:dict):
 		self._cache[title_id] = data
 
@@ -139,6 +185,27 @@ class SeriesCache:
 			return None
 
 
+	def prefetch(self, title_ids:list[str]) -> None:
+		"""Load the data of 'title_ids' at once, if that's faster than one by one."""
+		pass
+
+	def flush(self) -> None:
+		pass
+
+	def close(self) -> None:
+		pass
+
+
+	def episodes_airing(self, title_ids:list[str], begin:str, end:str) -> list[tuple[str, dict]]:
+		"""Episodes of the series 'title_ids' with an air date in [begin, end) (ISO dates), as (series ID, episode)."""
+		return [
+			(title_id, ep)
+			for title_id in title_ids
+			for ep in (self.get(title_id) or {}).get('episodes', [])
+			if begin <= (ep.get('date') or '') < end
+		]
+
+
 	def _series_file(self, title_id:str) -> str:
 		return pjoin(self._path, title_id)
 
@@ -163,9 +230,57 @@ class SeriesCache:
 class Database(UserDict):
 
 	def __init__(self, initialdata=None):
+		# entries (series IDs or meta_key) changed/removed since loaded or saved (see save())
+		self._modified:set[str] = set()
+		self._removed:set[str] = set()
+		# series with only their 'last used' stamp updated (see set_used())
+		self._used:set[str] = set()
+
 		super().__init__(initialdata)
+		self.clear_modified()
 		# TODO: remove unreferencds entries in s_series_cache
 
+	def __setitem__(self, title_id:str, meta:dict):
+		super().__setitem__(title_id, meta)
+		self.set_modified(title_id)
+
+	def __delitem__(self, title_id:str):
+		super().__delitem__(title_id)
+		self._modified.discard(title_id)
+		self._used.discard(title_id)
+		self._removed.add(title_id)
+
+	def set_modified(self, title_id:str):
+		"""The meta data of 'title_id' (or the database's, meta_key) was changed."""
+		self._modified.add(title_id)
+		self._removed.discard(title_id)
+
+	def set_used(self, title_id:str):
+		"""The series 'title_id' was used; its 'last used' stamp is updated if it's outdated (see _LAST_USED_RESOLUTION)."""
+		meta = self[title_id]
+		last_used = meta.get(meta_last_used_key)
+		if last_used and now_datetime() - datetime.fromisoformat(last_used) < _LAST_USED_RESOLUTION:
+			return
+
+		meta[meta_last_used_key] = now_stamp()
+		self._used.add(title_id)
+
+	def is_modified(self) -> bool:
+		"""Whether anything was changed (not counting 'last used' stamps)."""
+		return bool(self._modified or self._removed)
+
+	def is_used(self) -> bool:
+		return bool(self._used)
+
+	def modified_ids(self) -> set[str]:
+		"""The entries to be saved, i.e. also those with an updated 'last used' stamp."""
+		return self._modified | self._used
+
+	def clear_modified(self):
+		self._modified.clear()
+		self._removed.clear()
+		self._used.clear()
+
 	def __len__(self):
 		if meta_key in self:
 			return super().__len__() - 1  # exclude epm:meta
@@ -191,11 +306,12 @@ class Database(UserDict):
 	@next_list_index.setter
 	def next_list_index(self, next_index):
 		self.meta[meta_next_list_index_key] = next_index
+		self.set_modified(meta_key)
 
 	def items(self):
 		return (
 	        (series_id, meta)
-			for series_id, meta in super().items()
+			for series_id, meta in self.data.items()
 			if series_id != meta_key
 		)
 
@@ -239,12 +355,17 @@ class Database(UserDict):
 		if not data:
 			raise KeyError(title_id);
 
-		self[title_id][meta_last_used_key] = now_stamp()
-		set_dirty()
+		self.set_used(title_id)
 
 		return data
 
 
+	def prefetch(self, title_ids:list[str]):
+		assert s_series_cache is not None, 'no series cache instance!?!'
+
+		s_series_cache.prefetch(title_ids)
+
+
 	def set_series(self, title_id:str, data:dict):
 		assert s_series_cache is not None, 'no series cache instance!?!'
 
@@ -253,6 +374,17 @@ class Database(UserDict):
 		self._update_meta(title_id, data)
 
 
+	def merge_seasons(self, title_id:str, series:dict, seasons:dict[int, list[dict]]) -> dict|None:
+		"""Update the stored series with only the specified seasons (fetched with the series' details)."""
+		assert s_series_cache is not None, 'no series cache instance!?!'
+
+		data = s_series_cache.merge_seasons(title_id, series, seasons)
+		if data is not None:
+			self.set_series(title_id, data)
+
+		return data
+
+
 	def remove_series(self, title_id:str) -> bool:
 		assert s_series_cache is not None, 'no series cache instance!?!'
 
@@ -269,6 +401,7 @@ class Database(UserDict):
 			update_history.pop(0)
 
 		meta[meta_update_history_key] = update_history
+		self.set_modified(title_id)
 
 
 	def recalc_meta(self, title_id:str):
@@ -278,6 +411,7 @@ class Database(UserDict):
 
 	def _update_meta(self, title_id:str, data:dict):
 		meta = self.get(title_id, {})
+		self.set_modified(title_id)
 		#debug('meta update %s ---------------------' % title_id)
 
 		meta['title'] = data['title']
@@ -304,7 +438,8 @@ class Database(UserDict):
 		if not data.get('episodes'):
 			debug('no episodes:', title_id)
 		meta[meta_total_episodes_key] = len(data.get('episodes', []))
-		meta[meta_total_seasons_key] = len(set(ep['season'] for ep in data.get('episodes', [])))
+		# regular seasons (like TMDb's count), not the specials
+		meta[meta_total_seasons_key] = len(set(ep['season'] for ep in data.get('episodes', []) if ep['season'] != 'S'))
 		_, unseen = series_seen_unseen(data, meta)
 		meta[meta_unseen_episodes_key] = len(unseen)
 
@@ -364,13 +499,33 @@ class Database(UserDict):
 		#debug('meta update END -----------------')
 
 
-	def clean_unused(self):
-		"""Remove series data of rarely used (archived) series"""
+	def episodes_airing(self, begin:date, end:date) -> list[tuple[str, dict]]:
+		"""Episodes of the non-archived series airing from 'begin' until (excluding) 'end', as (series ID, episode)."""
+		assert s_series_cache is not None, 'no series cache instance!?!'
+
+		title_ids = [
+			title_id
+			for title_id, meta in self.items()
+			if meta_archived_key not in meta
+		]
+		for title_id in title_ids:
+			if not s_series_cache.exists(title_id):
+				self.series(title_id)  # downloads it
+
+		return s_series_cache.episodes_airing(title_ids, begin.isoformat(), end.isoformat())
+
+
+	def clean_unused(self, title_ids:Iterable[str]|None=None):
+		"""Remove series data of rarely used (archived) series (of 'title_ids', None: all)"""
 
 		assert s_series_cache is not None, 'no series cache instance!?!'
 
+		if title_ids is None:
+			title_ids = [ title_id for title_id, _ in self.items() ]
+
 		removed = 0
-		for title_id, meta in self.items():
+		for title_id in title_ids:
+			meta = self[title_id]
 			if series_state(meta) & State.ARCHIVED and self.has_data(title_id):
 				last_used = meta.get(meta_last_used_key)
 
@@ -380,12 +535,12 @@ class Database(UserDict):
 					if mtime is None:
 						# file diesn't exist, set "last used" to an already-expired time stamp
 						meta[meta_last_used_key] = (now_datetime() - _REMOVE_DATA_AFTER).isoformat(' ', timespec='seconds')
-						set_dirty()
+						self.set_modified(title_id)
 						continue
 
 					last_used = mtime.isoformat(' ', timespec='seconds')
 					meta[meta_last_used_key] = last_used
-					set_dirty()
+					self.set_modified(title_id)
 
 				age = now_datetime() - datetime.fromisoformat(last_used)
 				if age > _REMOVE_DATA_AFTER:
@@ -399,11 +554,25 @@ class Database(UserDict):
 
 
 s_series_cache:SeriesCache|None = None
+# the SQLite store (db_sqlite.Store), if that's the storage
+s_store = None
 
-def load(db_file:str|None=None) -> Database:
+def load(db_file:str|None=None, save_changes:bool=True) -> Database:
 
-	global s_series_cache
-	s_series_cache = SeriesCache(pjoin(cache_path(), 'series'))
+	if not db_file and storage() == 'sqlite':
+		return _load_sqlite(save_changes)
+
+	global s_series_cache, s_store
+	if s_series_cache is not None:
+		s_series_cache.close()
+	if series_storage() == 'pack':
+		from . import series_pack
+		s_series_cache = series_pack.SeriesCache(pjoin(cache_path(), 'series'))
+	else:
+		s_series_cache = SeriesCache(pjoin(cache_path(), 'series'))
+	if s_store is not None:
+		s_store.close()
+		s_store = None
 
 	if not db_file:
 		db_file = active_file()
@@ -455,14 +624,54 @@ def load(db_file:str|None=None) -> Database:
 	ms = (t1 - t0)*1000
 	debug(f'{_f}db: read %d entries in %.1fms; v%d{_0}' % (len(mig_db), ms, mig_db.version))
 
+	if db_file == active_file():
+		_journal_replay(mig_db)
+
 	mig_db.clean_unused()
 
-	if is_dirty():
+	if save_changes and (is_dirty() or mig_db.is_modified()):
 		save(mig_db)
 
 	return mig_db
 
 
+def _load_sqlite(save_changes:bool=True) -> Database:
+	from . import db_sqlite
+
+	global s_series_cache, s_store
+
+	filepath = sqlite_file()
+	if not pexists(filepath):
+		# start with the (migrated) JSON database, if any
+		json_db = load(active_file())
+		assert s_series_cache is not None
+		os.makedirs(dirname(filepath), exist_ok=True)
+		db_sqlite.import_database(filepath, json_db, s_series_cache)
+		print(f'{_f}[{_b}db{_0}{_f}: imported into SQLite: {filepath}]{_0}')
+
+	if s_series_cache is not None:
+		s_series_cache.close()
+	if s_store is not None:
+		s_store.close()
+	s_store = db_sqlite.Store(filepath, undo_versions=config.get_int('num-backups'))
+	s_series_cache = db_sqlite.SeriesCache(s_store)
+
+	database = Database()
+	# not copied: the series' meta data is read on demand
+	database.data = s_store.load()
+	set_dirty(False)
+
+	# only the archived series' meta data
+	database.clean_unused(s_store.archived_ids())
+
+	if save_changes and database.is_modified():
+		# not a change to undo
+		s_store.save(database.data, database.modified_ids(), database._removed, undoable=False)
+		database.clear_modified()
+
+	return database
+
+
 def _migrate(db:dict) -> Database:
 	# no db meta data, yikes!
 	if meta_key not in db:
@@ -598,6 +807,7 @@ def _migrate(db:dict) -> Database:
 			legacy_meta_set(db, meta_version_key, DB_VERSION)
 		else:
 			meta_set(db, meta_version_key, DB_VERSION)
+		set_dirty()
 
 	if db_version < 2:
 		legacy_meta_set(db, meta_next_list_index_key, list_index)
@@ -721,16 +931,41 @@ def _unrotate_backups(base_name:str):
 
 
 def save(db:Database) -> bool:
+	"""
+	Changes made via Database methods (see Database.set_modified(), set_used()) are
+	appended to the journal, if possible; nothing is written if there are none.
+	The full database (snapshot) is written if something else changed (see
+	set_dirty()), or the journal has grown long enough.
+	"""
+
+	if s_series_cache is not None:
+		s_series_cache.flush()
 
 	if _SAVE_DISABLED:
 		print(f'db: {_E}SAVE DISABLED{_00}')
 		set_dirty(False)
+		db.clear_modified()
 		return True
 
-	if not is_dirty():
+	if not is_dirty() and not db.is_modified() and not db.is_used():
 		debug(f'{_f}db: save ignored; not dirty{_0}')
 		return True
 
+	if s_store is not None:
+		# only what changed, unless untracked changes were made
+		if is_dirty():
+			s_store.save(db.data)
+		else:
+			# saves of only 'last used' stamps aren't undone
+			s_store.save(db.data, db.modified_ids(), db._removed, undoable=db.is_modified())
+		set_dirty(False)
+		db.clear_modified()
+		return True
+
+	if not is_dirty() and _journal_append(db):
+		db.clear_modified()
+		return True
+
 	set_dirty(False)
 
 	base_name = base_filename()
@@ -740,6 +975,9 @@ def save(db:Database) -> bool:
 
 	t0 = time.time()
 
+	# a new snapshot; the journal is based on it from now on
+	db.meta[meta_snapshot_key] = '%x' % time.time_ns()
+
 	tmp_name = write_json_tmp(db.data, db_path)
 	if not tmp_name:
 		print(f'{_E}Failed{_00} writing database file', file=sys.stderr)
@@ -750,6 +988,10 @@ def save(db:Database) -> bool:
 	os.rename(tmp_name, active_file())
 	#debug(f'db: renamed new compressed {tmp_name} {active_file()}')
 
+	# the journal entries are included now (and would be ignored, being based on another snapshot)
+	_journal_clear()
+	db.clear_modified()
+
 	t1 = time.time()
 	ms = (t1 - t0)*1000
 	debug('db: wrote %d entries in %.1fms; v%d' % (len(db), ms, db.version))
@@ -757,26 +999,121 @@ def save(db:Database) -> bool:
 	return True
 
 
-def write_json_tmp(data:dict, dir:str) -> str|None:
-	# write to a temp file and then rename it afterwards
-	tmp_name = mkstemp(dir=dir)[1]
+# number of entries in the journal (based on the loaded snapshot)
+_journal_entries = 0
 
-	err = write_json(tmp_name, data)
+def _journal_append(db:Database) -> bool:
+	# one entry per save: the meta data of the modified series (one line of JSON)
+	global _journal_entries
 
-	if err is not None:
-		print(f'{_E}ERROR{_00} Failed writing JSON: %s' % str(err), file=sys.stderr)
-		os.remove(tmp_name)
-		return None
+	snapshot = db.meta.get(meta_snapshot_key)
+	max_entries = config.get_int('journal-max-entries')
+	if not snapshot or _journal_entries >= max_entries:
+		return False
 
-	tmp_name2 = mkstemp(dir=dir)[1]
-	#debug(f'db: compressing {tmp_name} -> {tmp_name2}')
+	entry = {
+		'snapshot': snapshot,
+		'set': { title_id: db.data[title_id] for title_id in db.modified_ids() if title_id in db.data },
+		'del': sorted(db._removed),
+	}
+
+	t0 = time.time()
+	try:
+		with open(journal_file(), 'ab') as fp:
+			fp.write(encode_json(entry) + b'\n')
+			fp.flush()
+			os.fsync(fp.fileno())
+
+	except OSError as e:
+		debug(f'db: appending to journal failed: {e}')
+		return False
+
+	_journal_entries += 1
+
+	ms = (time.time() - t0)*1000
+	debug('db: journaled %d entries in %.1fms (%d/%d)' % (len(entry['set']) + len(entry['del']), ms, _journal_entries, max_entries))
+
+	return True
+
+
+def _journal_replay(db:Database):
+	# apply the journal entries to the loaded snapshot
+	global _journal_entries
+	_journal_entries = 0
+
+	try:
+		with open(journal_file(), 'rb') as fp:
+			lines = fp.readlines()
+	except FileNotFoundError:
+		return
+
+	snapshot = db.meta.get(meta_snapshot_key)
+
+	for line in lines:
+		try:
+			entry = decode_json(line)
+		except ValueError:
+			# probably incomplete, interrupted while writing (it's the last one, then)
+			debug('db: ignored bad journal entry')
+			set_dirty()  # get rid of it
+			continue
 
-	if not compression.compress_file(tmp_name, tmp_name2):
+		if not snapshot or entry.get('snapshot') != snapshot:
+			# based on an older snapshot, that already includes it
+			set_dirty()
+			continue
+
+		for title_id, meta in entry['set'].items():
+			db.data[title_id] = meta
+		for title_id in entry['del']:
+			db.data.pop(title_id, None)
+
+		_journal_entries += 1
+
+	debug('db: replayed %d journal entries' % _journal_entries)
+
+
+def _journal_pop() -> bool:
+	# remove the most recent entry
+	global _journal_entries
+	if not _journal_entries:
+		return False
+
+	with open(journal_file(), 'rb+') as fp:
+		data = fp.read()
+		fp.truncate(data.rstrip(b'\n').rfind(b'\n') + 1)
+		os.fsync(fp.fileno())
+
+	_journal_entries -= 1
+
+	return True
+
+
+def _journal_clear():
+	global _journal_entries
+	_journal_entries = 0
+
+	try:
+		os.remove(journal_file())
+	except FileNotFoundError:
+		pass
+
+
+def write_json_tmp(data:dict, dir:str) -> str|None:
+	# serialize and compress directly into a temp file, to be renamed afterwards
+	fd, tmp_name = mkstemp(dir=dir)
+	os.close(fd)
+
+	try:
+		with compression.writer(tmp_name) as fp:
+			dump_json(data, fp)
+
+	except Exception as e:
+		print(f'{_E}ERROR{_00} Failed writing JSON: %s' % str(e), file=sys.stderr)
 		os.remove(tmp_name)
-		os.remove(tmp_name2)
 		return None
 
-	return tmp_name2
+	return tmp_name
 
 
 def list_backups() -> list[str]:
@@ -799,21 +1136,41 @@ def rollback():
 
 	base_name= base_filename()
 
+	if storage() == 'sqlite':
+		return _rollback_sqlite()
+
+	# don't save here: that would append a journal entry, which we would then pop
+	change_log = load(save_changes=False).meta.get(meta_changes_log_key, [])
+
+	# the most recent changes might only be in the journal
+	if _journal_pop():
+		return _journal_entries + len(list_backups()), '%s (last entry)' % journal_file(), change_log
+
 	first_backup = _filename_slot(base_name, 1)
 	if not pexists(first_backup):
 		return None, f'No backup to restore ({first_backup})', None
 
-	change_log = load().meta.get(meta_changes_log_key, [])
-
 	# decreease the index of all backups
 	num_remaining = _unrotate_backups(base_name)
 
 	return num_remaining, first_backup, change_log
 
 
+def _rollback_sqlite():
+	if s_store is None:
+		load(save_changes=False)
+	assert s_store is not None
+
+	undone = s_store.undo()
+	if undone is None:
+		return None, f'No previous version to restore ({sqlite_file()})', None
+
+	remaining, change_log = undone
+	return remaining, '%s (previous version)' % sqlite_file(), change_log
+
+
 def meta_set(meta:dict, key: str, value) -> None:
-	# a bit complex to check whether 'value' differs from existing value
-	set_dirty()
+	# the caller records the change, e.g. using Database.set_modified()
 	meta[key] = value
 
 	if value == [] or value == {}:
@@ -821,8 +1178,7 @@ def meta_set(meta:dict, key: str, value) -> None:
 
 
 def meta_del(meta:dict, key: str) -> None:
-	if key in meta:
-		set_dirty()
+	# the caller records the change, e.g. using Database.set_modified()
 	meta.pop(key, None)
 
 
@@ -835,13 +1191,14 @@ def changelog_add(db:Database, message:str, series_id:str|None=None):
 	log.append((message, series_id))
 
 	db.meta[meta_changes_log_key] = log
-	set_dirty()
+	db.set_modified(meta_key)
 
 	debug('Logged change:', message, series_id if series_id else '')
 
 
 def changelog_clear(db:Database):
-	db.meta.pop(meta_changes_log_key, None)
+	if db.meta.pop(meta_changes_log_key, None) is not None:
+		db.set_modified(meta_key)
 
 class State(enum.IntFlag):
 	PLANNED   = 0x01  # added but nothing seen (yet)
@@ -1214,6 +1571,7 @@ meta_rating_comment_key = 'rating_comment'
 meta_version_key = 'version'
 meta_changes_log_key = 'changes_log'
 meta_add_comment_key = 'add_comment'
+meta_snapshot_key = 'snapshot'
 
 
 meta_legacy_keys = (
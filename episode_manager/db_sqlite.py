@@ -0,0 +1,413 @@
+"""
+SQLite storage of the series database (config 'storage': 'sqlite').
+
+Tables for the series' meta data, their seen marks and tags, the series data
+(details) and their episodes, one row each. Indexed by list index, state, tag
+and episode air date, so e.g. the data of a single series or the episodes
+airing in some period are read without reading everything. The series' meta
+data is also read when first accessed (see Entries).
+
+Instead of backups, the previous rows of the entries changed by each save are
+kept (table undo, up to 'undo_versions' saves), to be restored by undo().
+"""
+import os
+import time
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable
+
+from . import db
+from .config import debug
+from .utils import decode_json, encode_json
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS db_meta (
+	key TEXT PRIMARY KEY,
+	value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS series (
+	id TEXT PRIMARY KEY,
+	list_index INTEGER,
+	state INTEGER NOT NULL,
+	meta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS series_list_index ON series(list_index);
+CREATE INDEX IF NOT EXISTS series_state ON series(state);
+CREATE TABLE IF NOT EXISTS seen (
+	series_id TEXT NOT NULL,
+	episode TEXT NOT NULL,
+	stamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_series ON seen(series_id);
+CREATE TABLE IF NOT EXISTS tags (
+	series_id TEXT NOT NULL,
+	tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_series ON tags(series_id);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+CREATE TABLE IF NOT EXISTS series_data (
+	id TEXT PRIMARY KEY,
+	details TEXT NOT NULL,
+	updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS episodes (
+	series_id TEXT NOT NULL,
+	position INTEGER NOT NULL,
+	season,
+	episode INTEGER,
+	date TEXT,
+	data TEXT NOT NULL,
+	PRIMARY KEY (series_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS episodes_date ON episodes(date);
+CREATE TABLE IF NOT EXISTS undo (
+	version INTEGER NOT NULL,
+	id TEXT NOT NULL,
+	meta TEXT
+);
+CREATE INDEX IF NOT EXISTS undo_version ON undo(version);
+'''
+
+
+class Entries(dict):
+	"""Series ID -> meta (and db.meta_key -> the database's meta data), with the series' meta read on first access."""
+	def __init__(self, store:'Store', title_ids:Iterable[str], db_meta:dict|None):
+		super().__init__((title_id, None) for title_id in title_ids)
+		self._store = store
+		self._unloaded = set(self.keys())
+		if db_meta:
+			super().__setitem__(db.meta_key, db_meta)
+
+	def __getitem__(self, title_id:str) -> dict:
+		if title_id in self._unloaded:
+			self._load([title_id])
+		return super().__getitem__(title_id)
+
+	def __setitem__(self, title_id:str, meta:dict) -> None:
+		self._unloaded.discard(title_id)
+		super().__setitem__(title_id, meta)
+
+	def __delitem__(self, title_id:str) -> None:
+		self._unloaded.discard(title_id)
+		super().__delitem__(title_id)
+
+	def get(self, title_id:str, default=None):
+		try:
+			return self[title_id]
+		except KeyError:
+			return default
+
+	def pop(self, title_id:str, *default):
+		if title_id in self._unloaded:
+			self._load([title_id])
+		return super().pop(title_id, *default)
+
+	def items(self):
+		self._load_all()
+		return super().items()
+
+	def values(self):
+		self._load_all()
+		return super().values()
+
+	def __eq__(self, other) -> bool:
+		self._load_all()
+		return super().__eq__(other)
+
+	def _load_all(self) -> None:
+		if self._unloaded:
+			# all at once, e.g. to list the whole library
+			self._load(None)
+
+	def _load(self, title_ids:list[str]|None) -> None:
+		loaded = self._store.load_meta(title_ids)
+		for title_id in list(self._unloaded if title_ids is None else title_ids):
+			if title_id in loaded:
+				super().__setitem__(title_id, loaded[title_id])
+			else:
+				# removed from the store meanwhile (e.g. by undo())
+				super().pop(title_id, None)
+			self._unloaded.discard(title_id)
+
+
+class Store:
+	def __init__(self, filepath:str, undo_versions:int=0):
+		self.undo_versions = undo_versions
+		self._conn = sqlite3.connect(filepath, isolation_level=None)
+		# commits don't wait for fsync (only checkpoints do); the database can't get corrupted though
+		self._conn.execute('PRAGMA journal_mode=WAL')
+		self._conn.execute('PRAGMA synchronous=NORMAL')
+		self._conn.executescript(_SCHEMA)
+
+	def close(self) -> None:
+		self._conn.close()
+
+	def load(self) -> Entries:
+		"""The series IDs and the database's meta data (the series' meta is read on demand, see Entries)."""
+		title_ids = [ series_id for series_id, in self._conn.execute('SELECT id FROM series ORDER BY rowid') ]
+		return Entries(self, title_ids, self._load_db_meta())
+
+	def load_meta(self, title_ids:list[str]|None=None) -> dict[str, dict]:
+		"""Series ID -> meta (with seen marks and tags) of 'title_ids' (None: all)."""
+		t0 = time.time()
+
+		params = tuple(title_ids or ())
+		def where(column:str) -> str:
+			if title_ids is None:
+				return ''
+			return ' WHERE %s IN (%s)' % (column, ','.join('?'*len(params)))
+
+		entries:dict[str, dict] = {
+			series_id: decode_json(meta)
+			for series_id, meta in self._conn.execute('SELECT id, meta FROM series%s ORDER BY rowid' % where('id'), params)
+		}
+		for series_id, episode, stamp in self._conn.execute('SELECT series_id, episode, stamp FROM seen%s ORDER BY rowid' % where('series_id'), params):
+			entries[series_id].setdefault(db.meta_seen_key, {})[episode] = stamp
+		for series_id, tag in self._conn.execute('SELECT series_id, tag FROM tags%s ORDER BY rowid' % where('series_id'), params):
+			entries[series_id].setdefault(db.meta_tags_key, []).append(tag)
+
+		ms = (time.time() - t0)*1000
+		debug('db: read %d series from SQLite in %.1fms' % (len(entries), ms))
+
+		return entries
+
+	def archived_ids(self) -> list[str]:
+		return [
+			series_id
+			for series_id, in self._conn.execute('SELECT id FROM series WHERE state & ? ORDER BY rowid', (int(db.State.ARCHIVED), ))
+		]
+
+	def save(self, entries:dict[str, dict], title_ids:Iterable[str]|None=None, removed:Iterable[str]=(), undoable:bool=True) -> None:
+		"""Store 'title_ids' of 'entries' (see load()) and delete 'removed' (in one transaction). None: all, deleting the others."""
+		t0 = time.time()
+		num_written = 0
+
+		with self._transaction():
+			if title_ids is None:
+				title_ids = list(entries.keys())
+				removed = set(row[0] for row in self._conn.execute('SELECT id FROM series')) - set(title_ids)
+			title_ids, removed = list(title_ids), list(removed)
+
+			if undoable and self.undo_versions > 0:
+				self._keep_previous(title_ids + removed)
+
+			for title_id in removed:
+				self._delete_meta(title_id)
+				self.remove_series(title_id)
+
+			for title_id in title_ids:
+				meta = entries.get(title_id)
+				if meta is None:
+					continue
+				if title_id == db.meta_key:
+					self._put_db_meta(meta)
+				else:
+					self._put_meta(title_id, meta)
+				num_written += 1
+
+		ms = (time.time() - t0)*1000
+		debug('db: wrote %d entries to SQLite in %.1fms' % (num_written, ms))
+
+	def undo(self) -> tuple[int, list]|None:
+		"""Restore the entries changed by the last save: (remaining versions, the database's changes log before), or None if nothing to undo."""
+		with self._transaction():
+			version = self._conn.execute('SELECT MAX(version) FROM undo').fetchone()[0]
+			if version is None:
+				return None
+
+			change_log = self._load_db_meta().get(db.meta_changes_log_key, [])
+
+			for title_id, meta in self._conn.execute('SELECT id, meta FROM undo WHERE version = ?', (version, )).fetchall():
+				if title_id == db.meta_key:
+					self._put_db_meta(decode_json(meta))
+				elif meta is None:
+					# didn't exist before
+					self._delete_meta(title_id)
+				else:
+					self._put_meta(title_id, decode_json(meta))
+
+			self._conn.execute('DELETE FROM undo WHERE version = ?', (version, ))
+			remaining = self._conn.execute('SELECT COUNT(DISTINCT version) FROM undo').fetchone()[0]
+
+		debug('db: restored SQLite version %d' % version)
+
+		return remaining, change_log
+
+	def has_series(self, title_id:str) -> bool:
+		return self._conn.execute('SELECT 1 FROM series_data WHERE id = ?', (title_id, )).fetchone() is not None
+
+	def load_series(self, title_id:str) -> dict|None:
+		row = self._conn.execute('SELECT details FROM series_data WHERE id = ?', (title_id, )).fetchone()
+		if row is None:
+			return None
+
+		data = decode_json(row[0])
+		data['episodes'] = [
+			decode_json(ep)
+			for ep, in self._conn.execute('SELECT data FROM episodes WHERE series_id = ? ORDER BY position', (title_id, ))
+		]
+		return data
+
+	def save_series(self, title_id:str, data:dict) -> None:
+		details = { key: value for key, value in data.items() if key != 'episodes' }
+		with self._transaction():
+			self._conn.execute('INSERT OR REPLACE INTO series_data (id, details, updated) VALUES (?, ?, ?)', (
+				title_id, encode_json(details).decode(), time.time()
+			))
+			self._conn.execute('DELETE FROM episodes WHERE series_id = ?', (title_id, ))
+			self._conn.executemany('INSERT INTO episodes (series_id, position, season, episode, date, data) VALUES (?, ?, ?, ?, ?, ?)', [
+				(title_id, position, ep.get('season'), ep.get('episode'), ep.get('date'), encode_json(ep).decode())
+				for position, ep in enumerate(data.get('episodes', []))
+			])
+
+	def remove_series(self, title_id:str) -> None:
+		with self._transaction():
+			self._conn.execute('DELETE FROM series_data WHERE id = ?', (title_id, ))
+			self._conn.execute('DELETE FROM episodes WHERE series_id = ?', (title_id, ))
+
+	def series_mtime(self, title_id:str) -> datetime|None:
+		row = self._conn.execute('SELECT updated FROM series_data WHERE id = ?', (title_id, )).fetchone()
+		return datetime.fromtimestamp(row[0]) if row else None
+
+	def episodes_airing(self, begin:str, end:str) -> list[tuple[str, dict]]:
+		"""Episodes (of any series) with an air date in [begin, end) (ISO dates), as (series ID, episode)."""
+		return [
+			(series_id, decode_json(ep))
+			for series_id, ep in self._conn.execute(
+				'SELECT series_id, data FROM episodes WHERE date >= ? AND date < ? ORDER BY series_id, position',
+				(begin, end)
+			)
+		]
+
+	def _load_db_meta(self) -> dict:
+		return {
+			key: decode_json(value)
+			for key, value in self._conn.execute('SELECT key, value FROM db_meta')
+		}
+
+	def _put_db_meta(self, meta:dict) -> None:
+		self._conn.execute('DELETE FROM db_meta')
+		self._conn.executemany('INSERT INTO db_meta (key, value) VALUES (?, ?)', [
+			(key, encode_json(value).decode())
+			for key, value in meta.items()
+		])
+
+	def _keep_previous(self, title_ids:list[str]) -> None:
+		# the rows about to be overwritten, as a new version for undo() (None: didn't exist)
+		version = (self._conn.execute('SELECT MAX(version) FROM undo').fetchone()[0] or 0) + 1
+
+		previous = self.load_meta([ title_id for title_id in title_ids if title_id != db.meta_key ])
+		if db.meta_key in title_ids:
+			previous[db.meta_key] = self._load_db_meta()
+
+		self._conn.executemany('INSERT INTO undo (version, id, meta) VALUES (?, ?, ?)', [
+			(version, title_id, encode_json(previous[title_id]).decode() if title_id in previous else None)
+			for title_id in set(title_ids)
+		])
+
+		self._conn.execute('DELETE FROM undo WHERE version <= ?', (version - self.undo_versions, ))
+
+	def _put_meta(self, title_id:str, meta:dict) -> None:
+		# seen marks and tags in their own tables
+		plain_meta = { key: value for key, value in meta.items() if key not in (db.meta_seen_key, db.meta_tags_key) }
+		# an upsert keeps the row's place in the order of series
+		self._conn.execute('''
+			INSERT INTO series (id, list_index, state, meta) VALUES (?, ?, ?, ?)
+			ON CONFLICT(id) DO UPDATE SET list_index = excluded.list_index, state = excluded.state, meta = excluded.meta
+		''', (
+			title_id, meta.get(db.meta_list_index_key), int(db.series_state(meta)), encode_json(plain_meta).decode()
+		))
+
+		self._conn.execute('DELETE FROM seen WHERE series_id = ?', (title_id, ))
+		self._conn.executemany('INSERT INTO seen (series_id, episode, stamp) VALUES (?, ?, ?)', [
+			(title_id, episode, stamp)
+			for episode, stamp in meta.get(db.meta_seen_key, {}).items()
+		])
+
+		self._conn.execute('DELETE FROM tags WHERE series_id = ?', (title_id, ))
+		self._conn.executemany('INSERT INTO tags (series_id, tag) VALUES (?, ?)', [
+			(title_id, tag)
+			for tag in meta.get(db.meta_tags_key, [])
+		])
+
+	def _delete_meta(self, title_id:str) -> None:
+		self._conn.execute('DELETE FROM series WHERE id = ?', (title_id, ))
+		self._conn.execute('DELETE FROM seen WHERE series_id = ?', (title_id, ))
+		self._conn.execute('DELETE FROM tags WHERE series_id = ?', (title_id, ))
+
+	@contextmanager
+	def _transaction(self):
+		if self._conn.in_transaction:
+			# part of the outer one
+			yield
+			return
+
+		self._conn.execute('BEGIN')
+		try:
+			yield
+		except BaseException:
+			self._conn.execute('ROLLBACK')
+			raise
+		self._conn.execute('COMMIT')
+
+
+class SeriesCache(db.SeriesCache):
+	"""The series data, in the SQLite store."""
+	def __init__(self, store:Store):
+		self._cache:dict = {}
+		self._store = store
+
+	def exists(self, title_id:str) -> bool:
+		return self._store.has_series(title_id)
+
+	def remove(self, title_id:str) -> bool:
+		self._cache.pop(title_id, None)
+		self._store.remove_series(title_id)
+		return True
+
+	def mtime(self, title_id:str) -> datetime|None:
+		return self._store.series_mtime(title_id)
+
+	def episodes_airing(self, title_ids:list[str], begin:str, end:str) -> list[tuple[str, dict]]:
+		order = { title_id: idx for idx, title_id in enumerate(title_ids) }
+		airing = [
+			(series_id, ep)
+			for series_id, ep in self._store.episodes_airing(begin, end)
+			if series_id in order
+		]
+		# stable: by position within the series
+		airing.sort(key=lambda item: order[item[0]])
+		return airing
+
+	def _load_series(self, title_id:str) -> dict|None:
+		return self._store.load_series(title_id)
+
+	def _save_series(self, title_id:str, data:dict) -> bool:
+		self._store.save_series(title_id, data)
+		return True
+
+
+def import_database(filepath:str, database:db.Database, series_cache:db.SeriesCache) -> None:
+	"""Create a SQLite store in 'filepath' from a (JSON) database and its series cache."""
+	tmp_name = filepath + '.tmp'
+	if os.path.exists(tmp_name):
+		os.remove(tmp_name)
+
+	t0 = time.time()
+
+	store = Store(tmp_name)
+	try:
+		with store._transaction():
+			store.save(database.data, undoable=False)
+			for title_id, _ in database.items():
+				data = series_cache.get(title_id)
+				if data:
+					store.save_series(title_id, data)
+	finally:
+		store.close()
+
+	os.rename(tmp_name, filepath)
+
+	ms = (time.time() - t0)*1000
+	debug('db: imported %d series into SQLite in %.1fms' % (len(database), ms))
@@ -506,7 +506,8 @@ def format_state_change(before:State, after:State) -> str:
 	return f'[{_prev_state}{before.name.lower()}{_0} ⯈ {format_state(after)}]'  # type: ignore  # todo: enum
 
 
-def menu_select(items:list[dict], width:int, item_print:Callable, force_selection:int|None=None) -> int|None:
+def menu_select(items:list[dict], width:int, item_print:Callable, force_selection:int|None=None, poll:Callable[[], bool]|None=None) -> int|None:
+	# 'poll' is called while waiting for input; if it returns True, 'items' changed and the menu is redrawn
 
 	# TODO: the printing of the "info box" should also be a callback, making this quite general :)
 
@@ -546,7 +547,12 @@ def menu_select(items:list[dict], width:int, item_print:Callable, force_selectio
 			num_lines += 1
 
 		print(f'{_box}┃{_0} {_o}Episodes:{_0} ', end='')
-		print('%d (%d season%s)' % (item['total_episodes'], item['total_seasons'], 's' if item['total_seasons'] != 1 else ''), end=f'{_K}\n\r')
+		if 'total_episodes' in item:
+			print('%d (%d season%s)' % (item['total_episodes'], item['total_seasons'], 's' if item['total_seasons'] != 1 else ''), end=f'{_K}\n\r')
+		elif 'error' in item:
+			print(f'{_f}{_i}failed to fetch details: %s{_0}' % item['error'][:max(0, width - 38)], end=f'{_K}\n\r')
+		else:
+			print(f'{_f}{_i}fetching...{_0}', end=f'{_K}\n\r')
 		num_lines += 1
 
 		print(f'{_box}┗%s{_0}' % ('━'*(width-1)), end=f'{_K}\n\r')
@@ -557,14 +563,15 @@ def menu_select(items:list[dict], width:int, item_print:Callable, force_selectio
 
 	selected_index:int|None = 0
 	last_info_lines = None
+	last_num_items = 0
 
 	def draw_menu():
 		clrline()
 
-		nonlocal last_info_lines
+		nonlocal last_info_lines, last_num_items
 		if last_info_lines is not None:
 			# move up to beginning of menu
-			move_up = len(items) + last_info_lines
+			move_up = last_num_items + last_info_lines
 			print('\x1b[%dA\x1b[J' % move_up, end='')
 
 		print_items(selected_index)
@@ -572,6 +579,7 @@ def menu_select(items:list[dict], width:int, item_print:Callable, force_selectio
 		info_lines = print_info(items[selected_index])
 
 		last_info_lines = info_lines
+		last_num_items = len(items)
 
 		# print "status bar" at the  bottom
 		print(' \x1b[48;2;50;50;70m ', end='')
@@ -608,8 +616,10 @@ def menu_select(items:list[dict], width:int, item_print:Callable, force_selectio
 
 		while True:
 			# wait for input on the file descriptor
-			events = epoll.poll(1)
+			events = epoll.poll(0.1 if poll else 1)
 			if not events:
+				if poll and poll():
+					draw_menu()
 				continue
 
 			# check how much is available to read
@@ -1,18 +1,20 @@
 #! /usr/bin/env python3
 
 import re
+import os
 import sys
 import shlex
 import time
 import atexit
 import string
+import itertools
 from datetime import datetime, date, timedelta
-from os.path import basename
+from os.path import basename, join as pjoin
 from calendar import Calendar, day_name, month_name, MONDAY, SUNDAY
 import textwrap
 
 from typing import Callable, Any, Pattern
-from . import tmdb, progress, config, utils, db
+from . import tmdb, progress, config, utils, db, response_cache, transport, metrics
 m_db = db
 from .db import Database
 from .context import Context, BadUsageError
@@ -43,7 +45,6 @@ from .utils import \
 	now_stamp
 from .db import \
     State, \
-	set_dirty, \
 	meta_set, \
 	meta_del, \
 	meta_seen_key, \
@@ -51,6 +52,7 @@ from .db import \
 	meta_archived_key, \
 	meta_added_key, \
 	meta_total_episodes_key, \
+	meta_total_seasons_key, \
 	meta_next_episode_key, \
 	meta_last_episode_key, \
 	meta_active_status_key, \
@@ -83,6 +85,26 @@ def start():
 	if isinstance(api_key, str):
 		tmdb.set_api_key(api_key)
 
+	_setup_transport()
+
+	tmdb.set_parallel(config.get_int('lookup/parallel', config.default_parallel_requests))
+	tmdb.set_rate_limit(config.get_int('lookup/rate-limit', config.default_rate_limit))
+	tmdb.set_retries(config.get_int('lookup/retries', config.default_retries))
+	# total time budget for (retrying) requests of this command
+	tmdb.set_deadline(config.get_int('lookup/deadline', config.default_deadline) or None)
+	tmdb.set_append_to_response(config.get_bool('lookup/append-to-response', True))
+	tmdb.set_hedging(config.get_int('lookup/hedge-budget', 0)/100)
+
+	if config.get_bool('lookup/cache/enabled', True):
+		tmdb.set_cache(response_cache.ResponseCache(
+			pjoin(str(config.get('paths/series-cache')), 'tmdb'),
+			max_size=config.get_int('lookup/cache/max-size')*1024*1024,
+			ttl={
+				endpoint: int(float(config.get('lookup/cache/ttl/%s' % endpoint, 0))*3600)  # type: ignore  # value is a number
+				for endpoint in response_cache.ENDPOINTS
+			},
+		))
+
 	# we set these functions to avoid import cycle
 	ctx = Context(eat_option, resolve_cmd)
 
@@ -94,6 +116,8 @@ def start():
 
 	ctx.configure_handler(known_commands)
 
+	atexit.register(_save_net_stats, ctx.command)
+
 	width, height = term_size()
 
 	err = ctx.invoke(width=width)
@@ -102,6 +126,30 @@ def start():
 		sys.exit(1)
 
 
+def _setup_transport() -> None:
+	# offline use of the TMDb client, e.g. for reproducible benchmarks; see module 'transport'
+	api_root = os.getenv(config.env_tmdb_api_root)
+	record_path = os.getenv(config.env_tmdb_record)
+	replay_path = os.getenv(config.env_tmdb_replay)
+
+	if api_root:
+		tmdb.set_api_root(api_root)
+
+	if record_path:
+		tmdb.set_transport(transport.Recorder(record_path))
+
+	elif replay_path:
+		latency = float(os.getenv(config.env_tmdb_latency) or 0)
+		if replay_path == 'synthetic':
+			tmdb.set_transport(transport.SyntheticAPI(latency=latency))
+		else:
+			tmdb.set_transport(transport.Replayer(replay_path, latency=latency))
+
+	# no key is needed for these
+	if (replay_path or api_root) and not tmdb.ok():
+		tmdb.set_api_key('offline')
+
+
 ###############################################################################
 
 
@@ -489,6 +537,8 @@ def cmd_show(ctx:Context, width:int) -> Error|None:
 	num_shown = 0
 	num_archived = 0
 
+	ctx.db.prefetch([ series_id for _, series_id in series_list ])
+
 	for index, series_id in series_list:
 		meta = ctx.db[series_id]
 		is_archived = meta_archived_key in meta
@@ -591,24 +641,11 @@ def cmd_calendar(ctx:Context, width:int) -> Error|None:
 	# collect episodes over num_weeks*7
 	#   using margin of one extra week, because it's simpler
 	end_date = start_date + timedelta(days=(num_weeks + 1)*7)
-	for series_id, meta in ctx.db.items():
-
-		if meta_archived_key in meta:
-			continue
-
-		series = ctx.db.series(series_id)
-
-		# faster to loop backwards?
-		for ep in series.get('episodes', []):
-			ep_date_str = ep.get('date')
-			if not ep_date_str:
-				continue
-
-			ep_date = date.fromisoformat(ep_date_str)
-			if ep_date >= begin_date and ep_date < end_date:
-				if ep_date not in episodes_by_date:
-					episodes_by_date[ep_date] = []
-				episodes_by_date[ep_date].append( (series, ep) )
+	for series_id, ep in ctx.db.episodes_airing(begin_date, end_date):
+		ep_date = date.fromisoformat(ep['date'])
+		if ep_date not in episodes_by_date:
+			episodes_by_date[ep_date] = []
+		episodes_by_date[ep_date].append( (ctx.db[series_id], ep) )
 
 	wday_idx = -1
 	days_todo = num_weeks*7
@@ -711,19 +748,20 @@ def cmd_add(ctx:Context, width:int, add:bool=True) -> Error|None:
 		print(f' ({year})', end='')
 	print(f' ... (max {max_hits} hits){_00}', end='', flush=True)
 
-	hits:list[dict] = []
-	page = 1
-
-	while len(hits) < max_hits:
-		page_hits, total = tmdb.search(search, year=year, page=page)
-		hits.extend(page_hits)
-		if not page_hits or total == len(hits):
-			break
-
-		page += 1
+	# the pages are fetched in parallel, then each hit's details; the menu is shown once
+	# all pages arrived (i.e. we know which series we already have), the details are filled in later
+	results = tmdb.SearchHits(search, year=year, max_hits=max_hits)
+	while not results.pages_done and not results.done:
+		results.poll(timeout=None)
+	hits = results.hits
 
 	clrline()
 
+	if results.error:
+		if not hits:
+			return Error('Search failed: %s' % results.error)
+		print(f'{warning_prefix(ctx.command)} some search results missing: %s' % results.error)
+
 	if not hits:
 		return Error('Nothing found. Try generalizing your search.')
 
@@ -747,27 +785,25 @@ def cmd_add(ctx:Context, width:int, add:bool=True) -> Error|None:
 			print('  ', end='')
 			print_series_title(None, ctx.db[new_series['id']], imdb_id=imdb_id, tail=arch_tail, width=width - 2)
 
+	def menu_hits() -> list[dict]:
 		if add:
 			# exclude ones we already have in our config
-			hits = list(filter(lambda H: H['id'] not in ctx.db, hits))
+			return list(filter(lambda H: H['id'] not in ctx.db, results.hits))
+		return list(results.hits)
 
-		if add and not hits:
-			return Error('No new series found. Try generalizing your search.')
+	hits = menu_hits()
 
-	if len(hits) > max_hits:
-		hits = hits[: max_hits]
+	if add and not hits:
+		return Error('No new series found. Try generalizing your search.')
 
 	print(f'{_b}\x1b[48;2;50;70;50mSearch "%s"; found {_0}{_B}%d{_0} {_b}series:{_0}{_K}{_00}' % (search, len(hits)))
 
-	print(f'{_f}Enriching search hits...{_00}', end='', flush=True)
-	hit_details = tmdb.details(hit['id'] for hit in hits)
-	if not hit_details:
-		return Error('Failed to get title details for all hits (%s)' % ', '.join(hit['id'] for hit in hits))
-
-	clrline()
-
-	for idx, hit in enumerate(hits):
-		hit.update(hit_details[idx])
+	def poll_hits() -> bool:
+		if not results.poll():
+			return False
+		# the list is shared with the menu
+		hits[:] = menu_hits()
+		return True
 
 	# print a menu and a prompt to select from it
 
@@ -786,7 +822,7 @@ def cmd_add(ctx:Context, width:int, add:bool=True) -> Error|None:
 		print_series_title(idx + 1, item, imdb_id=imdb_id, width=width - 1, tail=tail)
 		print(f'{_0B}{_K}', end='')
 
-	selected_index = menu_select(hits, width, print_menu_entry, force_selection=-1 if not add else None)
+	selected_index = menu_select(hits, width, print_menu_entry, force_selection=-1 if not add else None, poll=poll_hits)
 	if selected_index == -1:
 		return None
 
@@ -822,7 +858,8 @@ def cmd_add(ctx:Context, width:int, add:bool=True) -> Error|None:
 
 	changelog_add(ctx.db, 'Added series', series_id)
 
-	modified = refresh_series(ctx.db, width, subset=[series_id], force=True)
+	with tmdb.priority(tmdb.Priority.INTERACTIVE):
+		modified = refresh_series(ctx.db, width, subset=[series_id], force=True)
 	if max(modified) > 0:
 		ctx.save()
 
@@ -948,7 +985,8 @@ def cmd_mark(ctx:Context, width:int, marking:bool=True) -> Error|None:
 		return Error(err)
 
 	# we've come upon a series that is stale, do a refresh
-	modified = refresh_series(ctx.db, width, subset=[series_id])
+	with tmdb.priority(tmdb.Priority.INTERACTIVE):
+		modified = refresh_series(ctx.db, width, subset=[series_id])
 	if max(modified) > 0:
 		ctx.save()
 
@@ -1113,7 +1151,6 @@ def cmd_mark(ctx:Context, width:int, marking:bool=True) -> Error|None:
 	meta[meta_seen_key] = seen_state
 
 	ctx.db.recalc_meta(series_id)
-	set_dirty()
 
 	if marking:
 		print('Marked ', end='')
@@ -1256,6 +1293,7 @@ def _do_archive(db:db.Database, series_id:str, width:int, mode:str|None=None, pr
 			print(' (abandoned)', end='')
 		print(f':{_00}')
 		meta_set(meta, meta_archived_key, now_stamp())
+		db.set_modified(series_id)
 		db.remove_series(series_id)
 		changelog_add(db, 'Archived series', series_id)
 
@@ -1265,6 +1303,7 @@ def _do_archive(db:db.Database, series_id:str, width:int, mode:str|None=None, pr
 			print(' (resumed)', end='')
 		print(f':{_00}')
 		meta_del(meta, meta_archived_key)
+		db.set_modified(series_id)
 		changelog_add(db, 'Restored series', series_id)
 		refresh_series(db, width, subset=[series_id], force=True)
 
@@ -1312,7 +1351,9 @@ def cmd_refresh(ctx:Context, width:int) -> Error|None:
 
 	t0 = time.time()
 
-	num_series, num_episodes = refresh_series(ctx.db, width, subset=id_list, force=forced)
+	# bulk work; leave headroom for anything more urgent
+	with tmdb.priority(tmdb.Priority.BACKGROUND if refresh_all else tmdb.Priority.NORMAL):
+		num_series, num_episodes = refresh_series(ctx.db, width, subset=id_list, force=forced)
 	# can be 1 even if num_episodes is zero
 	if num_series > 0:
 		if num_episodes > 0:
@@ -1398,6 +1439,114 @@ setattr(cmd_config, 'load_db', False)
 setattr(cmd_config, 'help', _config_help)
 
 
+def cmd_cache(ctx:Context, width:int) -> Error|None:
+	cache = tmdb.cache()
+	if cache is None:
+		return Error('Response cache is disabled (lookup/cache/enabled).')
+
+	sub_cmd = ctx.command_arguments.pop(0) if ctx.command_arguments else 'info'
+
+	def format_size(size:int) -> str:
+		if size >= 1024*1024:
+			return '%.1f MiB' % (size/1024/1024)
+		return '%.1f KiB' % (size/1024)
+
+	if sub_cmd == 'info':
+		info = cache.info()
+		print(f'{_b}TMDb response cache:{_0} %s' % cache.path)
+		for endpoint, stats in info.items():
+			ttl = cache.ttl(endpoint)/3600
+			print(f'  {_o}%-8s{_0} %6d entries  %10s  {_f}%5d expired  (TTL: %gh){_0}' % (endpoint, stats['entries'], format_size(stats['size']), stats['expired'], ttl))
+
+		total_size = sum(stats['size'] for stats in info.values())
+		total_entries = sum(stats['entries'] for stats in info.values())
+		print(f'  {_b}%-8s{_0} %6d entries  %10s  {_f}(max: %s){_0}' % ('total', total_entries, format_size(total_size), format_size(cache.max_size)))
+
+	elif sub_cmd == 'purge':
+		endpoints = ctx.command_arguments or None
+		if endpoints:
+			for endpoint in endpoints:
+				if endpoint not in response_cache.ENDPOINTS:
+					return Error('Unknown endpoint: %s (one of: %s)' % (endpoint, ', '.join(response_cache.ENDPOINTS)))
+
+		expired_only = ctx.has_option('expired')
+		removed = cache.purge(endpoints, expired_only=expired_only)
+		print('Removed %d %scache entr%s.' % (removed, 'expired ' if expired_only else '', 'y' if removed == 1 else 'ies'))
+
+	else:
+		return Error('Unknown sub command: %s' % sub_cmd)
+
+	return None
+
+def _cache_help() -> None:
+	print_cmd_usage('cache', [
+		'[info]',
+		'purge [<endpoint> ...]',
+	])
+	print(f'    {_o}<endpoint>   {_0} One of: %s' % ', '.join(response_cache.ENDPOINTS))
+
+setattr(cmd_cache, 'load_db', False)
+setattr(cmd_cache, 'help', _cache_help)
+
+
+def cmd_stats(ctx:Context, width:int) -> Error|None:
+	sub_cmd = ctx.command_arguments.pop(0) if ctx.command_arguments else 'net'
+	if sub_cmd != 'net':
+		return Error('Unknown sub command: %s' % sub_cmd)
+
+	filepath = _net_stats_path()
+
+	if ctx.has_option('reset'):
+		try:
+			os.remove(filepath)
+		except FileNotFoundError:
+			pass
+		print('Network metrics reset.')
+		return None
+
+	stored = metrics.load(filepath)
+	if not stored:
+		print('No network metrics recorded yet.')
+		return None
+
+	def print_metrics(title:str, endpoints:dict) -> None:
+		lines = metrics.Metrics(endpoints).report()
+		print(f'{_b}%s{_0}' % title)
+		print(f'  {_f}%s{_0}' % lines[0])
+		for line in lines[1:]:
+			print('  %s' % line)
+
+	last = stored.get('last') or {}
+	print_metrics('Last command (%s):' % (last.get('command') or '?'), last.get('endpoints') or {})
+	print_metrics('Since %s:' % stored.get('since', '?').replace('T', ' '), stored.get('total') or {})
+
+	return None
+
+def _stats_help() -> None:
+	print_cmd_usage('stats', 'net')
+	print(f'    {_o}net   {_0} Per endpoint: requests, total time, latency percentiles, bytes received, cache hits, retries and failures')
+
+setattr(cmd_stats, 'load_db', False)
+setattr(cmd_stats, 'help', _stats_help)
+
+
+def _net_stats_path() -> str:
+	return pjoin(str(config.get('paths/series-cache')), 'net-stats.json')
+
+def _save_net_stats(command:str|None) -> None:
+	stats = tmdb.net_stats()
+	if not stats:
+		return
+
+	for line in stats.report():
+		debug('net: %s' % line)
+
+	try:
+		metrics.save(_net_stats_path(), stats, command)
+	except OSError as e:
+		debug('failed saving network metrics: %s' % e)
+
+
 def cmd_undo(ctx:Context, *args, **kw) -> Error|None:
 	remaining, message, changes = db.rollback()
 	if remaining is None and message:
@@ -1409,8 +1558,8 @@ def cmd_undo(ctx:Context, *args, **kw) -> Error|None:
 		print('These changes were reverted:')
 		for message, series_id in changes:
 			print(f'  - {_i}{_o}{message}', end='')
-			if series_id:
-				series = ctx.db[series_id]
+			series = ctx.db.get(series_id) if series_id else None
+			if series:
 				print(f'{_0}; {format_title(series)}')
 			else:
 				print(_0)
@@ -1458,10 +1607,12 @@ def cmd_tag(ctx:Context, *args, width:int, mode='tag', **kw) -> Error|None:
 				modified.append(series_id)
 				all_tags.append(tag_name)
 				meta_set(meta, meta_tags_key, all_tags)
+				ctx.db.set_modified(series_id)
 		elif tag_name in all_tags:
 			modified.append(series_id)
 			del all_tags[all_tags.index(tag_name)]
 			meta_set(meta, meta_tags_key, all_tags)
+			ctx.db.set_modified(series_id)
 
 	print(format_tag(tag), 'Series %sged:' % mode, len(modified))
 
@@ -1545,6 +1696,7 @@ def cmd_tags(ctx:Context, *args, width:int|None=None, **kw) -> Error|None:
 			all_tags = meta.get(meta_tags_key)
 			del all_tags[all_tags.index(name)]
 			meta_set(meta, meta_tags_key, all_tags)
+			ctx.db.set_modified(series_id)
 
 		config.remove(f'tags/{name}')
 
@@ -1627,6 +1779,7 @@ def cmd_rate(ctx:Context, *args, **kw) -> Error|None:
 		rating = int(rating_str)
 
 		meta_set(meta, meta_rating_key, rating)
+		ctx.db.set_modified(series_id)
 		changelog_add(ctx.db, 'Rated series', series_id)
 
 	except ValueError as ve:
@@ -1638,6 +1791,7 @@ def cmd_rate(ctx:Context, *args, **kw) -> Error|None:
 	comment = ctx.option('comment')
 	if comment:
 		meta_set(meta, meta_rating_comment_key, comment)
+		ctx.db.set_modified(series_id)
 		print(f'{_b}Comment:{_0} {comment}')
 	else:
 		comment = meta.get(meta_rating_comment_key)
@@ -1748,6 +1902,16 @@ known_commands:dict[str,dict[str,tuple|Callable|str]] = {
 		'handler': cmd_config,
 		'help': 'Configure aspects of %s, e.g. defaults.' % PRG,
 	},
+	'cache': {
+	    'alias': (),
+		'handler': cmd_cache,
+		'help': 'Inspect or purge the TMDb response cache.',
+	},
+	'stats': {
+	    'alias': (),
+		'handler': cmd_stats,
+		'help': 'Show network metrics of TMDb requests.',
+	},
 	'undo': {
 	    'alias': (),
 		'handler': cmd_undo,
@@ -1900,6 +2064,12 @@ command_options = {
 	'search': {
 	    **__opt_max_hits,
 	},
+	'cache': {
+	    'expired':           { 'name': '--expired',             'help': 'Purge only expired entries' },
+	},
+	'stats': {
+	    'reset':             { 'name': '--reset',               'help': 'Clear the recorded metrics' },
+	},
 	'config': {
 	    'command-args':      { 'name': '--args', 'arg': str,    'help': 'Set default arguments for <command>' },
 		'default-command':   { 'name': '--default', 'arg': str, 'validator': _valid_cmd, 'help': 'Set command to run by default' },
@@ -2088,10 +2258,27 @@ def last_update(meta:dict) -> datetime|None:
 	return None
 
 
+def _changed_season_numbers(changes:list[dict]) -> set[int]|None:
+	# numbers of the seasons of 'season' change items; None if any other change is included
+	season_numbers = set()
+	for chg in changes:
+		if chg.get('key') != 'season':
+			return None
+		for item in chg.get('items', []):
+			value = item.get('value') or item.get('original_value') or {}
+			if not isinstance(value, dict) or not isinstance(value.get('season_number'), int):
+				return None
+			season_numbers.add(value['season_number'])
+
+	return season_numbers
+
+
 def refresh_series(db:Database, width:int, subset:list|None=None, force:bool=False, affected:dict|None=None) -> tuple[int, int]:
 	if not config.get_bool('refresh-enabled', True):
 		return 0, 0
 
+	# the whole library (not e.g. just a series that was marked)
+	all_series = subset is None
 	if subset is None:
 		subset = list(
 		    series_id
@@ -2132,12 +2319,15 @@ def refresh_series(db:Database, width:int, subset:list|None=None, force:bool=Fal
 	for series_id in to_refresh:
 		meta = db[series_id]
 		meta[meta_update_check_key] = now_stamp()
+		db.set_modified(series_id)
 		touched += 1
 
 	def mk_prog(total):
 		return progress.new(total, width=width - 2, bg_color=rgb('#404040'), bar_color=rgb('#686868'), text_color=rgb('#cccccc'))
 
 	latest_update_time:datetime|None = None
+	# series ID -> numbers of the changed seasons (only those need to be fetched)
+	changed_seasons:dict[str, set[int]] = {}
 
 	if not force:
 		# check with TMDb if there actually are any updates
@@ -2156,11 +2346,23 @@ def refresh_series(db:Database, width:int, subset:list|None=None, force:bool=Fal
 
 		debug('changes since:', oldest_refresh)
 
-		changes = tmdb.changes(to_refresh, oldest_refresh, include=include_changes, progress=show_ch_progress)
+		# if possible, first narrow down using the global list of changed series,
+		# i.e. if it's fewer requests than checking each series
+		changed = None
+		if all_series and len(to_refresh) > 1:
+			changed = tmdb.changed_series(oldest_refresh, max_pages=len(to_refresh) - 1)
+		if changed is not None:
+			candidates = [series_id for series_id in to_refresh if series_id in changed]
+			debug('changed series: %d of %d' % (len(candidates), len(to_refresh)))
+		else:
+			candidates = to_refresh
+
+		series_changes = dict.fromkeys(to_refresh, [])
+		series_changes.update(zip(candidates, tmdb.changes(candidates, oldest_refresh, include=include_changes, progress=show_ch_progress)))
 
 		clrline()
 
-		for series_id, changes in zip(list(to_refresh), changes):
+		for series_id, changes in series_changes.items():
 			meta = db[series_id]
 
 			debug(series_id, meta['title'], 'changes:')
@@ -2180,6 +2382,10 @@ def refresh_series(db:Database, width:int, subset:list|None=None, force:bool=Fal
 						debug('no changes, but update too old: %s [%s]  %s (%s days ago)' % (meta['title'], meta.get(meta_list_index_key), last_update_time.isoformat(' '), update_age.days))
 
 			else:
+				season_numbers = _changed_season_numbers(changes)
+				if season_numbers and db.has_data(series_id):
+					changed_seasons[series_id] = season_numbers
+
 				for chg in changes:
 					items = chg.get('items', [])
 					for item in items:
@@ -2222,25 +2428,61 @@ def refresh_series(db:Database, width:int, subset:list|None=None, force:bool=Fal
 	print(f'%s{_EOL}' % prog_bar('Refreshing %d series...' % len(to_refresh)), end='', flush=True)
 	# TODO: show 'spinner'
 
-	def show_progress(completed:int, *_) -> None:
+	full_refresh = [series_id for series_id in to_refresh if series_id not in changed_seasons]
+	partial_refresh = {
+		series_id: sorted(changed_seasons[series_id])
+		for series_id in to_refresh
+		if series_id in changed_seasons
+	}
+	debug('refresh: %d full, %d only changed seasons' % (len(full_refresh), len(partial_refresh)))
+
+	num_completed = 0
+	def show_progress(*_) -> None:
+		nonlocal num_completed
+		num_completed += 1
 		clrline()
-		print(f'%s{_EOL}' % prog_bar(completed, text='Refreshing...'), end='', flush=True)
+		print(f'%s{_EOL}' % prog_bar(num_completed, text='Refreshing...'), end='', flush=True)
 
 	# fetch updates to all eligible series and their episodes
-	result = tmdb.episodes(to_refresh, with_details=True, progress=show_progress)
-
-	clrline()
+	# (bypassing the response cache; we already know there are changes)
+	# results are processed (and written) as they arrive, while the rest is still being fetched
+	# the stored season counts let the seasons be fetched along with the details
+	season_hint = {
+		series_id: db[series_id][meta_total_seasons_key]
+		for series_id in full_refresh
+		if db[series_id].get(meta_total_seasons_key)
+	}
+	result = itertools.chain(
+		tmdb.episodes(full_refresh, with_details=True, progress=show_progress, max_age=0, stream=True, season_hint=season_hint),
+		tmdb.seasons(partial_refresh, progress=show_progress, max_age=0, stream=True),
+	)
 
 	num_episodes = 0
+	num_failed = 0
+
+	for series_id, series_data in result:
+		if series_data is not None and series_id in partial_refresh:
+			# merge the changed seasons into the stored episodes
+			series_data = db.merge_seasons(series_id, *series_data)
+		elif series_data is not None:
+			series, episodes = series_data
+			series['episodes'] = episodes
+			# replace entry in DB
+			db.set_series(series_id, series)
+			series_data = series
+
+		if series_data is None:
+			# keep what we have; try again next time
+			debug('refresh failed: %s [%s]' % (db[series_id]['title'], db[series_id].get(meta_list_index_key)))
+			db[series_id].pop(meta_update_check_key, None)
+			to_refresh.remove(series_id)
+			num_failed += 1
+			continue
 
-	for series_id, (series, episodes) in zip(to_refresh, result):
+		episodes = series_data['episodes']
 
 		changelog_add(db, 'Refreshed', series_id)
 
-		series['episodes'] = episodes
-		# replace entry in DB
-		db.set_series(series_id, series)
-
 		# update meta
 		meta = db[series_id]
 		# keep a list of last N updates
@@ -2258,8 +2500,12 @@ def refresh_series(db:Database, width:int, subset:list|None=None, force:bool=Fal
 
 		num_episodes += len(episodes)
 
-		set_dirty()
+		db.set_modified(series_id)
+
+	clrline()
 
+	if num_failed:
+		print(f'{warning_prefix()} Failed refreshing %d series; will try again next time.' % num_failed, file=sys.stderr)
 
 	return len(to_refresh), num_episodes
 
@@ -2472,6 +2718,10 @@ def print_env_help() -> None:
 	print('Some defaults may be overriden by environment variables:')
 	print(f'  {_b}{config.env_config_path:20}{_0} Path to configuration file')
 	print(f'  {_b}{config.env_series_db_path:20}{_0} Path to series database file')
+	print(f'  {_b}{config.env_tmdb_api_root:20}{_0} TMDb API root URL, e.g. of a local stand-in server')
+	print(f'  {_b}{config.env_tmdb_record:20}{_0} Record TMDb responses into this directory')
+	print(f'  {_b}{config.env_tmdb_replay:20}{_0} Replay TMDb responses recorded in this directory (or "synthetic")')
+	print(f'  {_b}{config.env_tmdb_latency:20}{_0} Artificial latency of replayed responses (seconds)')
 
 
 def print_cmd_help(command:str, exit_code:int=0) -> None:
@@ -0,0 +1,163 @@
+"""
+Network metrics of the TMDb client, per endpoint class (e.g. 'season'; see tmdb._endpoint_class()):
+number of requests, latency percentiles, bytes received, cache hits, retries, failures
+and hedged requests (see tmdb.set_hedging()).
+"""
+import os
+import io
+import threading
+from tempfile import mkstemp
+from datetime import datetime
+from typing import Any
+
+from .utils import decode_json, encode_json
+
+COUNTERS = ('requests', 'bytes', 'cache_hits', 'revalidated', 'retries', 'failures', 'hedged', 'hedge_won')
+
+# the most recent latencies kept per endpoint (for the percentiles)
+_MAX_SAMPLES = 2000
+
+
+class Metrics:
+	def __init__(self, endpoints:dict[str, dict]|None=None):
+		self._lock = threading.Lock()
+		self._endpoints:dict[str, dict] = {}
+		if endpoints:
+			self.merge(endpoints)
+
+	def request(self, endpoint:str, latency:float|None, size:int=0) -> None:
+		"""A request was performed; 'latency' (seconds) is None if it failed without a response."""
+		with self._lock:
+			entry = self._entry(endpoint)
+			entry['requests'] += 1
+			entry['bytes'] += size
+			if latency is not None:
+				entry['time'] += latency
+				self._add_samples(entry, [latency])
+
+	def count(self, endpoint:str, counter:str, num:int=1) -> None:
+		with self._lock:
+			self._entry(endpoint)[counter] += num
+
+	def latency(self, endpoint:str, pct:float, min_samples:int=1) -> float|None:
+		"""The 'pct' percentile of the endpoint's latency; None if there are fewer than 'min_samples'."""
+		with self._lock:
+			entry = self._endpoints.get(endpoint)
+			if entry is None or len(entry['latencies']) < min_samples:
+				return None
+			return percentile(entry['latencies'], pct)
+
+	def merge(self, endpoints:dict[str, dict]) -> None:
+		"""Add the metrics of 'endpoints' (see to_dict())."""
+		with self._lock:
+			for endpoint, other in endpoints.items():
+				entry = self._entry(endpoint)
+				for counter in COUNTERS + ('time', ):
+					entry[counter] += other.get(counter, 0)
+				self._add_samples(entry, other.get('latencies', []))
+
+	def reset(self) -> None:
+		with self._lock:
+			self._endpoints.clear()
+
+	def __bool__(self) -> bool:
+		return bool(self._endpoints)
+
+	def to_dict(self) -> dict[str, dict]:
+		with self._lock:
+			return {
+				endpoint: { **entry, 'latencies': list(entry['latencies']) }
+				for endpoint, entry in self._endpoints.items()
+			}
+
+	def summary(self) -> dict[str, dict[str, Any]]:
+		"""Counters, total time and latency percentiles (seconds) per endpoint."""
+		with self._lock:
+			return {
+				endpoint: {
+					**{ counter: entry[counter] for counter in COUNTERS },
+					'time': entry['time'],
+					'p50': percentile(entry['latencies'], 50),
+					'p95': percentile(entry['latencies'], 95),
+					'p99': percentile(entry['latencies'], 99),
+				}
+				for endpoint, entry in sorted(self._endpoints.items())
+			}
+
+	def report(self) -> list[str]:
+		"""A plain text table of the summary."""
+		lines = ['%-8s %6s %8s %8s %8s %8s %10s %6s %6s %6s %6s %6s %6s' % (
+			'endpoint', 'reqs', 'time s', 'p50 ms', 'p95 ms', 'p99 ms', 'bytes', 'hits', '304', 'retry', 'fail', 'hedge', 'won'
+		)]
+		for endpoint, stats in self.summary().items():
+			lines.append('%-8s %6d %8.1f %8s %8s %8s %10d %6d %6d %6d %6d %6d %6d' % (
+				endpoint, stats['requests'], stats['time'],
+				_ms(stats['p50']), _ms(stats['p95']), _ms(stats['p99']),
+				stats['bytes'], stats['cache_hits'], stats['revalidated'], stats['retries'], stats['failures'],
+				stats['hedged'], stats['hedge_won'],
+			))
+		return lines
+
+	def _entry(self, endpoint:str) -> dict:
+		entry = self._endpoints.get(endpoint)
+		if entry is None:
+			entry = self._endpoints[endpoint] = { **dict.fromkeys(COUNTERS, 0), 'time': 0.0, 'latencies': [] }
+		return entry
+
+	def _add_samples(self, entry:dict, samples:list[float]) -> None:
+		latencies = entry['latencies']
+		latencies.extend(samples)
+		if len(latencies) > _MAX_SAMPLES:
+			del latencies[:len(latencies) - _MAX_SAMPLES]
+
+
+def percentile(samples:list[float], pct:float) -> float|None:
+	# nearest-rank
+	if not samples:
+		return None
+	ordered = sorted(samples)
+	rank = max(1, -(-len(ordered)*pct//100))
+	return ordered[int(rank) - 1]
+
+def _ms(seconds:float|None) -> str:
+	return '-' if seconds is None else '%.0f' % (seconds*1000)
+
+
+def load(filepath:str) -> dict:
+	"""
+	Persisted metrics: 'total' (since 'since') and of the 'last' command
+	(each as returned by Metrics.to_dict()). Empty if there are none.
+	"""
+	try:
+		with io.open(filepath, 'rb') as fp:
+			return decode_json(fp.read())
+	except (FileNotFoundError, ValueError):
+		return {}
+
+def save(filepath:str, metrics:Metrics, command:str|None=None) -> None:
+	"""Add 'metrics' (of a 'command') to those persisted in 'filepath'."""
+	stored = load(filepath)
+
+	total = Metrics(stored.get('total'))
+	total.merge(metrics.to_dict())
+
+	now = datetime.now().isoformat(timespec='seconds')
+	stored = {
+		'since': stored.get('since', now),
+		'updated': now,
+		'total': total.to_dict(),
+		'last': {
+			'command': command,
+			'endpoints': metrics.to_dict(),
+		},
+	}
+
+	os.makedirs(os.path.dirname(filepath), exist_ok=True)
+	tmp_name = mkstemp(dir=os.path.dirname(filepath))[1]
+	try:
+		with io.open(tmp_name, 'wb') as fp:
+			fp.write(encode_json(stored))
+		os.rename(tmp_name, filepath)
+	except OSError:
+		os.remove(tmp_name)
+		raise
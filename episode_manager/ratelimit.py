@@ -0,0 +1,162 @@
+import time
+import threading
+from collections import deque
+from typing import Callable
+
+from .config import debug
+
+
+class TokenBucket:
+	"""
+	Limits the request rate to 'rate' per second, allowing bursts of up to 'burst' requests.
+	The bucket can also be paused, e.g. when the server asks us to retry later.
+	"""
+	def __init__(self, rate:float, burst:int, clock:Callable[[], float]=time.monotonic, sleep:Callable[[float], None]=time.sleep):
+		self._rate = max(0.1, rate)
+		self._burst = max(1, burst)
+		self._tokens = float(self._burst)
+		self._clock = clock
+		self._sleep = sleep
+		self._updated = clock()
+		self._paused_until = 0.0
+		self._lock = threading.Lock()
+
+	def set_rate(self, rate:float, burst:int|None=None) -> None:
+		with self._lock:
+			self._refill()
+			self._rate = max(0.1, rate)
+			if burst is not None:
+				self._burst = max(1, burst)
+			self._tokens = min(self._tokens, self._burst)
+
+	def acquire(self) -> None:
+		"""Take a token, waiting until one is available."""
+		delay = self.reserve()
+		if delay > 0:
+			self._sleep(delay)
+
+	def reserve(self) -> float:
+		"""Take a token without waiting; returns the number of seconds until it may be used."""
+		with self._lock:
+			self._refill()
+			# a negative balance is the queue of waiting requests
+			self._tokens -= 1
+			# when paused, tokens accumulate from the end of the pause
+			delay = max(0.0, self._updated - self._clock())
+			if self._tokens < 0:
+				delay += -self._tokens/self._rate
+			return delay
+
+	def try_acquire(self) -> bool:
+		"""Take a token only if one is available right now."""
+		with self._lock:
+			self._refill()
+			if self._tokens < 1 or self._updated > self._clock():
+				return False
+			self._tokens -= 1
+			return True
+
+	def pause(self, seconds:float) -> None:
+		"""Hand out no tokens for 'seconds' (from now)."""
+		with self._lock:
+			until = self._clock() + seconds
+			if until > self._paused_until:
+				self._paused_until = until
+				# don't let everyone rush in when the pause is over
+				self._refill()
+				self._tokens = min(self._tokens, 0)
+				self._updated = until
+
+	def _refill(self) -> None:
+		now = self._clock()
+		if now > self._updated:
+			self._tokens = min(self._burst, self._tokens + (now - self._updated)*self._rate)
+			self._updated = now
+
+
+# latencies per endpoint; the lowest of them is its healthy latency
+_BASELINE_SAMPLES = 32
+
+class AdaptiveLimiter:
+	"""
+	Concurrency limit using additive increase / multiplicative decrease (AIMD).
+
+	While the latency of requests stays healthy (close to the lowest of the endpoint's
+	recent ones), the limit grows by about one for each window of 'limit' requests. When the server
+	signals overload (e.g. 429 or timeouts), the limit is halved (at most once per
+	window, so a burst of failures doesn't collapse it to the minimum).
+	"""
+	def __init__(self, maximum:int, minimum:int=1, initial:int|None=None, clock:Callable[[], float]=time.monotonic):
+		self._max = max(1, maximum)
+		self._min = max(1, min(minimum, self._max))
+		self._limit = float(initial if initial is not None else max(self._min, self._max//2))
+		self._in_use = 0
+		self._latencies:dict[str, deque[float]] = {}
+		self._last_decrease = 0.0
+		self._clock = clock
+		self._cond = threading.Condition()
+
+	@property
+	def limit(self) -> int:
+		return int(self._limit)
+
+	def set_maximum(self, maximum:int) -> None:
+		with self._cond:
+			self._max = max(1, maximum)
+			self._min = min(self._min, self._max)
+			self._limit = min(self._limit, self._max)
+			self._cond.notify_all()
+
+	def acquire(self, headroom:int=0) -> None:
+		"""Take a slot, waiting until one is free (and 'headroom' more, leaving them for others)."""
+		with self._cond:
+			while self._in_use >= max(1, int(self._limit) - headroom):
+				self._cond.wait()
+			self._in_use += 1
+
+	def try_acquire(self) -> bool:
+		"""Take a slot only if one is free right now."""
+		with self._cond:
+			if self._in_use >= int(self._limit):
+				return False
+			self._in_use += 1
+			return True
+
+	def release(self, latency:float|None=None, overloaded:bool=False, endpoint:str='') -> None:
+		"""Release a slot; 'latency' of a successful request (to 'endpoint'), or whether the server was 'overloaded'."""
+		with self._cond:
+			self._in_use -= 1
+
+			if overloaded:
+				self._decrease(endpoint)
+			elif latency is not None:
+				self._sample(endpoint, latency)
+
+			self._cond.notify_all()
+
+	def stats(self) -> dict[str, int]:
+		with self._cond:
+			return {
+				'limit': int(self._limit),
+				'in_use': self._in_use,
+			}
+
+	def _sample(self, endpoint:str, latency:float) -> None:
+		latencies = self._latencies.get(endpoint)
+		if latencies is None:
+			latencies = self._latencies[endpoint] = deque(maxlen=_BASELINE_SAMPLES)
+		latencies.append(latency)
+
+		if latency <= 2*min(latencies) and self._limit < self._max:
+			self._limit = min(self._max, self._limit + 1/self._limit)
+
+	def _decrease(self, endpoint:str) -> None:
+		now = self._clock()
+		latencies = self._latencies.get(endpoint)
+		window = max(1.0, 2*min(latencies)) if latencies else 1.0
+		if now - self._last_decrease < window:
+			return
+
+		self._last_decrease = now
+		self._limit = max(self._min, self._limit/2)
+		debug('ratelimit: concurrency decreased to %d' % int(self._limit))
@@ -0,0 +1,277 @@
+import os
+import time
+import hashlib
+import threading
+from os.path import join as pjoin
+from tempfile import mkstemp
+
+from . import compression
+from .config import debug
+from .utils import decode_json, encode_json
+
+from typing import Any
+
+# endpoint classes, each with its own TTL
+ENDPOINTS = ('search', 'details', 'season', 'changes')
+
+# when evicting, make some room at the same time
+_EVICT_TO = 0.9
+
+
+class CachedResponse:
+	"""A cached response, possibly expired. The body is only decoded when asked for."""
+
+	def __init__(self, header:dict, body:bytes, stored:float):
+		self._header = header
+		self._body = body
+		self.stored = stored
+
+	@property
+	def age(self) -> float:
+		return time.time() - self.stored
+
+	@property
+	def validators(self) -> dict[str, str]:
+		"""Validators for conditional requests; 'etag' and/or 'last_modified' (if known)."""
+		return {
+			key: self._header[key]
+			for key in ('etag', 'last_modified')
+			if self._header.get(key)
+		}
+
+	def data(self) -> Any:
+		return decode_json(self._body)
+
+
+class ResponseCache:
+	"""
+	Persistent, on-disk cache of API responses, keyed by endpoint and query.
+
+	Each entry is a (compressed) file; its modification time is when the response was
+	stored or last revalidated (used for the per-endpoint TTL) and its access time when
+	it was last used (used to evict the least recently used entries when the size cap
+	is exceeded).
+	"""
+	def __init__(self, path:str, max_size:int, ttl:dict[str, int]):
+		self._path = path
+		self._max_size = max_size
+		self._ttl = ttl
+		self._lock = threading.Lock()
+		# filename -> [size, last used]; populated on first write
+		self._entries:dict[str, list]|None = None
+		self._total_size = 0
+
+		os.makedirs(path, exist_ok=True)
+
+	@property
+	def path(self) -> str:
+		return self._path
+
+	@property
+	def max_size(self) -> int:
+		return self._max_size
+
+	def ttl(self, endpoint:str) -> int:
+		return self._ttl.get(endpoint, 0)
+
+	def get(self, endpoint:str, key:str, max_age:int|None=None) -> Any|None:
+		"""Return the cached response, or None if there's no (fresh enough) entry."""
+
+		entry = self.lookup(endpoint, key)
+		if entry is None or not self.is_fresh(endpoint, entry, max_age):
+			return None
+
+		self.touch(endpoint, key)
+
+		return entry.data()
+
+	def lookup(self, endpoint:str, key:str) -> CachedResponse|None:
+		"""Return the cached response, even if expired (e.g. to revalidate it)."""
+
+		filepath = pjoin(self._path, self._filename(endpoint, key))
+
+		try:
+			stored = os.stat(filepath).st_mtime
+		except FileNotFoundError:
+			return None
+
+		return self._read(filepath, key, stored)
+
+	def is_fresh(self, endpoint:str, entry:CachedResponse, max_age:int|None=None) -> bool:
+		if max_age is None:
+			max_age = self.ttl(endpoint)
+
+		return entry.age <= max_age
+
+	def touch(self, endpoint:str, key:str, revalidated:bool=False) -> None:
+		"""Mark entry as used. If 'revalidated' it's also considered fresh again."""
+
+		filepath = pjoin(self._path, self._filename(endpoint, key))
+		now = time.time()
+
+		try:
+			stored = now if revalidated else os.stat(filepath).st_mtime
+			os.utime(filepath, (now, stored))
+		except FileNotFoundError:
+			return
+
+		with self._lock:
+			if self._entries is not None:
+				entry = self._entries.get(os.path.basename(filepath))
+				if entry:
+					entry[1] = now
+
+	def put(self, endpoint:str, key:str, data:Any, validators:dict[str, str]|None=None) -> bool:
+		return self.put_raw(endpoint, key, encode_json(data), validators=validators)
+
+	def put_raw(self, endpoint:str, key:str, body:bytes, validators:dict[str, str]|None=None) -> bool:
+		"""Store an already encoded (JSON) response body, as is."""
+		filename = self._filename(endpoint, key)
+
+		header = encode_json({ 'key': key, **(validators or {}) })
+		if not self._write(filename, header + b'\n' + body):
+			return False
+
+		self._evict()
+
+		return True
+
+	def info(self) -> dict[str, dict[str, int]]:
+		"""Number of entries, their total size and number of expired entries, per endpoint."""
+
+		info = {
+			endpoint: { 'entries': 0, 'size': 0, 'expired': 0 }
+			for endpoint in ENDPOINTS
+		}
+
+		now = time.time()
+		for endpoint, entry in self._scan_dir():
+			if endpoint not in info:
+				continue
+			stats = info[endpoint]
+			stats['entries'] += 1
+			stats['size'] += entry.stat().st_size
+			if now - entry.stat().st_mtime > self.ttl(endpoint):
+				stats['expired'] += 1
+
+		return info
+
+	def purge(self, endpoints:list[str]|tuple|None=None, expired_only:bool=False) -> int:
+		"""Remove entries (optionally only of 'endpoints' and/or only expired ones). Returns number of removed entries."""
+
+		now = time.time()
+		removed = 0
+
+		with self._lock:
+			for endpoint, entry in self._scan_dir():
+				if endpoints is not None and endpoint not in endpoints:
+					continue
+				if expired_only and now - entry.stat().st_mtime <= self.ttl(endpoint):
+					continue
+
+				try:
+					os.remove(entry.path)
+					removed += 1
+				except FileNotFoundError:
+					pass
+
+			self._entries = None  # rescan when needed
+
+		debug('cache: purged %d entries' % removed)
+
+		return removed
+
+	def _filename(self, endpoint:str, key:str) -> str:
+		digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+		method = compression.method()
+		extension = method['extension'] if method else ''
+		return '%s-%s%s' % (endpoint, digest, extension)
+
+	def _read(self, filepath:str, key:str, stored:float) -> CachedResponse|None:
+		try:
+			with compression.open(filepath) as fp:
+				header_line, body = fp.read().split(b'\n', 1)
+
+			header = decode_json(header_line)
+			if header.get('key') != key:
+				debug('cache: key mismatch: %s' % key)
+				return None
+
+			return CachedResponse(header, body, stored)
+
+		except FileNotFoundError:
+			return None
+
+		except Exception as e:
+			debug('cache: bad entry %s: %s' % (filepath, e))
+			self._remove(filepath)
+			return None
+
+	def _write(self, filename:str, content:bytes) -> bool:
+		fd, tmp_name = mkstemp(dir=self._path)
+		os.close(fd)
+
+		try:
+			with compression.writer(tmp_name) as fp:
+				fp.write(content)
+
+			filepath = pjoin(self._path, filename)
+			os.rename(tmp_name, filepath)
+
+		except Exception as e:
+			debug('cache: failed writing %s: %s' % (filename, e))
+			try:
+				os.remove(tmp_name)
+			except FileNotFoundError:
+				pass
+			return False
+
+		size = os.stat(filepath).st_size
+
+		with self._lock:
+			if self._entries is not None:
+				previous = self._entries.get(filename)
+				if previous:
+					self._total_size -= previous[0]
+				self._entries[filename] = [size, time.time()]
+				self._total_size += size
+
+		return True
+
+	def _remove(self, filepath:str) -> None:
+		try:
+			os.remove(filepath)
+		except FileNotFoundError:
+			pass
+
+	def _evict(self) -> None:
+		with self._lock:
+			if self._entries is None:
+				self._entries = {
+					entry.name: [entry.stat().st_size, entry.stat().st_atime]
+					for _, entry in self._scan_dir()
+				}
+				self._total_size = sum(size for size, _ in self._entries.values())
+
+			if self._total_size <= self._max_size:
+				return
+
+			evicted = 0
+			least_recent_first = sorted(self._entries.items(), key=lambda item: item[1][1])
+			for filename, (size, _) in least_recent_first:
+				if self._total_size <= self._max_size*_EVICT_TO:
+					break
+
+				self._remove(pjoin(self._path, filename))
+				del self._entries[filename]
+				self._total_size -= size
+				evicted += 1
+
+		debug('cache: evicted %d entries' % evicted)
+
+	def _scan_dir(self):
+		with os.scandir(self._path) as it:
+			for entry in it:
+				endpoint = entry.name.split('-', 1)[0]
+				if endpoint in ENDPOINTS and entry.is_file():
+					yield endpoint, entry
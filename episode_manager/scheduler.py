@@ -0,0 +1,255 @@
+import threading
+import enum
+from collections import deque
+from contextlib import contextmanager
+import concurrent.futures as futures
+from typing import Callable, Iterable, Iterator, Any
+
+
+class Priority(enum.IntEnum):
+	INTERACTIVE = 0  # the user is waiting for it
+	NORMAL = 1
+	BACKGROUND = 2   # bulk work; throttled (see Scheduler)
+
+
+class Scheduler:
+	"""
+	Bounded, process-wide task scheduler.
+
+	A fixed budget of worker threads executes the submitted tasks, by priority
+	(see priority()) and in FIFO order within each one. Tasks may submit child
+	tasks and wait for them (see wait()); a worker that is waiting executes queued
+	tasks itself in the meantime, so nested requests never need another pool and
+	can't starve the workers. A worker that has to wait without doing so (see
+	blocking()) is temporarily replaced by another one.
+
+	While more urgent tasks are queued or running, idle workers start background
+	tasks only if less than 'background_share' of the workers are busy with them,
+	leaving headroom for more urgent work. Otherwise background tasks may use all
+	workers.
+	"""
+	def __init__(self, max_workers:int, name:str='scheduler', background_share:float=0.5):
+		self._max_workers = max(1, max_workers)
+		self._name = name
+		self._background_share = background_share
+		self._queues:list[deque] = [ deque() for _ in Priority ]
+		self._cond = threading.Condition()
+		self._workers:list[threading.Thread] = []
+		self._num_idle = 0
+		self._in_flight = 0
+		self._num_background = 0
+		# tasks of the other priorities, run by workers (not those run while waiting)
+		self._num_foreground = 0
+		# workers waiting in blocking()
+		self._num_blocked = 0
+		self._local = threading.local()
+
+	def submit(self, func:Callable, *args, **kw) -> futures.Future:
+		"""Run func(*args, **kw), with the priority of the calling thread (see priority())."""
+		return self._submit(func, args, kw, first=False)
+
+	def submit_first(self, func:Callable, *args, **kw) -> futures.Future:
+		"""Like submit(), but ahead of the queued tasks of the same priority."""
+		return self._submit(func, args, kw, first=True)
+
+	def _submit(self, func:Callable, args:tuple, kw:dict, first:bool) -> futures.Future:
+		future:futures.Future = futures.Future()
+		priority = self.current_priority()
+
+		with self._cond:
+			task = (future, func, args, kw, priority)
+			if first:
+				self._queues[priority].appendleft(task)
+			else:
+				self._queues[priority].append(task)
+			# idle workers might not have picked up earlier tasks yet
+			if self._num_queued() > self._num_idle and len(self._workers) < self._worker_budget():
+				self._start_worker()
+			self._cond.notify_all()
+
+		return future
+
+	@contextmanager
+	def blocking(self):
+		"""
+		For a worker waiting on other tasks without running any (e.g. the first of several
+		to complete): another worker may be started meanwhile, in its stead.
+		"""
+		if not self.in_worker():
+			yield
+			return
+
+		with self._cond:
+			self._num_blocked += 1
+			if self._num_queued() > self._num_idle and len(self._workers) < self._worker_budget():
+				self._start_worker()
+		try:
+			yield
+		finally:
+			with self._cond:
+				self._num_blocked -= 1
+				# surplus workers will exit by themselves
+				self._cond.notify_all()
+
+	@contextmanager
+	def priority(self, priority:Priority):
+		"""Tasks submitted by this thread within the context have 'priority' (as do their child tasks)."""
+		previous = getattr(self._local, 'priority', None)
+		self._local.priority = priority
+		try:
+			yield
+		finally:
+			self._local.priority = previous
+
+	def current_priority(self) -> Priority:
+		priority = getattr(self._local, 'priority', None)
+		return Priority.NORMAL if priority is None else priority
+
+	def resize(self, max_workers:int) -> None:
+		with self._cond:
+			self._max_workers = max(1, max_workers)
+			# surplus workers will exit by themselves
+			self._cond.notify_all()
+
+	def wait(self, promises:Iterable[futures.Future]) -> None:
+		"""Wait for all 'promises' to complete (without raising their exceptions)."""
+		pending = [p for p in promises if not p.done()]
+		if not pending:
+			return
+
+		if not self.in_worker():
+			futures.wait(pending)
+			return
+
+		# we're occupying a worker; help out with queued tasks while waiting
+		while True:
+			with self._cond:
+				while True:
+					pending = [p for p in pending if not p.done()]
+					if not pending:
+						return
+					# this worker is busy anyway; it may take background tasks (e.g. its children)
+					task = self._next_task(throttled=False)
+					if task is not None:
+						break
+					# notified when any task completes (or is queued)
+					self._cond.wait(timeout=0.5)
+
+			self._run(task)
+
+	def as_completed(self, promises:list[futures.Future]) -> Iterator[futures.Future]:
+		"""Yield the 'promises' as they complete."""
+		if not self.in_worker():
+			yield from futures.as_completed(promises)
+			return
+
+		# can't block a worker on just one of them; wait for all (helping out meanwhile)
+		self.wait(promises)
+		yield from promises
+
+	def result(self, promise:futures.Future) -> Any:
+		self.wait([promise])
+		return promise.result()
+
+	def in_worker(self) -> bool:
+		return getattr(self._local, 'scheduler', None) is self
+
+	def stats(self) -> dict[str, int]:
+		with self._cond:
+			return {
+				'max_workers': self._max_workers,
+				'workers': len(self._workers),
+				'idle': self._num_idle,
+				'queued': self._num_queued(),
+				'in_flight': self._in_flight,
+				'background': self._num_background,
+				'foreground': self._num_foreground,
+			}
+
+	def _start_worker(self) -> None:
+		worker = threading.Thread(
+			target=self._worker,
+			name='%s-%d' % (self._name, len(self._workers)),
+			daemon=True
+		)
+		self._workers.append(worker)
+		worker.start()
+
+	def _worker(self) -> None:
+		self._local.scheduler = self
+
+		while True:
+			with self._cond:
+				while True:
+					if len(self._workers) > self._worker_budget():
+						self._workers.remove(threading.current_thread())
+						self._cond.notify_all()  # in case this worker was needed for the queue
+						return
+
+					task = self._next_task()
+					if task is not None:
+						break
+
+					self._num_idle += 1
+					self._cond.wait()
+					self._num_idle -= 1
+
+				background = task[-1] == Priority.BACKGROUND
+				if background:
+					self._num_background += 1
+				else:
+					self._num_foreground += 1
+
+			try:
+				self._run(task)
+			finally:
+				with self._cond:
+					if background:
+						self._num_background -= 1
+					else:
+						self._num_foreground -= 1
+					self._cond.notify_all()
+
+	def _num_queued(self) -> int:
+		return sum(len(queue) for queue in self._queues)
+
+	def _next_task(self, throttled:bool=True) -> tuple|None:
+		# the first task of the most urgent priority; call with the lock held
+		for priority, queue in zip(Priority, self._queues):
+			if not queue:
+				continue
+			if priority == Priority.BACKGROUND and throttled and self._num_foreground and self._num_background >= self._max_background():
+				return None
+			return queue.popleft()
+
+		return None
+
+	def _worker_budget(self) -> int:
+		# call with the lock held
+		return self._max_workers + self._num_blocked
+
+	def _max_background(self) -> int:
+		return max(1, int(self._max_workers*self._background_share))
+
+	def _run(self, task:tuple) -> None:
+		future, func, args, kw, priority = task
+		if not future.set_running_or_notify_cancel():
+			return
+
+		with self._cond:
+			self._in_flight += 1
+
+		# child tasks inherit the priority
+		previous = getattr(self._local, 'priority', None)
+		self._local.priority = priority
+		try:
+			result = func(*args, **kw)
+		except BaseException as e:
+			future.set_exception(e)
+		else:
+			future.set_result(result)
+		finally:
+			self._local.priority = previous
+			with self._cond:
+				self._in_flight -= 1
+				self._cond.notify_all()
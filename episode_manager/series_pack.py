@@ -0,0 +1,400 @@
+"""
+Pack file storage of the series data (config 'series-storage': 'pack').
+
+All series in one file, each in an independently compressed record, appended
+when written. An index file maps the series IDs to their records' offsets, so a
+series is read using a single pread(). Records appended after the index was
+written (e.g. if interrupted) are found by scanning the end of the pack.
+Superseded records are removed by rewriting the pack (see Pack.flush()).
+Writers lock the pack (flock()), so several processes can use it.
+"""
+import os
+import time
+import zlib
+import fcntl
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from os.path import join as pjoin, exists as pexists
+from tempfile import mkstemp
+
+from . import db, compression
+from .config import debug
+from .utils import read_json_obj, decode_json, encode_json
+
+# file header: magic, pack ID (the index belongs to the pack with the same ID)
+_FILE_HEADER = struct.Struct('<8sQ')
+_FILE_MAGIC = b'EPMPACK1'
+
+# record header: magic, codec, length of the ID, length of the data, CRC of the data, time written
+# followed by the ID and the data; no data (and codec 0) for a removed series
+_RECORD = struct.Struct('<4sBHIId')
+_RECORD_MAGIC = b'EPMS'
+
+_CODEC_NONE = 0
+_CODEC_ZLIB = 1
+_CODEC_ZSTD = 2
+
+# repack when superseded records take up this much of the pack (and at least _REPACK_MIN)
+_REPACK_RATIO = 0.5
+_REPACK_MIN = 1024*1024
+
+try:
+	import zstandard
+	_codec = _CODEC_ZSTD
+except ImportError:
+	zstandard = None
+	_codec = _CODEC_ZLIB
+
+
+def _compress(data:bytes) -> bytes:
+	if _codec == _CODEC_ZSTD:
+		return zstandard.ZstdCompressor(level=compression.ZSTD_LEVEL).compress(data)
+	return zlib.compress(data, 6)
+
+def _decompress(codec:int, data:bytes) -> bytes:
+	if codec == _CODEC_ZSTD:
+		if zstandard is None:
+			raise RuntimeError('zstandard is not available')
+		return zstandard.ZstdDecompressor().decompress(data)
+	return zlib.decompress(data)
+
+
+class Pack:
+	def __init__(self, filepath:str):
+		self._filepath = filepath
+		self._lock = threading.Lock()
+		# series ID -> [offset, length, time written] (of the record)
+		self._entries:dict[str, list] = {}
+		self._size = 0
+		self._garbage = 0
+		self._index_changed = False
+		self._pack_id = 0
+		self._fd = -1
+
+		os.makedirs(os.path.dirname(filepath), exist_ok=True)
+		try:
+			with self._locked():
+				pass
+		except:
+			if self._fd >= 0:
+				os.close(self._fd)
+			raise
+
+	@property
+	def index_file(self) -> str:
+		return self._filepath + '.index'
+
+	def close(self) -> None:
+		self.flush()
+		os.close(self._fd)
+
+	def __contains__(self, title_id:str) -> bool:
+		return title_id in self._entries
+
+	def mtime(self, title_id:str) -> float|None:
+		entry = self._entries.get(title_id)
+		return entry[2] if entry else None
+
+	def read(self, title_id:str) -> bytes|None:
+		"""The (uncompressed) data of 'title_id'; None if there's none."""
+		entry = self._entries.get(title_id)
+		if entry is None:
+			return None
+		offset, length, _ = entry
+		return self._decode(title_id, os.pread(self._fd, length, offset))
+
+	def read_many(self, title_ids:list[str]) -> dict[str, bytes]:
+		"""The data of those of 'title_ids' that exist, read in the order they're stored."""
+		stored = sorted(
+			(self._entries[title_id][0], title_id)
+			for title_id in title_ids
+			if title_id in self._entries
+		)
+		return {
+			title_id: self._decode(title_id, os.pread(self._fd, self._entries[title_id][1], offset))
+			for offset, title_id in stored
+		}
+
+	def write(self, title_id:str, data:bytes) -> None:
+		self._append(title_id, _codec, _compress(data))
+
+	def remove(self, title_id:str) -> None:
+		if title_id in self._entries:
+			self._append(title_id, _CODEC_NONE, b'')
+
+	def flush(self) -> None:
+		"""Write the index, if it changed, repacking first if there are a lot of superseded records."""
+		with self._locked():
+			if self._garbage > max(_REPACK_MIN, self._size*_REPACK_RATIO):
+				self._repack()
+			if self._index_changed:
+				self._write_index()
+
+	def _append(self, title_id:str, codec:int, payload:bytes) -> None:
+		key = title_id.encode('utf-8')
+		stamp = time.time()
+		record = _RECORD.pack(_RECORD_MAGIC, codec, len(key), len(payload), zlib.crc32(payload), stamp) + key + payload
+
+		with self._locked():
+			offset = os.lseek(self._fd, 0, os.SEEK_END)
+			os.write(self._fd, record)
+			self._size = offset + len(record)
+			self._index_changed = True
+			self._garbage += self._set_entry(title_id, codec, offset, len(record), stamp)
+
+	@contextmanager
+	def _locked(self):
+		# exclusive access (also among processes), with the entries up to date
+		with self._lock:
+			while True:
+				if self._fd < 0:
+					self._fd = os.open(self._filepath, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+				fcntl.flock(self._fd, fcntl.LOCK_EX)
+				try:
+					current = os.stat(self._filepath).st_ino == os.fstat(self._fd).st_ino
+				except FileNotFoundError:
+					current = False
+				if current:
+					break
+				# replaced (repacked) by another process; closing releases the lock
+				os.close(self._fd)
+				self._fd = -1
+
+			try:
+				self._sync()
+				yield
+			finally:
+				fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+	def _sync(self) -> None:
+		# read the header, and the index if it's another pack; then the records after the indexed ones
+		header = os.pread(self._fd, _FILE_HEADER.size, 0)
+		if len(header) < _FILE_HEADER.size:
+			# new (or interrupted while creating it)
+			os.ftruncate(self._fd, 0)
+			self._pack_id = time.time_ns()
+			os.write(self._fd, _FILE_HEADER.pack(_FILE_MAGIC, self._pack_id))
+			self._entries = {}
+			self._size = _FILE_HEADER.size
+			self._garbage = 0
+			self._index_changed = True
+			return
+
+		magic, pack_id = _FILE_HEADER.unpack(header)
+		if magic != _FILE_MAGIC:
+			raise RuntimeError('not a series pack file: %s' % self._filepath)
+		if pack_id != self._pack_id:
+			self._pack_id = pack_id
+			self._load_index()
+
+		self._scan()
+
+	def _set_entry(self, title_id:str, codec:int, offset:int, length:int, stamp:float) -> int:
+		# returns the number of bytes superseded by the record
+		previous = self._entries.pop(title_id, None)
+		superseded = previous[1] if previous else 0
+		if codec == _CODEC_NONE:
+			superseded += length  # the removal record itself is useless after repacking
+		else:
+			self._entries[title_id] = [offset, length, stamp]
+		return superseded
+
+	def _decode(self, title_id:str, record:bytes) -> bytes:
+		if len(record) < _RECORD.size:
+			raise RuntimeError('short record of %s in %s' % (title_id, self._filepath))
+		magic, codec, key_len, data_len, crc, _ = _RECORD.unpack_from(record)
+		payload = record[_RECORD.size + key_len:]
+		if magic != _RECORD_MAGIC or record[_RECORD.size:_RECORD.size + key_len] != title_id.encode('utf-8') \
+				or len(payload) != data_len or zlib.crc32(payload) != crc:
+			raise RuntimeError('bad record of %s in %s' % (title_id, self._filepath))
+		return _decompress(codec, payload)
+
+	def _load_index(self) -> None:
+		try:
+			with open(self.index_file, 'rb') as fp:
+				index = decode_json(fp.read())
+
+			if index.get('pack') != self._pack_id:
+				raise ValueError('index of another pack')
+
+			self._entries = index['entries']
+			self._size = index['size']
+			self._garbage = index['garbage']
+
+		except (OSError, ValueError, KeyError) as e:
+			debug('pack: rebuilding index: %s' % e)
+			self._entries = {}
+			self._size = _FILE_HEADER.size
+			self._garbage = 0
+			self._index_changed = True
+
+	def _scan(self) -> None:
+		# read the records after the known ones (the pack is locked, so an incomplete one was interrupted)
+		file_size = os.fstat(self._fd).st_size
+		if file_size < self._size:
+			debug('pack: rebuilding index: pack is smaller than indexed')
+			self._entries = {}
+			self._size = _FILE_HEADER.size
+			self._garbage = 0
+		if file_size <= self._size:
+			return
+
+		t0 = time.time()
+		num_records = 0
+
+		data = os.pread(self._fd, file_size - self._size, self._size)
+		pos = 0
+		while pos + _RECORD.size <= len(data):
+			magic, codec, key_len, data_len, crc, stamp = _RECORD.unpack_from(data, pos)
+			end = pos + _RECORD.size + key_len + data_len
+			if magic != _RECORD_MAGIC or end > len(data) or zlib.crc32(data[end - data_len:end]) != crc:
+				break
+			title_id = data[pos + _RECORD.size:pos + _RECORD.size + key_len].decode('utf-8')
+			self._garbage += self._set_entry(title_id, codec, self._size + pos, end - pos, stamp)
+			num_records += 1
+			pos = end
+
+		self._size += pos
+		self._index_changed = True
+		if self._size < file_size:
+			# the last write was interrupted
+			debug('pack: truncating incomplete record at %d' % self._size)
+			os.ftruncate(self._fd, self._size)
+
+		ms = (time.time() - t0)*1000
+		debug('pack: found %d unindexed records in %.1fms' % (num_records, ms))
+
+	def _write_index(self) -> None:
+		index = {
+			'pack': self._pack_id,
+			'size': self._size,
+			'garbage': self._garbage,
+			'entries': self._entries,
+		}
+		fd, tmp_name = mkstemp(dir=os.path.dirname(self._filepath))
+		try:
+			with os.fdopen(fd, 'wb') as fp:
+				fp.write(encode_json(index))
+			os.rename(tmp_name, self.index_file)
+		except OSError:
+			os.remove(tmp_name)
+			raise
+		self._index_changed = False
+
+	def _repack(self) -> None:
+		# copy the current records into a new pack (in the same order)
+		t0 = time.time()
+		size_before = self._size
+
+		pack_id = time.time_ns()
+		entries:dict[str, list] = {}
+		offset = _FILE_HEADER.size
+
+		fd, tmp_name = mkstemp(dir=os.path.dirname(self._filepath))
+		try:
+			# locked before it replaces the pack, so others wait until we're done
+			fcntl.flock(fd, fcntl.LOCK_EX)
+			with os.fdopen(fd, 'wb', closefd=False) as fp:
+				fp.write(_FILE_HEADER.pack(_FILE_MAGIC, pack_id))
+				for title_id, (old_offset, length, stamp) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+					fp.write(os.pread(self._fd, length, old_offset))
+					entries[title_id] = [offset, length, stamp]
+					offset += length
+				fp.flush()
+				os.fsync(fp.fileno())
+			fcntl.fcntl(fd, fcntl.F_SETFL, os.O_APPEND)
+			os.chmod(tmp_name, 0o644)
+			os.rename(tmp_name, self._filepath)
+		except OSError:
+			os.close(fd)
+			os.remove(tmp_name)
+			raise
+
+		os.close(self._fd)
+		self._fd = fd
+		self._pack_id = pack_id
+		self._entries = entries
+		self._size = offset
+		self._garbage = 0
+		self._index_changed = True
+
+		ms = (time.time() - t0)*1000
+		debug('pack: repacked %d series, %d -> %d bytes in %.1fms' % (len(entries), size_before, offset, ms))
+
+
+class SeriesCache(db.SeriesCache):
+	"""The series data, in a pack file (imported from the series files, if it doesn't exist)."""
+	def __init__(self, path:str):
+		self._cache:dict = {}
+		self._path = path
+
+		filepath = path + '.pack'
+		new = not pexists(filepath)
+		self._pack = Pack(filepath)
+		if new and os.path.isdir(path):
+			self._import_files()
+
+	def exists(self, title_id:str) -> bool:
+		return title_id in self._pack
+
+	def remove(self, title_id:str) -> bool:
+		self._cache.pop(title_id, None)
+		self._pack.remove(title_id)
+		return True
+
+	def mtime(self, title_id:str) -> datetime|None:
+		stamp = self._pack.mtime(title_id)
+		return datetime.fromtimestamp(stamp) if stamp is not None else None
+
+	def prefetch(self, title_ids:list[str]) -> None:
+		missing = [ title_id for title_id in title_ids if title_id not in self._cache ]
+		if not missing:
+			return
+
+		t0 = time.time()
+		for title_id, data in self._pack.read_many(missing).items():
+			self._cache[title_id] = decode_json(data)
+		ms = (time.time() - t0)*1000
+		debug('pack: read %d series in %.1fms' % (len(missing), ms))
+
+	def episodes_airing(self, title_ids:list[str], begin:str, end:str) -> list[tuple[str, dict]]:
+		self.prefetch(title_ids)
+		return super().episodes_airing(title_ids, begin, end)
+
+	def flush(self) -> None:
+		self._pack.flush()
+
+	def close(self) -> None:
+		self._pack.close()
+
+	def _load_series(self, title_id:str) -> dict|None:
+		try:
+			data = self._pack.read(title_id)
+			return decode_json(data) if data is not None else None
+		except (RuntimeError, ValueError, zlib.error) as e:
+			debug('pack: failed reading %s: %s' % (title_id, e))
+			return None
+
+	def _save_series(self, title_id:str, data:dict) -> bool:
+		self._pack.write(title_id, encode_json(data))
+		return True
+
+	def _import_files(self) -> None:
+		t0 = time.time()
+		num_imported = 0
+		for title_id in sorted(os.listdir(self._path)):
+			try:
+				with compression.open(pjoin(self._path, title_id)) as fp:
+					data = read_json_obj(fp)
+			except Exception as e:
+				debug('pack: skipped series file %s: %s' % (title_id, e))
+				continue
+			self._save_series(title_id, data)
+			num_imported += 1
+
+		self._pack.flush()
+
+		ms = (time.time() - t0)*1000
+		debug('pack: imported %d series files in %.1fms' % (num_imported, ms))
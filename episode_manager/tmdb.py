@@ -4,15 +4,33 @@ import json
 import time
 import os
 import builtins
+import re
+import threading
+import queue
+import atexit
+import random
+import copy
+import heapq
+import concurrent.futures as futures
+from contextlib import contextmanager
 from requests import ReadTimeout, ConnectTimeout
+from requests.adapters import HTTPAdapter
 from urllib.parse import quote as url_escape
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
-import concurrent.futures as futures
 from datetime import datetime, timedelta, date
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from typing import Callable, Any
 
-_base_url_tmpl = 'https://api.themoviedb.org/3/%%(path)s?api_key=%s'
+from .scheduler import Scheduler, Priority
+from .ratelimit import TokenBucket, AdaptiveLimiter
+from .response_cache import ResponseCache
+from . import metrics
+from .config import debug
+from .utils import decode_json
+
+default_api_root = 'https://api.themoviedb.org/3'
+_base_url_tmpl = default_api_root + '/%%(path)s?api_key=%s'
 _base_url:str|None = None
 _api_key:str|None = None
 
@@ -42,9 +60,201 @@ __parallel_requests = 16
 def set_parallel(num) -> None:
 	global __parallel_requests
 	__parallel_requests = max(1, int(num or 1))
+	_sessions.resize(__parallel_requests)
+	_scheduler.resize(__parallel_requests)
+	_concurrency.set_maximum(__parallel_requests)
+
+def set_rate_limit(rate:float) -> None:
+	"""Max number of requests per second (bursts of up to one second's worth)."""
+	_rate_limit.set_rate(rate, burst=int(rate))
+
+def priority(level:Priority):
+	"""
+	Context manager: lookups started by this thread within it have priority 'level'
+	(e.g. Priority.BACKGROUND for bulk refreshes, which are throttled to leave headroom).
+	"""
+	return _scheduler.priority(level)
+
+def scheduler_stats() -> dict[str, int]:
+	"""Current state of the request scheduler: worker budget, queue depth and in-flight tasks."""
+	return {
+		**_scheduler.stats(),
+		**_concurrency.stats(),
+	}
 
-def __get_executor(n=__parallel_requests):
-	return futures.ThreadPoolExecutor(max_workers=n, thread_name_prefix='tmdb-request')
+
+class _SessionPool:
+	"""
+	Thread-safe pool of persistent HTTP sessions.
+	Each session keeps its connection alive, so consecutive requests
+	from the worker threads avoid a new TCP+TLS handshake every time.
+	Sessions are created on demand, up to 'size' concurrently in use.
+	"""
+	def __init__(self, size:int):
+		self._size = size
+		self._idle:list[requests.Session] = []
+		self._num_sessions = 0
+		self._cond = threading.Condition()
+
+	def resize(self, size:int) -> None:
+		with self._cond:
+			self._size = size
+			# excess sessions currently in use are closed when released
+			while self._idle and self._num_sessions > self._size:
+				self._idle.pop().close()
+				self._num_sessions -= 1
+			self._cond.notify_all()
+
+	@contextmanager
+	def session(self):
+		sess = self._acquire()
+		try:
+			yield sess
+		finally:
+			self._release(sess)
+
+	def close(self) -> None:
+		with self._cond:
+			for sess in self._idle:
+				sess.close()
+			self._num_sessions -= len(self._idle)
+			self._idle.clear()
+
+	def _acquire(self) -> requests.Session:
+		with self._cond:
+			while not self._idle and self._num_sessions >= self._size:
+				self._cond.wait()
+
+			if self._idle:
+				return self._idle.pop()
+
+			self._num_sessions += 1
+
+		try:
+			return self._new_session()
+		except:
+			with self._cond:
+				self._num_sessions -= 1
+				self._cond.notify()
+			raise
+
+	def _release(self, sess:requests.Session) -> None:
+		with self._cond:
+			if self._num_sessions > self._size:
+				self._num_sessions -= 1
+				sess.close()
+			else:
+				self._idle.append(sess)
+			self._cond.notify()
+
+	def _new_session(self) -> requests.Session:
+		sess = requests.Session()
+		sess.headers.update(global_headers)
+		# each session is only used by one thread at a time; one connection is enough
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+		sess.mount('https://', adapter)
+		sess.mount('http://', adapter)
+		return sess
+
+_sessions = _SessionPool(__parallel_requests)
+atexit.register(_sessions.close)
+
+# all requests, including nested ones (e.g. the seasons of a series), are run by this scheduler
+_scheduler = Scheduler(__parallel_requests, name='tmdb-request')
+
+# TMDb allows roughly 40-50 requests per second
+_default_rate_limit = 40
+_rate_limit = TokenBucket(_default_rate_limit, burst=_default_rate_limit)
+# number of requests actually in flight adapts to how the server copes
+_concurrency = AdaptiveLimiter(__parallel_requests)
+
+# give up on a request after being told to retry later this many times
+_MAX_THROTTLED = 5
+# don't wait longer than this, whatever Retry-After says
+_MAX_RETRY_AFTER = 60
+
+# retries of failed requests (timeouts, connection or server errors), with exponential backoff
+_retries = 3
+_retry_delay = 0.5  # seconds, before the first retry
+_MAX_RETRY_DELAY = 8
+# no more retries after this point in time (time.monotonic())
+_deadline:float|None = None
+
+def set_retries(num:int, delay:float|None=None) -> None:
+	global _retries, _retry_delay
+	_retries = max(0, int(num))
+	if delay is not None:
+		_retry_delay = max(0.0, float(delay))
+
+def set_deadline(seconds:float|None) -> None:
+	"""Don't retry failed requests later than 'seconds' from now (None = no deadline)."""
+	global _deadline
+	_deadline = None if seconds is None else time.monotonic() + seconds
+
+
+class _Hedging:
+	"""
+	When to send a duplicate of a slow request (see set_hedging()):
+	once it takes longer than the 95th percentile latency of its endpoint,
+	as long as the duplicates stay within 'budget' (a fraction of all requests).
+	"""
+	def __init__(self, budget:float, min_samples:int=20):
+		self._budget = budget
+		self._min_samples = min_samples
+		self._requests = 0
+		self._hedged = 0
+		self._lock = threading.Lock()
+
+	def delay(self, url:str) -> float|None:
+		"""Seconds after which to hedge a request (counting it), or None if not (yet) known."""
+		with self._lock:
+			self._requests += 1
+		return _metrics.latency(_metrics_endpoint(url), 95, self._min_samples)
+
+	def allow(self) -> bool:
+		"""Whether the budget permits another duplicate (consuming it)."""
+		with self._lock:
+			# one in advance, so even the first slow request may be hedged
+			if self._hedged > self._budget*self._requests:
+				return False
+			self._hedged += 1
+			return True
+
+	def refund(self) -> None:
+		with self._lock:
+			self._hedged -= 1
+
+# None: requests aren't hedged
+_hedging:_Hedging|None = None
+
+def set_hedging(budget:float|None) -> None:
+	"""
+	Send a duplicate of a request that is slower than the endpoint's 95th percentile
+	(of this process's requests), using whichever response arrives first. This cuts the
+	tail latency of many parallel requests. 'budget': max. number of duplicates, as a
+	fraction of all requests (e.g. 0.05); None or 0 to disable.
+	Both are sent by tasks of the request scheduler; the slower one is abandoned (its
+	response discarded).
+	"""
+	global _hedging
+	_hedging = _Hedging(budget) if budget else None
+
+def _may_hedge(url:str) -> bool:
+	# reserve the resources for a duplicate request, if they're available right away
+	if _hedging is None or not _hedging.allow():
+		return False
+
+	if not _concurrency.try_acquire():
+		_hedging.refund()
+		return False
+
+	if not _rate_limit.try_acquire():
+		_concurrency.release()
+		_hedging.refund()
+		return False
+
+	_metrics.count(_metrics_endpoint(url), 'hedged')
+	return True
 
 
 def _update_url_func() -> None:
@@ -81,26 +291,501 @@ def set_api_key(key:str) -> None:
 		_base_url = _base_url_tmpl % _api_key
 		_update_url_func()
 
+def set_api_root(url:str) -> None:
+	"""Use another server than TMDb's, e.g. a local stand-in. 'url' corresponds to 'https://api.themoviedb.org/3'."""
+	global _base_url_tmpl
+	_base_url_tmpl = url.rstrip('/') + '/%%(path)s?api_key=%s'
+	if _api_key:
+		set_api_key(_api_key)
+
 def ok() -> bool:
 	return bool(_api_key)
 
-def _query(url:str) -> dict[str, Any]|None:
-	# print('\x1b[2mquery: %s\x1b[m' % url)
+_cache:ResponseCache|None = None
+
+def set_cache(cache:ResponseCache|None) -> None:
+	"""Use 'cache' to store responses persistently (None to disable)."""
+	global _cache
+	_cache = cache
+
+def cache() -> ResponseCache|None:
+	return _cache
+
+
+# network metrics of this process, per endpoint class
+_metrics = metrics.Metrics()
+
+def net_stats() -> metrics.Metrics:
+	return _metrics
+
+def _metrics_endpoint(url:str) -> str:
+	return _endpoint_class(url) or 'other'
+
+
+# how requests are sent; None: over HTTP, using _sessions
+_transport = None
+
+def set_transport(transport) -> None:
+	"""Send requests using 'transport' (e.g. to record or replay them; see module 'transport'). None: over HTTP."""
+	global _transport
+	_transport = transport
+
+
+def _endpoint_class(url:str) -> str|None:
+	# the kind of endpoint; determines e.g. the response cache TTL
+	path = url.split('/3/', 1)[-1].split('?', 1)[0].split('/')
+
+	if path[0] == 'search':
+		return 'search'
+	if path[-1] == 'changes':
+		return 'changes'
+	if len(path) >= 4 and path[2] == 'season':
+		return 'season'
+	if path[0] in ('tv', 'movie', 'find'):
+		return 'details'
+
+	return None
+
+_api_key_ptn = re.compile(r'api_key=[^&]*&?')
+
+def _cache_key(url:str) -> str:
+	# the API key is not part of the identity of a response
+	return _api_key_ptn.sub('', url.split('/3/', 1)[-1])
+
+
+# queries currently being performed: (url, max_age) -> [promise of the result, number of callers that joined]
+_in_flight:dict[tuple, list] = {}
+_in_flight_lock = threading.Lock()
+
+def _query(url:str, max_age:int|None=None) -> dict[str, Any]|None:
+	"""
+	Get the response from 'url' (see _cached_query()).
+	Concurrent identical queries are coalesced; only one of them is actually performed.
+	"""
+	key = (url, max_age)
+	with _in_flight_lock:
+		entry = _in_flight.get(key)
+		leader = entry is None
+		if leader:
+			entry = _in_flight[key] = [futures.Future(), 0]
+		else:
+			entry[1] += 1
+	promise = entry[0]
+
+	if not leader:
+		debug('tmdb: joined in-flight query: %s' % _cache_key(url))
+		# the data is modified by the callers; everyone gets their own
+		return copy.deepcopy(promise.result())
+
+	try:
+		data = _cached_query(url, max_age=max_age)
+	except BaseException as e:
+		with _in_flight_lock:
+			del _in_flight[key]
+		promise.set_exception(e)
+		raise
+
+	with _in_flight_lock:
+		del _in_flight[key]
+		joined = entry[1]
+
+	# those that joined copy an untouched one, while this caller modifies 'data'
+	promise.set_result(copy.deepcopy(data) if joined else data)
+
+	return data
+
+
+def _cached_query(url:str, max_age:int|None=None) -> dict[str, Any]|None:
+	"""
+	Get the response from 'url', from the response cache if possible.
+	'max_age' overrides the cache's TTL of the endpoint (0 = always revalidate).
+	An expired cache entry is revalidated using a conditional request;
+	if not modified, the cached response is used.
+	"""
+	endpoint = _endpoint_class(url)
+	if _cache is None or endpoint is None:
+		return _fetch(url)
+
+	key = _cache_key(url)
+
+	cached = _cache.lookup(endpoint, key)
+	if cached is not None and max_age != 0 and _cache.is_fresh(endpoint, cached, max_age):
+		_cache.touch(endpoint, key)
+		_metrics.count(endpoint, 'cache_hits')
+		return cached.data()
+
+	headers = None
+	if cached is not None:
+		headers = _conditional_headers(cached.validators)
+
+	resp = _request(url, headers=headers)
+	if resp is None:
+		return None
+
+	if resp.status_code == HTTPStatus.NOT_MODIFIED and cached is not None:
+		debug('tmdb: not modified: %s' % key)
+		_metrics.count(endpoint, 'revalidated')
+		_cache.touch(endpoint, key, revalidated=True)
+		return cached.data()
+
+	data = _response_data(resp)
+	if data is not None:
+		# store the body as received; no need to encode it again
+		_cache.put_raw(endpoint, key, resp.content, validators=_response_validators(resp))
+
+	return data
+
+
+def _fetch(url:str) -> dict[str, Any]|None:
+	resp = _request(url)
+	if resp is None:
+		return None
+
+	return _response_data(resp)
+
+
+def _request(url:str, headers:dict|None=None) -> requests.Response|None:
+	retry = _Retry(url)
+
+	while True:
+		resp, error = _attempt(url, headers)
+
+		delay = retry.after(resp, error)
+		if delay is None:
+			return resp
+
+		time.sleep(delay)
+
+
+class _Retry:
+	"""
+	Decides whether to retry a request, after each attempt.
+	Throttled requests (429) are retried after the requested time (without counting as failed);
+	timeouts, connection and server errors with exponential backoff.
+	"""
+	def __init__(self, url:str):
+		self._url = url
+		self._endpoint = _metrics_endpoint(url)
+		self._failed = 0
+		self._throttled = 0
+
+	def after(self, resp:requests.Response|None, error:Exception|None) -> float|None:
+		"""Seconds to wait before retrying, or None if done (i.e. return 'resp')."""
+		try:
+			delay = self._decide(resp, error)
+		except Exception:
+			_metrics.count(self._endpoint, 'failures')
+			raise
+
+		if delay is not None:
+			_metrics.count(self._endpoint, 'retries')
+		elif resp is None or (resp.status_code >= 400 and resp.status_code != HTTPStatus.NOT_FOUND):
+			_metrics.count(self._endpoint, 'failures')
+
+		return delay
+
+	def _decide(self, resp:requests.Response|None, error:Exception|None) -> float|None:
+
+		if resp is not None:
+			if resp.status_code == HTTPStatus.UNAUTHORIZED:
+				raise APIAuthError()
+
+			if resp.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+				self._throttled += 1
+				delay = _retry_after(resp)
+				debug('tmdb: throttled (%d/%d), retry after %.1fs: %s' % (self._throttled, _MAX_THROTTLED, delay, _cache_key(self._url)))
+				if self._throttled >= _MAX_THROTTLED or _past_deadline(delay):
+					return None
+
+				# the rate limiter does the waiting
+				_rate_limit.pause(delay)
+				return 0
+
+			if resp.status_code < 500:
+				return None
+
+		self._failed += 1
+		reason = error.__class__.__name__ if error else 'HTTP %d' % resp.status_code  # type: ignore  # either is set
+
+		delay = _retry_delay*2**(self._failed - 1)
+		delay = min(_MAX_RETRY_DELAY, delay/2 + random.uniform(0, delay/2))  # with jitter
+
+		if self._failed > _retries or _past_deadline(delay):
+			debug('tmdb: attempt %d failed (%s), giving up: %s' % (self._failed, reason, _cache_key(self._url)))
+			if isinstance(error, requests.exceptions.ConnectionError) and not isinstance(error, ConnectTimeout):
+				raise error
+			return None
+
+		debug('tmdb: attempt %d failed (%s), retry in %.1fs: %s' % (self._failed, reason, delay, _cache_key(self._url)))
+		return delay
+
+
+def _attempt(url:str, headers:dict|None) -> tuple[requests.Response|None, Exception|None]:
+	_rate_limit.acquire()
+
+	# background requests leave some of the concurrency to more urgent ones, and aren't hedged
+	background = _scheduler.current_priority() == Priority.BACKGROUND
+	_concurrency.acquire(headroom=_concurrency.limit//4 if background else 0)
+
+	hedge_after = _hedging.delay(url) if _hedging is not None and not background else None
+	if hedge_after is None:
+		return _send(url, headers)
+
+	return _hedged(url, headers, hedge_after)
+
+class _HedgeTimer:
+	"""One thread, calling functions after a delay (unless cancelled before)."""
+	def __init__(self):
+		self._heap:list[list] = []
+		self._seq = 0
+		self._cond = threading.Condition()
+		self._thread:threading.Thread|None = None
+
+	def schedule(self, delay:float, func:Callable[[], None]) -> list:
+		with self._cond:
+			self._seq += 1
+			entry = [time.monotonic() + delay, self._seq, func]
+			heapq.heappush(self._heap, entry)
+			if self._thread is None:
+				self._thread = threading.Thread(target=self._run, name='tmdb-hedge-timer', daemon=True)
+				self._thread.start()
+			self._cond.notify()
+		return entry
+
+	def cancel(self, entry:list) -> None:
+		with self._cond:
+			entry[2] = None
+
+	def _run(self) -> None:
+		while True:
+			with self._cond:
+				while not self._heap or self._heap[0][0] > time.monotonic():
+					self._cond.wait(timeout=self._heap[0][0] - time.monotonic() if self._heap else None)
+				func = heapq.heappop(self._heap)[2]
+			if func is not None:
+				func()
+
+_hedge_timer = _HedgeTimer()
+
+def _hedged(url:str, headers:dict|None, hedge_after:float) -> tuple[requests.Response|None, Exception|None]:
+	# the request is sent by another worker (right away), and a duplicate queued once it takes longer
+	# than 'hedge_after'; this one waits for whichever response arrives first
+	lock = threading.Lock()
+	attempts:list[futures.Future] = []
+	finished:queue.Queue = queue.Queue()
+	decided = False
+	priority = _scheduler.current_priority()
+
+	def start(promise:futures.Future) -> None:
+		attempts.append(promise)
+		promise.add_done_callback(finished.put)
+
+	def dispatch():
+		with lock:
+			if decided or not _may_hedge(url):
+				return
+			debug('tmdb: slower than %.2fs, hedging: %s' % (hedge_after, _cache_key(url)))
+			with _scheduler.priority(priority):
+				start(_scheduler.submit_first(_send, url, headers))
+
+	with _scheduler.blocking():
+		with lock:
+			start(_scheduler.submit_first(_send, url, headers))
+		timer = _hedge_timer.schedule(hedge_after, dispatch)
+
+		first = None
+		while True:
+			promise = finished.get()
+			first = first or promise
+			with lock:
+				# a failed attempt is only good enough if there's no other one to wait for
+				resp = promise.result()[0] if promise.exception() is None else None
+				if (resp is not None and resp.status_code < 500) or all(attempt.done() for attempt in attempts):
+					decided = True
+					break
+
+	_hedge_timer.cancel(timer)
+
+	# the other one isn't needed anymore; if it's already running, its response is just discarded
+	for attempt in attempts:
+		if attempt.cancel():
+			_concurrency.release()
+
+	if promise is not attempts[0] and promise is first:
+		_metrics.count(_metrics_endpoint(url), 'hedge_won')
+
+	return promise.result()
+
+def _send(url:str, headers:dict|None) -> tuple[requests.Response|None, Exception|None]:
+	# holding a slot of _concurrency, which is released
+	start = time.monotonic()
 	try:
-		resp = requests.get(url, headers=global_headers, timeout=10)
+		# print('\x1b[2mquery: %s\x1b[m' % url)
+		if _transport is not None:
+			resp = _transport.get(url, headers=headers, timeout=10)
+		else:
+			with _sessions.session() as session:
+				resp = session.get(url, headers=headers, timeout=10)
 		# print('\x1b[2mquery: DONE %s\x1b[m' % url)
-	except (ReadTimeout, ConnectTimeout):
+	except (ReadTimeout, ConnectTimeout) as e:
 		# print('\x1b[41;97;1mquery: TIMEOUT %s\x1b[m' % url)
-		return None
+		_concurrency.release(overloaded=True, endpoint=_metrics_endpoint(url))
+		_metrics.request(_metrics_endpoint(url), None)
+		return None, e
+	except requests.exceptions.ConnectionError as e:
+		_concurrency.release()
+		_metrics.request(_metrics_endpoint(url), None)
+		return None, e
+	except:
+		_concurrency.release()
+		raise
+
+	latency = time.monotonic() - start
+	_metrics.request(_metrics_endpoint(url), latency, len(resp.content))
+	_concurrency.release(
+		latency,
+		overloaded=resp.status_code in (HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE),
+		endpoint=_metrics_endpoint(url),
+	)
+
+	return resp, None
+
 
-	if resp.status_code == HTTPStatus.UNAUTHORIZED:
-		raise APIAuthError()
+def _past_deadline(delay:float) -> bool:
+	return _deadline is not None and time.monotonic() + delay > _deadline
+
+
+def _retry_after(resp:requests.Response) -> float:
+	value = resp.headers.get('Retry-After')
+	if not value:
+		return 1.0
+
+	try:
+		delay = float(value)
+	except ValueError:
+		try:
+			delay = parsedate_to_datetime(value).timestamp() - time.time()
+		except (TypeError, ValueError):
+			delay = 1.0
 
+	return min(max(0.0, delay), _MAX_RETRY_AFTER)
+
+
+def _response_data(resp:requests.Response) -> dict[str, Any]|None:
 	if resp.status_code != HTTPStatus.OK:
 		return None
 
-	return resp.json()
+	# decode the bytes directly (faster than resp.json(), especially with orjson)
+	try:
+		return decode_json(resp.content)
+	except ValueError as e:
+		debug('tmdb: bad response body: %s: %s' % (_cache_key(resp.url), e))
+		return None
+
 
+def _response_validators(resp:requests.Response) -> dict[str, str]:
+	validators = {}
+	if resp.headers.get('ETag'):
+		validators['etag'] = resp.headers['ETag']
+	if resp.headers.get('Last-Modified'):
+		validators['last_modified'] = resp.headers['Last-Modified']
+	return validators
+
+
+def _conditional_headers(validators:dict[str, str]) -> dict[str, str]|None:
+	headers = {}
+	if 'etag' in validators:
+		headers['If-None-Match'] = validators['etag']
+	if 'last_modified' in validators:
+		headers['If-Modified-Since'] = validators['last_modified']
+	return headers or None
+
+
+# computed values that are not set
+_EMPTY_VALUES = (None, '', [], {})
+
+class _Schema:
+	"""
+	Declarative transform of a response object: keys to rename, drop and compute.
+	Compiled once, then applied in a single pass per object. The result is the same as
+	_rename_keys(), _set_values(), _del_keys() and _del_empty() (in that order),
+	except that the computed values are derived from the original object.
+	"""
+	def __init__(self, rename:dict[str, str]|None=None, drop:Iterable[str]=(), compute:dict[str, Callable[[dict], Any]]|None=None, drop_empty:bool=True):
+		rename = rename or {}
+		drop = frozenset(drop)
+		# keys not copied as-is
+		self._skip = frozenset(rename) | drop
+		self._rename = tuple(
+			(old, new)
+			for old, new in rename.items()
+			if new not in drop
+		)
+		self._compute = tuple(
+			(key, func)
+			for key, func in (compute or {}).items()
+			if key not in drop
+		)
+		self._drop_empty = drop_empty
+
+	def __call__(self, obj:dict) -> dict:
+		skip = self._skip
+		out = {
+			key: value
+			for key, value in obj.items()
+			if key not in skip
+		}
+
+		for old, new in self._rename:
+			if old in obj:
+				out[new] = obj[old]
+
+		for key, func in self._compute:
+			try:
+				value = func(obj)
+			except Exception as e:
+				print('_Schema: "%s":' % key, str(e), file=sys.stderr)
+				continue
+			if value not in _EMPTY_VALUES:
+				out[key] = value
+			else:
+				out.pop(key, None)
+
+		if self._drop_empty and None in out.values():
+			out = {
+				key: value
+				for key, value in out.items()
+				if value is not None
+			}
+
+		return out
+
+	def all(self, objs:list) -> list:
+		return [self(obj) for obj in objs]
+
+
+_search_schema = _Schema(
+	rename={
+		'name': 'title',
+		'first_air_date': 'date',
+		'original_name': 'original_title',
+		'original_language': 'language',
+		'origin_country': 'country',
+	},
+	drop=[
+		'backdrop_path',
+		'popularity',
+		'poster_path',
+		'vote_average',
+		'vote_count',
+		'genre_ids',   # for now (in this tool), we don't need these
+	],
+	compute={
+		'year': lambda hit: [int(hit.get('first_air_date', [0]).split('-')[0])] if hit.get('first_air_date') else None,
+		'id': lambda hit: str(hit['id']),
+		'country': lambda hit: ', '.join(hit.get('origin_country')),
+	},
+)
 
 __recent_searches:dict = {}
 
@@ -112,7 +797,7 @@ def search(search:str, type:str='series', year:int|None=None, page:int=1):
 		raise NoAPIKey()
 
 	if _qurl is None:
-		return []
+		return [], 0
 
 	path = 'search'
 	if type == 'series':
@@ -131,60 +816,204 @@ def search(search:str, type:str='series', year:int|None=None, page:int=1):
 
 	url = _qurl(path, query)
 
+
 	if url in __recent_searches:
 		return __recent_searches.get(url)
 
 	data = _query(url)
 	if not data:
-		return []
+		return [], 0
 
 	total_results = data.get('total_results', 0)
 
 	hits = data.get('results', [])
 
 	if not _raw_output:
-		_rename_keys(hits, {
-			'name': 'title',
-			'first_air_date': 'date',
-			'original_name': 'original_title',
-			'original_language': 'language',
-			'origin_country': 'country',
-		})
-		_del_keys(hits, [
-			'backdrop_path',
-			'popularity',
-			'poster_path',
-			'vote_average',
-			'vote_count',
-			'genre_ids',   # for now (in this tool), we don't need these
-		])
-		_set_values(hits, {
-			'year': lambda hit: [int(hit.get('date', [0]).split('-')[0])] if hit.get('date') else None,
-			'id': lambda hit: str(hit['id']),
-			'country': lambda hit: ', '.join(hit.get('country')),
-		})
-		_del_empty(hits)
+		hits = _search_schema.all(hits)
 
 	if builtins.type(hits) is dict:
 		hits = [ hits ]
 
-	__recent_searches[url] = hits
+	__recent_searches[url] = hits, total_results
 
 	return hits, total_results
 
 
+class SearchHits:
+	"""
+	Search hits, enriched with their details, fetched in the background.
+	The first page tells how many hits there are; the other pages needed for 'max_hits'
+	are then fetched in parallel (interactive priority) and each hit's details as soon
+	as its page arrives (background priority).
+	The results are applied to 'hits' (in order) by poll(), e.g. by a UI loop.
+	Hits whose details failed get an 'error' instead; a failed page is skipped, with
+	the (first) exception in 'error'.
+	"""
+	def __init__(self, query:str, type:str='series', year:int|None=None, max_hits:int=20):
+		self.hits:list[dict] = []
+		self.total:int|None = None  # known when the first page has been applied
+		self.error:Exception|None = None
+		self._query = query
+		self._type = type
+		self._year = year
+		self._max_hits = max_hits
+		self._events:queue.Queue = queue.Queue()
+		self._pages:dict[int, list[dict]] = {}  # arrived, not yet applied
+		self._next_page = 1
+		self._num_pages:int|None = None
+		self._page_size = 0
+		self._details:dict[str, dict] = {}
+		self._pending = 0
+		self._lock = threading.Lock()
+
+		self._fetch_page(1)
+
+	@property
+	def done(self) -> bool:
+		"""Whether everything has been fetched and applied."""
+		with self._lock:
+			return self._pending == 0 and self._events.empty()
+
+	@property
+	def pages_done(self) -> bool:
+		"""Whether all pages have been applied, i.e. 'hits' is complete (but not their details)."""
+		return self._num_pages is not None and self._next_page > self._num_pages
+
+	def poll(self, timeout:float|None=0) -> bool:
+		"""
+		Apply arrived results to 'hits', waiting up to 'timeout' seconds (None: until
+		something arrives, unless done). Returns whether anything changed.
+		"""
+		changed = False
+		block = timeout is None or timeout > 0
+
+		while True:
+			if block and self.done:
+				break
+			try:
+				event = self._events.get(block=block, timeout=timeout)
+			except queue.Empty:
+				break
+			block = False
+			changed = self._apply(*event) or changed
+
+		return changed
+
+	def _apply(self, kind:str, *args) -> bool:
+		if kind == 'details':
+			title_id, data = args
+			if isinstance(data, Exception):
+				data = { 'error': str(data) or type(data).__name__ }
+			elif data is None:
+				data = { 'error': 'no details' }
+			self._details[title_id] = data
+			for hit in self.hits:
+				if hit['id'] == title_id:
+					hit.update(data)
+					return True
+			return False
+
+		if kind == 'error':
+			page, error = args
+			self.error = self.error or error
+			# the following pages are still applied
+			hits, total = [], 0
+		else:
+			page, hits, total = args
+
+		if page == 1:
+			self.total = total
+			self._num_pages = -(-min(total, self._max_hits)//len(hits)) if hits else 1
+		self._pages[page] = hits
+
+		# pages are applied in order
+		changed = False
+		while self._next_page in self._pages:
+			# the ones we fetched the details for (i.e. not more because a page failed)
+			first_index = (self._next_page - 1)*self._page_size
+			for hit in self._pages.pop(self._next_page)[:max(0, self._max_hits - first_index)]:
+				hit.update(self._details.get(hit['id'], {}))
+				self.hits.append(hit)
+				changed = True
+			self._next_page += 1
+
+		return changed
+
+	def _fetch_page(self, page:int) -> None:
+		with self._lock:
+			self._pending += 1
+		with priority(Priority.INTERACTIVE):
+			promise = _submit(search, self._query, type=self._type, year=self._year, page=page)
+		promise.add_done_callback(lambda promise: self._page_arrived(page, promise))
+
+	def _page_arrived(self, page:int, promise:futures.Future) -> None:
+		try:
+			hits, total = promise.result()
+		except Exception as e:
+			self._done(('error', page, e))
+			return
+
+		if page == 1 and hits:
+			self._page_size = len(hits)
+			num_pages = -(-min(total, self._max_hits)//self._page_size)
+			for more in range(2, num_pages + 1):
+				self._fetch_page(more)
+
+		# only as many as needed
+		first_index = (page - 1)*self._page_size
+		for hit in hits[:max(0, self._max_hits - first_index)]:
+			self._fetch_details(hit['id'])
+
+		self._done(('page', page, hits, total))
+
+	def _fetch_details(self, title_id:str) -> None:
+		with self._lock:
+			self._pending += 1
+		# the menu can do without them for a while
+		with priority(Priority.BACKGROUND):
+			promise = _submit(details, title_id, type=self._type)
+
+		def arrived(promise:futures.Future) -> None:
+			try:
+				self._done(('details', title_id, promise.result()))
+			except Exception as e:
+				self._done(('details', title_id, e))
+
+		promise.add_done_callback(arrived)
+
+	def _done(self, event:tuple) -> None:
+		with self._lock:
+			self._pending -= 1
+			self._events.put(event)
+
+
 __details:dict = {}
 _missing = object()
 
-def details(title_id:str|list[str]|Iterable, type='series') -> dict|None:
+# the API accepts at most this many items in 'append_to_response'
+_MAX_APPENDED = 20
+
+_append_to_response = True
+
+def set_append_to_response(enabled:bool) -> None:
+	"""
+	If enabled, details, external IDs, credits and seasons are fetched using TMDb's
+	'append_to_response', i.e. as few requests as possible. Otherwise, one request each.
+	"""
+	global _append_to_response
+	_append_to_response = bool(enabled)
+
+
+def details(title_id:str|list[str]|Iterable, type='series', max_age:int|None=None) -> dict|None:
 
 	if not _api_key:
 		raise NoAPIKey()
 
 	if isinstance(title_id, Iterable) and not isinstance(title_id, str):
-		wrapped_args:list = list(map(lambda I: ( (I,), {} ) , title_id))
+		wrapped_args:list = list(map(lambda I: ( (I,), {'max_age': max_age} ) , title_id))
 		return _parallel_query(details, wrapped_args)
 
+
 	data = __details.get(title_id, _missing)
 	if data is not _missing:
 		return data
@@ -193,96 +1022,125 @@ def details(title_id:str|list[str]|Iterable, type='series') -> dict|None:
 	if type == 'film':
 		detail_path = 'movie/%s' % title_id
 
-	with __get_executor() as executor:
+	if _append_to_response and type == 'series':
+		data = _query(_qurl(detail_path, {'append_to_response': 'external_ids,credits'}), max_age=max_age)
+		if not data:
+			return None
+
+		ext_id = data.pop('external_ids', None) or {}
+		credits = data.pop('credits', None) or {}
+
+	else:
 		promises = [
-			executor.submit(_query, _qurl(detail_path)),
-			executor.submit(_query, _qurl('tv/%s/external_ids' % title_id)),
-			executor.submit(_query, _qurl('tv/%s/credits' % title_id)),
+			_scheduler.submit(_query, _qurl(detail_path), max_age=max_age),
+			_scheduler.submit(_query, _qurl('tv/%s/external_ids' % title_id), max_age=max_age),
+			_scheduler.submit(_query, _qurl('tv/%s/credits' % title_id), max_age=max_age),
 		]
+		_scheduler.wait(promises)
 
-	# details
-	data = promises[0].result()
-	if not data:
-		#print('[tmdb] no details for %s' % title_id, file=sys.stderr)
-		return None
+		# details
+		data = promises[0].result()
+		if not data:
+			#print('[tmdb] no details for %s' % title_id, file=sys.stderr)
+			return None
 
-	# external IDs
-	ext_id = promises[1].result() or {}
+		ext_id = promises[1].result() or {}
+		credits = promises[2].result() or {}
+
+	data = _transform_details(data, ext_id, credits)
+
+	__details[title_id] = data
 
+	return data
+
+
+_details_schema = _Schema(
+	rename={
+		'name': 'title',
+		'first_air_date': 'date',
+		'last_air_date': 'end_date',
+		'original_name': 'original_title',
+		'original_language': 'language',
+		'origin_country': 'country',
+		'number_of_seasons': 'total_seasons',
+		'number_of_episodes': 'total_episodes',
+		'status': 'active_status',
+	},
+	drop=[
+		'backdrop_path',
+		'popularity',
+		'poster_path',
+		'vote_average',
+		'vote_count',
+		'production_companies',
+		'production_countries',
+		'homepage',
+		'in_production',
+		'languages',
+		'spoken_languages',
+		'last_episode_to_air',
+		'next_episode_to_air',
+		'networks',
+		'type',
+		'id',
+		'tagline',
+		'created_by',
+		'adult',
+		'episode_run_time',
+		'genres',
+		'seasons',
+	],
+	compute={
+		'year': lambda data: [int(data.get('first_air_date', [0]).split('-')[0])] if data.get('first_air_date') else None,
+		'country': lambda data: ', '.join(data.get('origin_country')),
+		'genre': lambda data: ', '.join(map(lambda g: g.get('name'), data.get('genres'))),
+		'active_status': lambda data: _map_status(data.get('status')) if 'status' in data else None,
+	},
+)
+
+def _transform_details(data:dict, ext_id:dict, credits:dict) -> dict:
 	imdb_id = ext_id.get('imdb_id') or None
 	if imdb_id:
 		data['imdb_id'] = imdb_id
 
 	if not _raw_output:
-		_rename_keys(data, {
-			'name': 'title',
-			'first_air_date': 'date',
-			'last_air_date': 'end_date',
-			'original_name': 'original_title',
-			'original_language': 'language',
-			'origin_country': 'country',
-			'number_of_seasons': 'total_seasons',
-			'number_of_episodes': 'total_episodes',
-		})
-		_del_keys(data, [
-			'backdrop_path',
-			'popularity',
-			'poster_path',
-			'vote_average',
-			'vote_count',
-			'production_companies',
-			'production_countries',
-			'homepage',
-			'in_production',
-			'languages',
-			'spoken_languages',
-			'last_episode_to_air',
-			'next_episode_to_air',
-			'networks',
-			'type',
-			'id',
-			'tagline',
-			'created_by',
-			'adult',
-			'episode_run_time',
-		])
-		_rename_keys(data, {'status': 'active_status'})
-		_set_values(data, {
-			'year': lambda _: [int(data.get('date', [0]).split('-')[0])] if data.get('date') else None,
-			'country': lambda _: ', '.join(data.get('country')),
-			'genre': lambda _: ', '.join(map(lambda g: g.get('name'), data.get('genres'))),
-			'active_status': lambda _: _map_status(data.get('active_status')) if 'active_status' in data else None,
-		})
-		_del_keys(data, ['genres'])
+		seasons:list[dict] = data.get('seasons') or []
+
+		data = _details_schema(data)
 
 		if data.get('active_status') in ('ended', 'canceled') and 'end_date' in data and 'year' in data:
 			data['year'] = data['year'] + [ int(data.get('end_date').split('-')[0]) ]
 		else:
-			del data['end_date']
+			data.pop('end_date', None)
 
-		_del_empty(data)
-
-		credits = promises[2].result() or {}
 		cast = credits.get('cast', [])
 		crew = credits.get('crew', [])
 
-		seasons:list[dict] = data.pop('seasons', [])
 		specials_info = list(filter(lambda season: season.get('season_number') == 0, seasons))
 		if specials_info:
 			data['specials'] = specials_info[0].get('episode_count', 1)
 
-		_set_values(data, {
-			'director': lambda ep: _job_people(crew, 'Director'),
-			'writer': lambda ep: _job_people(crew, 'Writer'),
-			'cast': lambda ep: list(map(lambda p: p.get('name') or '', cast))
-		})
-
-	__details[title_id] = data
+		for key, value in (
+			('director', _job_people(crew, 'Director')),
+			('writer', _job_people(crew, 'Writer')),
+			('cast', list(map(lambda p: p.get('name') or '', cast))),
+		):
+			if value:
+				data[key] = value
+			else:
+				data.pop(key, None)
 
 	return data
 
 
-def episodes(series_id:str|list[str]|Iterable, with_details=False, progress:Callable|None=None) -> list|tuple[dict, list]:
+def episodes(series_id:str|list[str]|Iterable, with_details=False, progress:Callable|None=None, max_age:int|None=None, stream:bool=False, season_hint:int|dict[str, int]|None=None) -> list|tuple[dict, list]|Iterator|None:
+	"""
+	Episodes of a series (optionally with its details).
+	None if any of its data could not be fetched (rather than returning partial data).
+	If 'stream', results of multiple series are yielded as (series ID, result), as they complete.
+	'season_hint' is the probable number of seasons (per series ID, for multiple series), e.g. as
+	previously stored; those seasons are then fetched at the same time as the details.
+	"""
 
 	if not _api_key:
 		raise NoAPIKey()
@@ -291,69 +1149,71 @@ def episodes(series_id:str|list[str]|Iterable, with_details=False, progress:Call
 		return []
 
 	if isinstance(series_id, Iterable) and not isinstance(series_id, str):
-		wrapped_args = map(lambda sid: ( (sid,), {'with_details': with_details} ), series_id)
+		hints = season_hint if isinstance(season_hint, dict) else {}
+		wrapped_args = map(lambda sid: ( (sid,), {'with_details': with_details, 'max_age': max_age, 'season_hint': hints.get(sid)} ), series_id)
+		if stream:
+			return _stream(_parallel_iter(episodes, wrapped_args, progress_callback=progress))
 		return _parallel_query(episodes, wrapped_args, progress_callback=progress)
 
-	# unfortunately we must synchronously get the main details first
-	ser_details = details(series_id, type='series') or {}
-
-	num_seasons = ser_details.get('total_seasons', 1)
-	has_specials = bool(ser_details.get('specials'))
-	standard_ep_runtime = ser_details.get('episode_run_time')
+	if isinstance(season_hint, dict):
+		season_hint = season_hint.get(series_id)
 
-	def fetch_season(season):
-		data = _query(_qurl('tv/%s/season/%d' % (series_id, season))) or {}
-
-		data = data.get('episodes', [])
-
-		if not _raw_output:
-			_rename_keys(data, {
-				'name': 'title',
-				'first_air_date': 'date',
-				'original_name': 'original_title',
-				'original_language': 'language',
-				'origin_country': 'country',
-				'air_date': 'date',
-				'season_number': 'season',
-				'episode_number': 'episode',
-				'episode_type': 'finale',
-			})
-			_set_values(data, {
-				'director': lambda ep: _job_people(ep.get('crew', []), 'Director'),
-				'writer': lambda ep: _job_people(ep.get('crew', []), 'Writer'),
-				'guest_cast': lambda ep: list(map(lambda p: p.get('name') or '', ep.get('guest_stars', []))),
-				'season': lambda ep: 'S' if ep.get('season') == 0 else ep.get('season'),
-				'finale': lambda ep: None if (ep.get('finale') == 'standard' or ep.get('season') == 'S') else ep.get('finale').replace('mid_season', 'mid-season'),
-			})
-			_del_keys(data, [
-				'id',
-				'show_id',
-				'still_path',
-				'crew',
-				'guest_stars',
-				'production_code',
-				'vote_average',
-				'vote_count',
-			])
-			_del_empty(data)
 
-		return data
+	series = _fetch_series(series_id, max_age=max_age, season_hint=season_hint)
+	if series is None:
+		debug('tmdb: failed fetching series %s' % series_id)
+		return None
 
-	# then fetch all the seasons, in parallel
-	with __get_executor() as executor:
-		promises = [
-			executor.submit(fetch_season, season)
-			for season in range(1, num_seasons + 1)
-		]
-		if has_specials:
-			promises.append(executor.submit(fetch_season, 0))
+	ser_details, seasons = series
 
 	all_episodes = [
 		episode
-		for promise in promises
-		for episode in promise.result()
+		for season_episodes in seasons.values()
+		for episode in season_episodes
 	]
 
+	finalize_episodes(ser_details, all_episodes)
+
+	if with_details:
+		return ser_details, all_episodes
+
+	return all_episodes
+
+
+def seasons(series_id:str|dict[str, list[int]], season_numbers:list[int]|None=None, progress:Callable|None=None, max_age:int|None=None, stream:bool=False) -> tuple[dict, dict[int, list]]|list|Iterator|None:
+	"""
+	Details of a series and the episodes of only the specified seasons (e.g. the ones that changed),
+	per season number. To get several series, pass a dict of series ID -> season numbers.
+	None if any of its data could not be fetched.
+	If 'stream', results of multiple series are yielded as (series ID, result), as they complete.
+	"""
+
+	if not _api_key:
+		raise NoAPIKey()
+
+	if isinstance(series_id, dict):
+		wrapped_args = map(lambda item: ( item, {'max_age': max_age} ), series_id.items())
+		if stream:
+			return _stream(_parallel_iter(seasons, wrapped_args, progress_callback=progress))
+		return _parallel_query(seasons, wrapped_args, progress_callback=progress)
+
+
+	series = _fetch_series(series_id, season_numbers, max_age=max_age)
+	if series is None:
+		debug('tmdb: failed fetching seasons %s of series %s' % (season_numbers, series_id))
+
+	return series
+
+
+def _stream(results:Iterable) -> Iterator:
+	# (series ID, result) as they complete
+	for _, args, res in results:
+		yield args[0], res
+
+
+def finalize_episodes(ser_details:dict, all_episodes:list[dict]) -> None:
+	"""Mark season and series finales, and set missing runtimes, of all episodes of a series (in order)."""
+
 	last_season = 0
 	last_episode:dict|None = None
 	season = None
@@ -372,17 +1232,225 @@ def episodes(series_id:str|list[str]|Iterable, with_details=False, progress:Call
 	elif last_episode:
 		last_episode.pop('finale', None)
 
-
 	# set runtime of each episode, if needed and known
+	standard_ep_runtime = ser_details.get('episode_run_time')
 	if standard_ep_runtime:
 		for ep in all_episodes:
 			if not ep.get('runtime'):
 				ep['runtime'] = standard_ep_runtime
 
-	if with_details:
-		return ser_details, all_episodes
 
-	return all_episodes
+def _season_numbers(ser_details:dict) -> list[int]:
+	# regular seasons first, specials (season 0) last
+	num_seasons = ser_details.get('total_seasons', 1)
+	season_numbers = list(range(1, num_seasons + 1))
+	if ser_details.get('specials'):
+		season_numbers.append(0)
+
+	return season_numbers
+
+
+def _fetch_series(series_id:str, only_seasons:list[int]|None=None, max_age:int|None=None, season_hint:int|None=None) -> tuple[dict, dict[int, list[dict]]]|None:
+	# 'season_hint': the probable number of seasons, to fetch them without waiting for the details
+	if _append_to_response:
+		return _series_appended(series_id, only_seasons, max_age=max_age, season_hint=season_hint)
+
+	return _series_separate(series_id, only_seasons, max_age=max_age, season_hint=season_hint)
+
+
+def _expected_seasons(only_seasons:list[int]|None, season_hint:int|None) -> list[int]:
+	# seasons that can be fetched before the details confirm which exist
+	if only_seasons is not None:
+		return list(only_seasons)
+	if season_hint:
+		# specials are common enough
+		return list(range(1, season_hint + 1)) + [0]
+	return []
+
+
+def _series_separate(series_id:str, only_seasons:list[int]|None=None, max_age:int|None=None, season_hint:int|None=None) -> tuple[dict, dict[int, list[dict]]]|None:
+	# the seasons we can guess are fetched at the same time as the details
+	speculative = {
+		season: _scheduler.submit(_fetch_season, series_id, season, max_age=max_age)
+		for season in _expected_seasons(only_seasons, season_hint)
+	}
+
+	ser_details = details(series_id, type='series', max_age=max_age)
+	if ser_details is None:
+		return None
+
+	season_numbers = [
+		season
+		for season in _season_numbers(ser_details)
+		if only_seasons is None or season in only_seasons
+	]
+
+	# then the rest of the seasons, in parallel (guessed seasons that don't exist are dropped)
+	promises = [
+		speculative.get(season) or _scheduler.submit(_fetch_season, series_id, season, max_age=max_age)
+		for season in season_numbers
+	]
+	_scheduler.wait(promises)
+
+	seasons = [promise.result() for promise in promises]
+	if None in seasons:
+		return None
+
+	if speculative:
+		debug('tmdb: series %s: %d/%d seasons guessed' % (series_id, len(set(speculative) & set(season_numbers)), len(season_numbers)))
+
+	return ser_details, dict(zip(season_numbers, seasons))
+
+
+def _series_appended(series_id:str, only_seasons:list[int]|None=None, max_age:int|None=None, season_hint:int|None=None) -> tuple[dict, dict[int, list[dict]]]|None:
+	# details, external IDs, credits and as many seasons as possible in one go (including specials)
+	if only_seasons is None and not season_hint:
+		# nothing known about the series: as many seasons as fit
+		first_seasons = list(range(0, _MAX_APPENDED - 2))
+	else:
+		first_seasons = _expected_seasons(only_seasons, season_hint)[:_MAX_APPENDED - 2]
+
+	# seasons that don't fit are fetched at the same time, if we can guess them
+	speculative = _submit_appended(series_id, [
+		season
+		for season in _expected_seasons(only_seasons, season_hint)
+		if season not in first_seasons
+	], max_age=max_age)
+
+	appended = ['external_ids', 'credits'] + [
+		'season/%d' % season
+		for season in first_seasons
+	]
+	data = _query(_qurl('tv/%s' % series_id, {'append_to_response': ','.join(appended)}), max_age=max_age)
+	if not data:
+		return None
+
+	raw_seasons = _pop_appended_seasons(data)
+	ext_id = data.pop('external_ids', None) or {}
+	credits = data.pop('credits', None) or {}
+
+	ser_details = _transform_details(data, ext_id, credits)
+	__details[series_id] = ser_details
+
+	season_numbers = [
+		season
+		for season in _season_numbers(ser_details)
+		if only_seasons is None or season in only_seasons
+	]
+
+	# the remaining seasons, if any (guessed seasons that don't exist are dropped)
+	missing = [season for season in season_numbers if season not in raw_seasons]
+	promises = [
+		promise
+		for seasons, promise in speculative
+		if set(seasons) & set(missing)
+	]
+	requested = set(first_seasons) | set(season for seasons, _ in speculative for season in seasons)
+	promises.extend(promise for _, promise in _submit_appended(series_id, [
+		season
+		for season in missing
+		if season not in requested
+	], max_age=max_age))
+	_scheduler.wait(promises)
+
+	for promise in promises:
+		data = promise.result()
+		if not data:
+			return None
+		raw_seasons.update(_pop_appended_seasons(data))
+
+	seasons = {
+		season: _transform_season(raw_seasons[season])
+		for season in season_numbers
+		if season in raw_seasons
+	}
+
+	# seasons requested but missing from the response (e.g. failed on TMDb's side) on their own
+	absent = {
+		season: _scheduler.submit(_fetch_season, series_id, season, max_age=max_age)
+		for season in season_numbers
+		if season not in seasons
+	}
+	_scheduler.wait(absent.values())
+
+	for season, promise in absent.items():
+		seasons[season] = promise.result()
+		if seasons[season] is None:
+			return None
+
+	return ser_details, {
+		season: seasons[season]
+		for season in season_numbers
+	}
+
+
+def _submit_appended(series_id:str, seasons:list[int], max_age:int|None=None) -> list[tuple[list[int], futures.Future]]:
+	# fetch 'seasons' appended to the details, as few requests as possible
+	batches = [
+		seasons[idx: idx + _MAX_APPENDED]
+		for idx in range(0, len(seasons), _MAX_APPENDED)
+	]
+	return [
+		(batch, _scheduler.submit(_query, _qurl('tv/%s' % series_id, {
+			'append_to_response': ','.join('season/%d' % season for season in batch),
+		}), max_age=max_age))
+		for batch in batches
+	]
+
+
+def _pop_appended_seasons(data:dict) -> dict[int, dict]:
+	return {
+		int(key.split('/', 1)[1]): data.pop(key)
+		for key in list(data.keys())
+		if key.startswith('season/')
+	}
+
+
+def _fetch_season(series_id:str, season:int, max_age:int|None=None) -> list[dict]|None:
+	data = _query(_qurl('tv/%s/season/%d' % (series_id, season)), max_age=max_age)
+	if data is None:
+		return None
+	return _transform_season(data)
+
+
+_episode_schema = _Schema(
+	rename={
+		'name': 'title',
+		'first_air_date': 'date',
+		'original_name': 'original_title',
+		'original_language': 'language',
+		'origin_country': 'country',
+		'air_date': 'date',
+		'season_number': 'season',
+		'episode_number': 'episode',
+		'episode_type': 'finale',
+	},
+	drop=[
+		'id',
+		'show_id',
+		'still_path',
+		'crew',
+		'guest_stars',
+		'production_code',
+		'vote_average',
+		'vote_count',
+	],
+	compute={
+		'director': lambda ep: _job_people(ep.get('crew', []), 'Director'),
+		'writer': lambda ep: _job_people(ep.get('crew', []), 'Writer'),
+		'guest_cast': lambda ep: list(map(lambda p: p.get('name') or '', ep.get('guest_stars', []))),
+		'season': lambda ep: 'S' if ep.get('season_number') == 0 else ep.get('season_number'),
+		'finale': lambda ep: None if (ep.get('episode_type') == 'standard' or ep.get('season_number') == 0) else ep.get('episode_type').replace('mid_season', 'mid-season'),
+	},
+)
+
+def _transform_season(data:dict) -> list[dict]:
+	episodes = data.get('episodes', [])
+
+	if not _raw_output:
+		episodes = _episode_schema.all(episodes)
+
+	return episodes
 
 
 def changes(series_id:str|list[str], after:datetime|None, include:list|tuple|None=None, progress:Callable|None=None) -> list:
@@ -394,14 +1462,15 @@ def changes(series_id:str|list[str], after:datetime|None, include:list|tuple|Non
 		wrapped_args = map(lambda sid: ( (sid, after), {'include': include} ), series_id)
 		return _parallel_query(changes, wrapped_args, progress_callback=progress)
 
+
 	now = date.today().isoformat()
 	if after:
 		after_str = after.date().isoformat()
 	else:
 		after_str = (date.today() + timedelta(days=-14)).isoformat()
 
+	# changes of a single series are not paged (unlike the global list, see changed_series())
 	data = _query(_qurl('tv/%s/changes' % series_id, {'start_date': after_str, 'end_date': now}))
-	# TOOD: get all pages
 
 	change_list = (data or {}).get('changes', [])
 
@@ -418,6 +1487,56 @@ def changes(series_id:str|list[str], after:datetime|None, include:list|tuple|Non
 	return change_list
 
 
+# the global changes list only covers this many days
+MAX_CHANGES_WINDOW = timedelta(days=14)
+
+def changed_series(after:datetime, max_pages:int|None=None) -> set[str]|None:
+	"""
+	IDs of all series changed since 'after', according to TMDb's global changes list.
+	None if that's not possible, i.e. the window is too long or a page could not be fetched,
+	or not worth it: the list has more than 'max_pages' pages (only the first is fetched).
+	"""
+	if _qurl is None:
+		return None
+
+	if datetime.now() - after > MAX_CHANGES_WINDOW:
+		return None
+
+
+	query = {
+		'start_date': after.date().isoformat(),
+		'end_date': date.today().isoformat(),
+	}
+
+	first = _query(_qurl('tv/changes', { **query, 'page': 1 }))
+	if first is None:
+		return None
+
+	if max_pages is not None and first.get('total_pages', 1) > max_pages:
+		debug('tmdb: changed series since %s: %d pages, more than %d' % (query['start_date'], first.get('total_pages', 1), max_pages))
+		return None
+
+	# the first page tells how many there are; get the rest in parallel
+	promises = [
+		_scheduler.submit(_query, _qurl('tv/changes', { **query, 'page': page }))
+		for page in range(2, first.get('total_pages', 1) + 1)
+	]
+	_scheduler.wait(promises)
+
+	pages = [first] + [promise.result() for promise in promises]
+	if None in pages:
+		return None
+
+	debug('tmdb: changed series since %s: %d pages' % (query['start_date'], len(pages)))
+
+	return {
+		str(item['id'])
+		for page in pages
+		for item in page.get('results', [])
+		if 'id' in item
+	}
+
+
 # def posters(series_id:str, season:int|list[int]|tuple[int]|None, language:str|None=None) -> dict:
 # 	# 'season' = None: only main posters for the series
 # 	# 'season' = 1: all posters for the specified season
@@ -547,9 +1666,52 @@ def _set_values(data, new_values):
 				print('_set_values: "%s":' % key, str(e), file=sys.stderr)
 
 
-def _parallel_query(func:Callable, arg_list:list|map, progress_callback:Callable|None=None):
+def _submit(func:Callable, *args, **kw) -> futures.Future:
+	# run lookup function 'func' in the background
+	return _scheduler.submit(func, *args, **kw)
+
+
+def _parallel_query(func:Callable, arg_list:list|map, progress_callback:Callable|None=None) -> list:
+	results = _parallel_iter(func, arg_list, progress_callback)
+
+	ordered:list = [None]*len(results)
+	for idx, _, res in results:
+		ordered[idx] = res
+
+	return ordered
+
+
+class _Results:
+	# results of parallel queries, as they complete (see _parallel_iter())
+	def __init__(self, promises:list, arg_list:list):
+		self._promises = promises
+		self._arg_list = arg_list
+
+	def __len__(self) -> int:
+		return len(self._promises)
+
+	def __iter__(self):
+		index = { id(promise): idx for idx, promise in enumerate(self._promises) }
+
+		for promise in _scheduler.as_completed(self._promises):
+			idx = index[id(promise)]
+			try:
+				res = promise.result()
+			except requests.exceptions.ConnectionError as ce:
+				raise NetworkError(str(ce))
+
+			yield idx, self._arg_list[idx][0], res
+
+
+def _parallel_iter(func:Callable, arg_list:list|map, progress_callback:Callable|None=None) -> _Results:
+	"""
+	Run 'func' for each of 'arg_list' in parallel.
+	The returned object yields (index, args, result) as each call completes;
+	all calls are scheduled immediately, i.e. before iterating.
+	"""
 
 	completed = 0
+	completed_lock = threading.Lock()
 
 	def func_wrap(idx, *args, **kw):
 		t0 = time.time()
@@ -559,23 +1721,19 @@ def _parallel_query(func:Callable, arg_list:list|map, progress_callback:Callable
 		duration = time.time() - t0
 		if progress_callback:
 			nonlocal completed
-			completed += 1
-			progress_callback(completed, idx, duration, args)
+			with completed_lock:
+				completed += 1
+				progress_callback(completed, idx, duration, args)
 		return res
 
-	with __get_executor() as executor:
-		promises = [
-			executor.submit(func_wrap, idx, *args, **kw)
-			for idx, (args, kw) in enumerate(arg_list)
-		]
+	arg_list = list(arg_list)
+	promises = [
+		_scheduler.submit(func_wrap, idx, *args, **kw)
+		for idx, (args, kw) in enumerate(arg_list)
+	]
+	debug('tmdb: %s x%d scheduled: %s' % (func.__name__, len(promises), _scheduler.stats()))
 
-	try:
-		return [
-			p.result()
-			for p in promises
-		]
-	except requests.exceptions.ConnectionError as ce:
-		raise NetworkError(str(ce))
+	return _Results(promises, arg_list)
 
 
 
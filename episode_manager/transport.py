@@ -0,0 +1,416 @@
+"""
+Pluggable transports for TMDb requests (see tmdb.set_transport()), to use the
+TMDb client without a network connection or an API key:
+
+- Recorder: performs requests over HTTP and saves the responses as fixtures
+- Replayer: serves recorded fixtures, with optional artificial latency
+- SyntheticAPI: generates (deterministic) responses for the endpoints 'epm' uses
+- StandInServer: serves any of these over HTTP on localhost (see tmdb.set_api_root())
+
+Run as 'python -m episode_manager.transport' to start a stand-in server.
+"""
+import sys
+import os
+import io
+import time
+import random
+import hashlib
+import threading
+from os.path import join as pjoin
+from tempfile import mkstemp
+from datetime import date, timedelta
+from urllib.parse import urlsplit, parse_qs
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from requests.structures import CaseInsensitiveDict
+
+from . import tmdb
+from .config import debug
+from .utils import decode_json, encode_json
+
+# response headers worth keeping in fixtures
+_RECORDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Retry-After')
+
+
+class Response:
+	# the parts of requests.Response that 'tmdb' uses
+	def __init__(self, url:str, status_code:int, headers:CaseInsensitiveDict|dict, content:bytes):
+		self.url = url
+		self.status_code = status_code
+		self.headers = CaseInsensitiveDict(headers)
+		self.content = content
+
+
+def _not_found(url:str) -> Response:
+	body = encode_json({
+		'success': False,
+		'status_code': 34,
+		'status_message': 'The resource you requested could not be found.',
+	})
+	return Response(url, HTTPStatus.NOT_FOUND, {'Content-Type': 'application/json'}, body)
+
+
+class _Latency:
+	# artificial latency: 'latency' seconds, +/- 'jitter'
+	def __init__(self, latency:float, jitter:float):
+		self._latency = latency
+		self._jitter = jitter
+
+	def wait(self) -> None:
+		delay = self._latency + random.uniform(-self._jitter, self._jitter)
+		if delay > 0:
+			time.sleep(delay)
+
+
+class HTTPTransport:
+	"""Requests over HTTP, using the TMDb client's sessions (the default transport)."""
+
+	def get(self, url:str, headers:dict|None=None, timeout:float|None=None) -> Response:
+		with tmdb._sessions.session() as session:
+			return session.get(url, headers=headers, timeout=timeout)  # type: ignore  # same interface
+
+
+class Recorder:
+	"""Performs requests using 'transport' (default over HTTP), saving the responses in directory 'path'."""
+
+	def __init__(self, path:str, transport=None):
+		self._path = path
+		self._transport = transport or HTTPTransport()
+		os.makedirs(path, exist_ok=True)
+
+	def get(self, url:str, headers:dict|None=None, timeout:float|None=None) -> Response:
+		resp = self._transport.get(url, headers=headers, timeout=timeout)
+
+		# only complete responses; e.g. 304 is specific to our cache
+		if resp.status_code in (HTTPStatus.OK, HTTPStatus.NOT_FOUND):
+			_save_fixture(self._path, tmdb._cache_key(url), resp)
+
+		return resp
+
+
+class Replayer:
+	"""Serves the responses recorded in directory 'path'; unknown requests are not found (404)."""
+
+	def __init__(self, path:str, latency:float=0, jitter:float=0):
+		self._path = path
+		self._latency = _Latency(latency, jitter)
+
+	def get(self, url:str, headers:dict|None=None, timeout:float|None=None) -> Response:
+		self._latency.wait()
+
+		key = tmdb._cache_key(url)
+		resp = _load_fixture(self._path, key, url)
+		if resp is None:
+			debug('transport: no fixture for: %s' % key)
+			return _not_found(url)
+
+		return resp
+
+
+def _fixture_path(path:str, key:str) -> str:
+	return pjoin(path, '%s.json' % hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+def _save_fixture(path:str, key:str, resp) -> None:
+	fixture = {
+		'key': key,
+		'status': resp.status_code,
+		'headers': {
+			name: resp.headers[name]
+			for name in _RECORDED_HEADERS
+			if name in resp.headers
+		},
+		'body': resp.content.decode('utf-8'),
+	}
+
+	tmp_name = mkstemp(dir=path)[1]
+	try:
+		with io.open(tmp_name, 'wb') as fp:
+			fp.write(encode_json(fixture))
+		os.rename(tmp_name, _fixture_path(path, key))
+	except OSError as e:
+		debug('transport: failed saving fixture %s: %s' % (key, e))
+		os.remove(tmp_name)
+
+def _load_fixture(path:str, key:str, url:str) -> Response|None:
+	try:
+		with io.open(_fixture_path(path, key), 'rb') as fp:
+			fixture = decode_json(fp.read())
+	except FileNotFoundError:
+		return None
+
+	if fixture.get('key') != key:
+		return None
+
+	return Response(url, fixture['status'], fixture.get('headers', {}), fixture['body'].encode('utf-8'))
+
+
+class SyntheticAPI:
+	"""
+	Generates TMDb-like responses for 'num_series' series (IDs 1..num_series), with
+	between 'seasons' (min, max) seasons each. The same series ID always results in the
+	same data; air dates are relative to 'today', so some episodes are always upcoming.
+	Series in 'changed' are reported by the changes endpoints.
+	"""
+	def __init__(self, num_series:int=1000, seasons:tuple[int, int]=(1, 8), episodes:tuple[int, int]=(6, 13),
+			latency:float=0, jitter:float=0, today:date|None=None, changed:set[str]|None=None):
+		self.num_series = num_series
+		self._seasons = seasons
+		self._episodes = episodes
+		self._latency = _Latency(latency, jitter)
+		self._today = today or date.today()
+		self.changed = changed or set()
+
+	def get(self, url:str, headers:dict|None=None, timeout:float|None=None) -> Response:
+		self._latency.wait()
+
+		parts = urlsplit(url)
+		path = parts.path.split('/3/', 1)[-1].strip('/').split('/')
+		query = { name: values[0] for name, values in parse_qs(parts.query).items() }
+
+		data = self.data(path, query)
+		if data is None:
+			return _not_found(url)
+
+		return Response(url, HTTPStatus.OK, {'Content-Type': 'application/json'}, encode_json(data))
+
+	def data(self, path:list[str], query:dict[str, str]) -> dict|None:
+		"""The (decoded) response of an endpoint, e.g. ['tv', '42', 'season', '1']; None if not found."""
+
+		if path == ['search', 'tv']:
+			return self._search(query.get('query', ''), int(query.get('page', 1)))
+
+		if path == ['tv', 'changes']:
+			return self._paged([ {'id': int(series_id), 'adult': False} for series_id in sorted(self.changed) ], int(query.get('page', 1)), 100)
+
+		if len(path) < 2 or path[0] != 'tv' or not self._exists(path[1]):
+			return None
+
+		series_id = int(path[1])
+		rest = path[2:]
+
+		if not rest:
+			data = self.series(series_id)
+			for item in query.get('append_to_response', '').split(','):
+				appended = self.data(['tv', path[1]] + item.split('/'), {}) if item else None
+				if appended is not None:
+					data[item] = appended
+			return data
+
+		if rest == ['external_ids']:
+			return { 'id': series_id, 'imdb_id': 'tt%07d' % series_id, 'tvdb_id': series_id }
+
+		if rest == ['credits']:
+			return {
+				'id': series_id,
+				'cast': [ {'name': 'Actor %d' % n, 'character': 'Role %d' % n} for n in range(1, 6) ],
+				'crew': [ {'job': 'Executive Producer', 'name': 'Producer %d' % series_id} ],
+			}
+
+		if rest == ['changes']:
+			if path[1] not in self.changed:
+				return { 'changes': [] }
+			return { 'changes': [
+				{ 'key': 'season', 'items': [ {'value': {'season_number': self._num_seasons(series_id)}} ] },
+			] }
+
+		if len(rest) == 2 and rest[0] == 'season' and rest[1].isdigit():
+			season = int(rest[1])
+			if season > self._num_seasons(series_id):
+				return None
+			return self.season(series_id, season)
+
+		return None
+
+	def series(self, series_id:int) -> dict:
+		num_seasons = self._num_seasons(series_id)
+		returning = series_id % 2 == 0
+		episode_counts = [ self._num_episodes(series_id, season) for season in range(num_seasons + 1) ]
+
+		first_aired = self._air_date(series_id, 1, 1)
+		last_aired = self._air_date(series_id, num_seasons, episode_counts[-1])
+
+		return {
+			'id': series_id,
+			'name': 'Series %d' % series_id,
+			'original_name': 'Series %d' % series_id,
+			'first_air_date': first_aired.isoformat(),
+			'last_air_date': min(last_aired, self._today).isoformat(),
+			'status': 'Returning Series' if returning else 'Ended',
+			'in_production': returning,
+			'origin_country': ['US'],
+			'original_language': 'en',
+			'genres': [ {'id': 18, 'name': 'Drama'} ],
+			'number_of_seasons': num_seasons,
+			'number_of_episodes': sum(episode_counts[1:]),
+			'overview': 'Synthetic series number %d.' % series_id,
+			'popularity': 1000.0/series_id,
+			'vote_average': 7.5,
+			'vote_count': series_id,
+			'seasons': [
+				{ 'season_number': season, 'episode_count': count, 'name': 'Season %d' % season }
+				for season, count in enumerate(episode_counts)
+			],
+		}
+
+	def season(self, series_id:int, season:int) -> dict:
+		num_episodes = self._num_episodes(series_id, season)
+		return {
+			'id': series_id*1000 + season,
+			'season_number': season,
+			'name': 'Season %d' % season,
+			'episodes': [
+				{
+					'id': (series_id*1000 + season)*100 + episode,
+					'name': 'Episode %d' % episode,
+					'overview': 'Things happen.',
+					'air_date': self._air_date(series_id, season, episode).isoformat(),
+					'season_number': season,
+					'episode_number': episode,
+					'episode_type': 'finale' if episode == num_episodes else 'standard',
+					'runtime': 45,
+					'crew': [ {'job': 'Director', 'name': 'Director %d' % episode}, {'job': 'Writer', 'name': 'Writer %d' % season} ],
+					'guest_stars': [ {'name': 'Guest %d' % episode} ],
+					'vote_average': 7.0,
+					'vote_count': 10,
+				}
+				for episode in range(1, num_episodes + 1)
+			],
+		}
+
+	def _search(self, text:str, page:int) -> dict:
+		text = text.lower()
+		hits = [
+			{
+				'id': series_id,
+				'name': 'Series %d' % series_id,
+				'first_air_date': self._air_date(series_id, 1, 1).isoformat(),
+				'origin_country': ['US'],
+				'overview': 'Synthetic series number %d.' % series_id,
+				'genre_ids': [18],
+				'popularity': 1000.0/series_id,
+			}
+			for series_id in range(1, self.num_series + 1)
+			if text in ('series %d' % series_id)
+		]
+		return self._paged(hits, page, 20)
+
+	def _paged(self, results:list, page:int, page_size:int) -> dict:
+		return {
+			'page': page,
+			'results': results[(page - 1)*page_size: page*page_size],
+			'total_results': len(results),
+			'total_pages': max(1, (len(results) + page_size - 1)//page_size),
+		}
+
+	def _exists(self, series_id:str) -> bool:
+		return series_id.isdigit() and 1 <= int(series_id) <= self.num_series
+
+	def _num_seasons(self, series_id:int) -> int:
+		return random.Random(series_id).randint(*self._seasons)
+
+	def _num_episodes(self, series_id:int, season:int) -> int:
+		if season == 0:
+			return 1
+		return random.Random(series_id*1000 + season).randint(*self._episodes)
+
+	def _air_date(self, series_id:int, season:int, episode:int) -> date:
+		# seasons air yearly, episodes weekly; the last season of returning series is currently airing
+		num_seasons = self._num_seasons(series_id)
+		last_season_start = self._today - timedelta(weeks=2 if series_id % 2 == 0 else 60)
+		season_start = last_season_start - timedelta(days=365*(num_seasons - max(1, season)))
+		return season_start + timedelta(weeks=episode - 1)
+
+
+class StandInServer:
+	"""
+	Serves requests using 'transport' (e.g. Replayer or SyntheticAPI) over HTTP/1.1 on localhost.
+	Point the client at 'root' (see tmdb.set_api_root()). If 'chunk_size', bodies are sent chunked.
+	"""
+	def __init__(self, transport, port:int=0, chunk_size:int|None=None):
+		self.num_connections = 0
+		self.num_requests = 0
+		server = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+
+			def setup(self):
+				super().setup()
+				server.num_connections += 1
+
+			def do_GET(self):
+				server.num_requests += 1
+				resp = transport.get('http://localhost%s' % self.path)
+
+				self.send_response(resp.status_code)
+				for name, value in resp.headers.items():
+					self.send_header(name, value)
+
+				if chunk_size:
+					self.send_header('Transfer-Encoding', 'chunked')
+					self.end_headers()
+					for idx in range(0, len(resp.content), chunk_size):
+						chunk = resp.content[idx: idx + chunk_size]
+						self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+					self.wfile.write(b'0\r\n\r\n')
+				else:
+					self.send_header('Content-Length', str(len(resp.content)))
+					self.end_headers()
+					self.wfile.write(resp.content)
+
+			def log_message(self, *args):
+				pass
+
+		class Server(ThreadingHTTPServer):
+			# many concurrent connects (the default backlog is 5)
+			request_queue_size = 128
+			daemon_threads = True
+
+		self._httpd = Server(('127.0.0.1', port), Handler)
+		self._thread:threading.Thread|None = None
+
+		self.root = 'http://127.0.0.1:%d/3' % self._httpd.server_address[1]
+
+	def start(self) -> 'StandInServer':
+		self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), name='tmdb-stand-in', daemon=True)
+		self._thread.start()
+		return self
+
+	def serve_forever(self) -> None:
+		self._httpd.serve_forever()
+
+	def close(self) -> None:
+		if self._thread is not None:
+			self._httpd.shutdown()
+			self._thread = None
+		self._httpd.server_close()
+
+
+def main(args:list[str]) -> None:
+	import argparse
+
+	parser = argparse.ArgumentParser(prog='python -m episode_manager.transport', description='Local stand-in server for the TMDb API.')
+	parser.add_argument('--port', type=int, default=8642)
+	parser.add_argument('--replay', metavar='DIR', help='serve recorded fixtures (default: synthetic data)')
+	parser.add_argument('--series', type=int, default=1000, help='number of synthetic series')
+	parser.add_argument('--latency', type=float, default=0, help='artificial latency (seconds)')
+	parser.add_argument('--jitter', type=float, default=0, help='random variation of the latency (seconds)')
+	opts = parser.parse_args(args)
+
+	if opts.replay:
+		transport = Replayer(opts.replay, latency=opts.latency, jitter=opts.jitter)
+	else:
+		transport = SyntheticAPI(opts.series, latency=opts.latency, jitter=opts.jitter)
+
+	server = StandInServer(transport, port=opts.port)
+	print('Serving on %s (set EPM_TMDB_API_ROOT to use it)' % server.root, file=sys.stderr)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.close()
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
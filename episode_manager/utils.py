@@ -39,6 +39,19 @@ def json_serializer() -> str:
 	return 'json'
 
 
+def decode_json(data:bytes|str) -> Any:
+	if orjson is not None:
+		return orjson.loads(data)
+	return json.loads(data)
+
+
+def encode_json(data:Any) -> bytes:
+	# compact
+	if orjson is not None:
+		return orjson.dumps(data)
+	return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
 def warning_prefix(context_name:str|None=None) -> str:
 	if context_name is not None:
 		return f'{_c}[{_00}{_b}{PRG} {context_name}{_c}]{_00}'
@@ -120,6 +133,29 @@ def write_json(filepath:str, data:Any) -> Exception|None:
 	return None
 
 
+# size of the pieces written by dump_json()
+_DUMP_CHUNK_SIZE = 256*1024
+
+def dump_json(data:Any, fp) -> None:
+	"""Write 'data' as (indented) JSON to a binary file object, in pieces."""
+	if orjson is not None:
+		fp.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+		return
+
+	chunk:list[str] = []
+	size = 0
+	for part in json.JSONEncoder(indent=2, sort_keys=True).iterencode(data):
+		chunk.append(part)
+		size += len(part)
+		if size >= _DUMP_CHUNK_SIZE:
+			fp.write(''.join(chunk).encode('utf-8'))
+			chunk.clear()
+			size = 0
+
+	if chunk:
+		fp.write(''.join(chunk).encode('utf-8'))
+
+
 def print_json(o:dict) -> None:
 	if orjson is not None:
 		s = str(orjson.dumps(o, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS), 'utf-8')
@@ -0,0 +1,47 @@
+"""
+Offline benchmark of fetching series (as when adding or refreshing them), using
+synthetic TMDb responses with artificial latency, in-process and via a local
+stand-in server.
+
+Run: python test/bench_lookup.py [num series] [latency (seconds)]
+"""
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from episode_manager import tmdb
+from episode_manager.transport import SyntheticAPI, StandInServer
+
+
+def main(args:list[str]) -> None:
+	num_series = int(args[0]) if args else 50
+	latency = float(args[1]) if len(args) > 1 else 0.05
+
+	tmdb.set_api_key('offline')
+	tmdb.set_rate_limit(10000)
+
+	api = SyntheticAPI(num_series, latency=latency, jitter=latency/2)
+	series_ids = [ str(series_id) for series_id in range(1, num_series + 1) ]
+
+	def measure(name:str) -> None:
+		tmdb.__dict__['__details'].clear()
+		t0 = time.monotonic()
+		results = tmdb.episodes(series_ids, with_details=True)
+		duration = time.monotonic() - t0
+		num_episodes = sum(len(res[1]) for res in results if res)
+		print('%-24s %6.2f s  (%d series, %d episodes)' % (name, duration, num_series, num_episodes))
+
+	tmdb.set_transport(api)
+	measure('in-process')
+	tmdb.set_transport(None)
+
+	server = StandInServer(api).start()
+	tmdb.set_api_root(server.root)
+	measure('stand-in server')
+	server.close()
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
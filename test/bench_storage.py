@@ -0,0 +1,90 @@
+"""
+Benchmark of the database storage backends (JSON with series files or a pack
+file, and SQLite), using a library of synthetic series: loading the database,
+reading one series (show), marking an episode (load, change, save) and
+collecting the episodes of the next two weeks (calendar).
+
+Run: python test/bench_storage.py [num series]
+"""
+import sys
+import os
+import time
+import shutil
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from episode_manager import db, config, tmdb
+from episode_manager.transport import SyntheticAPI
+
+
+def main(args:list[str]) -> None:
+	num_series = int(args[0]) if args else 300
+	repeat = 5
+
+	tmdb.set_api_key('offline')
+	tmdb.set_rate_limit(10000)
+	tmdb.set_transport(SyntheticAPI(num_series))
+	library = {}
+	for series_id, result in zip(map(str, range(1, num_series + 1)), tmdb.episodes([ str(n) for n in range(1, num_series + 1) ], with_details=True)):
+		details, episodes = result
+		library[series_id] = { **details, 'episodes': episodes }
+	tmdb.set_transport(None)
+
+	print('%d series, %d episodes' % (num_series, sum(len(series['episodes']) for series in library.values())))
+
+	for storage, series_storage in (('json', 'files'), ('json', 'pack'), ('sqlite', 'files')):
+		path = tempfile.mkdtemp()
+		config.set('paths/series-db', os.path.join(path, 'series'), store=config.Store.Memory)
+		config.set('paths/series-cache', os.path.join(path, 'cache'), store=config.Store.Memory)
+		config.set('storage', 'json', store=config.Store.Memory)
+
+		database = db.load()
+		database.meta[db.meta_version_key] = db.DB_VERSION
+		for index, (series_id, series) in enumerate(library.items()):
+			database[series_id] = { db.meta_list_index_key: index + 1 }
+			database.set_series(series_id, series)
+		db.set_dirty()
+		db.save(database)
+
+		config.set('storage', storage, store=config.Store.Memory)
+		config.set('series-storage', series_storage, store=config.Store.Memory)
+		db.load()  # imports into SQLite / the pack
+		name = storage if storage == 'sqlite' else series_storage
+
+		def measure(label:str, func) -> None:
+			t0 = time.monotonic()
+			for _ in range(repeat):
+				func()
+			ms = (time.monotonic() - t0)*1000/repeat
+			print('%-7s %-10s %8.1f ms' % (name, label, ms))
+
+		def show() -> None:
+			db.load().series('42')
+
+		def mark() -> None:
+			database = db.load()
+			series = database.series('42')
+			episode = series['episodes'][len(database['42'].get(db.meta_seen_key, {}))]
+			database['42'].setdefault(db.meta_seen_key, {})[db.episode_key(episode)] = '2024-01-01 00:00:00'
+			database.recalc_meta('42')
+			db.save(database)
+
+		def calendar() -> None:
+			today = date.today()
+			db.load().episodes_airing(today, today + timedelta(days=14))
+
+		measure('load', db.load)
+		measure('show', show)
+		measure('mark', mark)
+		measure('calendar', calendar)
+
+		config.set('storage', 'json', store=config.Store.Memory)
+		config.set('series-storage', 'files', store=config.Store.Memory)
+		db.load()  # closes the SQLite store / the pack
+		shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
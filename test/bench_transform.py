@@ -0,0 +1,246 @@
+"""
+Micro-benchmark of the TMDb response transforms: the compiled schemas in tmdb
+versus the previous multi-pass pipeline (kept here as the reference implementation).
+
+Run: python test/bench_transform.py
+"""
+import sys
+import os
+import copy
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from episode_manager import tmdb
+from episode_manager.tmdb import _rename_keys, _del_keys, _set_values, _del_empty, _job_people, _map_status
+
+
+def legacy_search(hits:list) -> list:
+	_rename_keys(hits, {
+		'name': 'title',
+		'first_air_date': 'date',
+		'original_name': 'original_title',
+		'original_language': 'language',
+		'origin_country': 'country',
+	})
+	_del_keys(hits, [
+		'backdrop_path',
+		'popularity',
+		'poster_path',
+		'vote_average',
+		'vote_count',
+		'genre_ids',
+	])
+	_set_values(hits, {
+		'year': lambda hit: [int(hit.get('date', [0]).split('-')[0])] if hit.get('date') else None,
+		'id': lambda hit: str(hit['id']),
+		'country': lambda hit: ', '.join(hit.get('country')),
+	})
+	_del_empty(hits)
+	return hits
+
+
+def legacy_details(data:dict, ext_id:dict, credits:dict) -> dict:
+	imdb_id = ext_id.get('imdb_id') or None
+	if imdb_id:
+		data['imdb_id'] = imdb_id
+
+	_rename_keys(data, {
+		'name': 'title',
+		'first_air_date': 'date',
+		'last_air_date': 'end_date',
+		'original_name': 'original_title',
+		'original_language': 'language',
+		'origin_country': 'country',
+		'number_of_seasons': 'total_seasons',
+		'number_of_episodes': 'total_episodes',
+	})
+	_del_keys(data, [
+		'backdrop_path', 'popularity', 'poster_path', 'vote_average', 'vote_count',
+		'production_companies', 'production_countries', 'homepage', 'in_production',
+		'languages', 'spoken_languages', 'last_episode_to_air', 'next_episode_to_air',
+		'networks', 'type', 'id', 'tagline', 'created_by', 'adult', 'episode_run_time',
+	])
+	_rename_keys(data, {'status': 'active_status'})
+	_set_values(data, {
+		'year': lambda _: [int(data.get('date', [0]).split('-')[0])] if data.get('date') else None,
+		'country': lambda _: ', '.join(data.get('country')),
+		'genre': lambda _: ', '.join(map(lambda g: g.get('name'), data.get('genres'))),
+		'active_status': lambda _: _map_status(data.get('active_status')) if 'active_status' in data else None,
+	})
+	_del_keys(data, ['genres'])
+
+	if data.get('active_status') in ('ended', 'canceled') and 'end_date' in data and 'year' in data:
+		data['year'] = data['year'] + [ int(data.get('end_date').split('-')[0]) ]
+	else:
+		del data['end_date']
+
+	_del_empty(data)
+
+	cast = credits.get('cast', [])
+	crew = credits.get('crew', [])
+
+	seasons:list[dict] = data.pop('seasons', [])
+	specials_info = list(filter(lambda season: season.get('season_number') == 0, seasons))
+	if specials_info:
+		data['specials'] = specials_info[0].get('episode_count', 1)
+
+	_set_values(data, {
+		'director': lambda ep: _job_people(crew, 'Director'),
+		'writer': lambda ep: _job_people(crew, 'Writer'),
+		'cast': lambda ep: list(map(lambda p: p.get('name') or '', cast))
+	})
+
+	return data
+
+
+def legacy_season(data:dict) -> list:
+	data = data.get('episodes', [])
+
+	_rename_keys(data, {
+		'name': 'title',
+		'first_air_date': 'date',
+		'original_name': 'original_title',
+		'original_language': 'language',
+		'origin_country': 'country',
+		'air_date': 'date',
+		'season_number': 'season',
+		'episode_number': 'episode',
+		'episode_type': 'finale',
+	})
+	_set_values(data, {
+		'director': lambda ep: _job_people(ep.get('crew', []), 'Director'),
+		'writer': lambda ep: _job_people(ep.get('crew', []), 'Writer'),
+		'guest_cast': lambda ep: list(map(lambda p: p.get('name') or '', ep.get('guest_stars', []))),
+		'season': lambda ep: 'S' if ep.get('season') == 0 else ep.get('season'),
+		'finale': lambda ep: None if (ep.get('finale') == 'standard' or ep.get('season') == 'S') else ep.get('finale').replace('mid_season', 'mid-season'),
+	})
+	_del_keys(data, [
+		'id', 'show_id', 'still_path', 'crew', 'guest_stars', 'production_code', 'vote_average', 'vote_count',
+	])
+	_del_empty(data)
+
+	return data
+
+
+def sample_season(season:int=1, num_episodes:int=20) -> dict:
+	return {
+		'_id': 'abc',
+		'air_date': '2020-01-01',
+		'name': 'Season %d' % season,
+		'season_number': season,
+		'episodes': [
+			{
+				'air_date': '2020-01-%02d' % ep,
+				'episode_number': ep,
+				'episode_type': 'finale' if ep == num_episodes else ('mid_season' if ep == num_episodes//2 else 'standard'),
+				'id': 1000 + ep,
+				'name': 'Episode %d' % ep,
+				'overview': 'Something happens in episode %d.' % ep,
+				'production_code': '',
+				'runtime': 42 if ep % 3 else None,
+				'season_number': season,
+				'show_id': 42,
+				'still_path': '/x.jpg',
+				'vote_average': 7.5,
+				'vote_count': 12,
+				'crew': [
+					{'job': 'Director', 'name': 'Director %d' % ep, 'department': 'Directing'},
+					{'job': 'Writer', 'name': 'Writer', 'department': 'Writing'},
+					{'job': 'Editor', 'name': 'Editor', 'department': 'Editing'},
+				] if ep % 4 else [],
+				'guest_stars': [
+					{'name': 'Guest %d' % n, 'character': 'Someone'}
+					for n in range(ep % 5)
+				],
+			}
+			for ep in range(1, num_episodes + 1)
+		],
+	}
+
+
+def sample_details(status:str='Ended') -> dict:
+	return {
+		'adult': False,
+		'backdrop_path': '/b.jpg',
+		'created_by': [],
+		'episode_run_time': [45],
+		'first_air_date': '2001-02-03',
+		'genres': [{'id': 1, 'name': 'Drama'}, {'id': 2, 'name': 'Crime'}],
+		'homepage': '',
+		'id': 42,
+		'in_production': status != 'Ended',
+		'languages': ['en'],
+		'last_air_date': '2005-06-07',
+		'last_episode_to_air': {},
+		'name': 'Some Series',
+		'next_episode_to_air': None,
+		'networks': [],
+		'number_of_episodes': 60,
+		'number_of_seasons': 3,
+		'origin_country': ['US', 'GB'],
+		'original_language': 'en',
+		'original_name': 'Some Series',
+		'overview': 'Things happen.',
+		'popularity': 12.3,
+		'poster_path': '/p.jpg',
+		'production_companies': [],
+		'production_countries': [],
+		'seasons': [{'season_number': 0, 'episode_count': 2}, {'season_number': 1, 'episode_count': 20}],
+		'spoken_languages': [],
+		'status': status,
+		'tagline': '',
+		'type': 'Scripted',
+		'vote_average': 8.1,
+		'vote_count': 100,
+	}
+
+
+def sample_hits(num:int=20) -> list:
+	return [
+		{
+			'adult': False,
+			'backdrop_path': None,
+			'genre_ids': [18],
+			'id': n,
+			'origin_country': ['US'],
+			'original_language': 'en',
+			'original_name': 'Hit %d' % n,
+			'overview': '',
+			'popularity': 1.0,
+			'poster_path': None,
+			'first_air_date': '2010-01-01' if n % 2 else '',
+			'name': 'Hit %d' % n,
+			'vote_average': 0,
+			'vote_count': 0,
+		}
+		for n in range(num)
+	]
+
+
+def main() -> None:
+	season = sample_season()
+	details = sample_details()
+	credits = {'cast': [{'name': 'Actor %d' % n} for n in range(20)], 'crew': [{'job': 'Director', 'name': 'Boss'}]}
+	hits = sample_hits()
+
+	# each transform gets a fresh copy (they may modify their input); copying is measured separately
+	benchmarks = [
+		('season (20 episodes)', season, lambda data: legacy_season(data), lambda data: tmdb._transform_season(data)),
+		('details', details, lambda data: legacy_details(data, {}, credits), lambda data: tmdb._transform_details(data, {}, credits)),
+		('search (20 hits)', hits, lambda data: legacy_search(data), lambda data: tmdb._search_schema.all(data)),
+	]
+
+	def measure(func, sample) -> float:
+		number = 2000
+		return min(timeit.repeat(lambda: func(copy.deepcopy(sample)), number=number, repeat=5))/number*1e6
+
+	for name, sample, legacy, schema in benchmarks:
+		t_copy = measure(lambda data: data, sample)
+		t_legacy = measure(legacy, sample) - t_copy
+		t_schema = measure(schema, sample) - t_copy
+		print('%-22s  legacy %7.1f µs   schema %7.1f µs   (%.1fx)' % (name, t_legacy, t_schema, t_legacy/t_schema))
+
+
+if __name__ == '__main__':
+	main()
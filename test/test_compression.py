@@ -0,0 +1,35 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+from episode_manager import compression, db
+
+
+class TestWriter(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		self.compressor = compression.method()
+
+	def tearDown(self) -> None:
+		compression._compressor = self.compressor
+		shutil.rmtree(self.path)
+
+	def test_methods(self) -> None:
+		data = { 'episodes': [ { 'season': 1, 'episode': n, 'title': 'Épisode %d' % n } for n in range(5000) ] }
+
+		for method in compression._compressors:
+			if not method['detect'](method):
+				continue
+			with self.subTest(method.get('name') or method['binary']):
+				compression._compressor = method
+				tmp_name = db.write_json_tmp(data, self.path)
+				assert tmp_name is not None
+				with compression.open(tmp_name) as fp:
+					self.assertEqual(db.read_json_obj(fp), data)
+				os.remove(tmp_name)
+
+	def test_failure(self) -> None:
+		# not serializable
+		self.assertIsNone(db.write_json_tmp({ 'a': object() }, self.path))
+		self.assertEqual(os.listdir(self.path), [])
@@ -1,6 +1,10 @@
 import unittest
+import os
+import tempfile
+import shutil
+from datetime import date
 
-from episode_manager import db
+from episode_manager import db, config
 
 class TestDB(unittest.TestCase):
 	def test_load(self):
@@ -8,3 +12,276 @@ class TestDB(unittest.TestCase):
 		# db.load(test_file)
 		pass
 
+
+
+class TestJournal(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		config.set('paths/series-db', os.path.join(self.path, 'series'), store=config.Store.Memory)
+		config.set('paths/series-cache', os.path.join(self.path, 'cache'), store=config.Store.Memory)
+
+		database = db.load()
+		database.meta[db.meta_version_key] = db.DB_VERSION
+		for series_id in ('1', '2'):
+			database[series_id] = { 'title': 'Series %s' % series_id, db.meta_seen_key: {} }
+		db.set_dirty()
+		db.save(database)
+
+	def tearDown(self) -> None:
+		config.remove('paths/series-db')
+		config.remove('paths/series-cache')
+		config.remove('journal-max-entries')
+		shutil.rmtree(self.path)
+
+	def mark(self, series_id:str, episode:str) -> None:
+		database = db.load()
+		db.changelog_clear(database)
+		database[series_id][db.meta_seen_key][episode] = '2024-01-01 00:00:00'
+		database.set_modified(series_id)
+		db.changelog_add(database, 'Marked episode %s' % episode, series_id)
+		db.save(database)
+
+	def journal(self) -> list[str]:
+		try:
+			with open(db.journal_file()) as fp:
+				return fp.readlines()
+		except FileNotFoundError:
+			return []
+
+	def test_append(self) -> None:
+		snapshot_mtime = os.stat(db.active_file()).st_mtime_ns
+
+		self.mark('1', '1:1')
+		self.mark('2', '1:1')
+		self.assertEqual(len(self.journal()), 2)
+		self.assertEqual(os.stat(db.active_file()).st_mtime_ns, snapshot_mtime)
+		self.assertEqual(db.list_backups(), [])
+
+		database = db.load()
+		self.assertEqual(database['1'][db.meta_seen_key], { '1:1': '2024-01-01 00:00:00' })
+		self.assertEqual(database['2'][db.meta_seen_key], { '1:1': '2024-01-01 00:00:00' })
+
+		database.remove('2')
+		db.save(database)
+		self.assertNotIn('2', db.load())
+		self.assertEqual(len(self.journal()), 3)
+
+	def test_compact(self) -> None:
+		config.set('journal-max-entries', 2, store=config.Store.Memory)
+		for episode in ('1:1', '1:2', '1:3'):
+			self.mark('1', episode)
+
+		# the third was written in full
+		self.assertEqual(self.journal(), [])
+		self.assertEqual(len(db.list_backups()), 1)
+		self.assertEqual(len(db.load()['1'][db.meta_seen_key]), 3)
+
+	def test_bad_entries(self) -> None:
+		self.mark('1', '1:1')
+		lines = self.journal()
+		with open(db.journal_file(), 'a') as fp:
+			# based on another snapshot, and an interrupted write
+			fp.write(lines[0].replace('"snapshot":"', '"snapshot":"0'))
+			fp.write(lines[0][:20])
+
+		database = db.load()
+		self.assertEqual(list(database['1'][db.meta_seen_key]), ['1:1'])
+		# cleaned up, by writing it in full
+		self.assertEqual(self.journal(), [])
+
+	def test_rollback(self) -> None:
+		self.mark('1', '1:1')
+		self.mark('1', '1:2')
+
+		remaining, _, changes = db.rollback()
+		self.assertEqual(remaining, 1)
+		self.assertEqual(changes, [['Marked episode 1:2', '1']])
+		self.assertEqual(list(db.load()['1'][db.meta_seen_key]), ['1:1'])
+
+	def test_rollback_load_saves(self) -> None:
+		database = db.load()
+		db.changelog_clear(database)
+		database['2'][db.meta_archived_key] = '2024-01-01 00:00:00'
+		database.set_series('2', { 'title': 'Series 2', 'episodes': [] })
+		database['2'].pop(db.meta_last_used_key, None)
+		db.changelog_add(database, 'Archived', '2')
+		db.save(database)
+		num_entries = len(self.journal())
+
+		# loading sets the missing 'last used' stamp, i.e. saves another journal entry
+		remaining, _, changes = db.rollback()
+		self.assertEqual(remaining, num_entries - 1)
+		self.assertEqual(changes, [['Archived', '2']])
+		self.assertEqual(len(self.journal()), num_entries - 1)
+		self.assertNotIn(db.meta_archived_key, db.load()['2'])
+
+	def test_used(self) -> None:
+		database = db.load()
+		database.set_series('1', { 'title': 'Series 1', 'episodes': [] })
+		db.save(database)
+		num_entries = len(self.journal())
+
+		# reading a series doesn't change anything, unless its 'last used' stamp is outdated
+		database = db.load()
+		database.series('1')
+		self.assertFalse(database.is_modified())
+		self.assertFalse(database.is_used())
+		db.save(database)
+		self.assertEqual(len(self.journal()), num_entries)
+
+		database.data['1'][db.meta_last_used_key] = '2024-01-01 00:00:00'
+		database.series('1')
+		self.assertFalse(database.is_modified())
+		self.assertTrue(database.is_used())
+		db.save(database)
+		self.assertEqual(len(self.journal()), num_entries + 1)
+		self.assertNotEqual(db.load()['1'][db.meta_last_used_key], '2024-01-01 00:00:00')
+
+	def test_total_seasons(self) -> None:
+		from episode_manager import tmdb
+		from episode_manager.transport import SyntheticAPI
+
+		# the specials are not a season; the count is used to guess which seasons exist
+		tmdb.set_api_key('test-key')
+		tmdb.set_transport(SyntheticAPI(10, seasons=(3, 3)))
+		self.addCleanup(tmdb.set_transport, None)
+		ser_details, episodes = tmdb.episodes('3', with_details=True)
+		self.assertIn('S', set(ep['season'] for ep in episodes))
+
+		database = db.load()
+		database.set_series('1', { 'title': 'Series 1', 'episodes': episodes })
+		self.assertEqual(database['1'][db.meta_total_seasons_key], 3)
+		self.assertEqual(database['1'][db.meta_total_seasons_key], ser_details['total_seasons'])
+
+
+class TestSQLite(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		config.set('paths/series-db', os.path.join(self.path, 'series'), store=config.Store.Memory)
+		config.set('paths/series-cache', os.path.join(self.path, 'cache'), store=config.Store.Memory)
+
+		# a JSON database to start with
+		database = db.load()
+		database.meta[db.meta_version_key] = db.DB_VERSION
+		for series_id in ('1', '2'):
+			database[series_id] = { db.meta_list_index_key: int(series_id) }
+			database.set_series(series_id, {
+				'title': 'Series %s' % series_id,
+				'episodes': [
+					{ 'season': 1, 'episode': episode, 'date': '2024-01-%02d' % (episode + int(series_id)) }
+					for episode in range(1, 4)
+				],
+			})
+		db.set_dirty()
+		db.save(database)
+		self.json_db = db.load()
+
+		config.set('storage', 'sqlite', store=config.Store.Memory)
+
+	def tearDown(self) -> None:
+		db.load()  # closes the SQLite store
+		config.remove('storage')
+		config.remove('paths/series-db')
+		config.remove('paths/series-cache')
+		shutil.rmtree(self.path)
+
+	def test_import(self) -> None:
+		database = db.load()
+		self.assertTrue(os.path.exists(db.sqlite_file()))
+		self.assertEqual(database.data, self.json_db.data)
+		self.assertEqual(database.series('1')['episodes'], self.json_db.series('1')['episodes'])
+
+	def test_save(self) -> None:
+		database = db.load()
+		meta = database['1']
+		meta[db.meta_seen_key] = { '1:1': '2024-01-02 00:00:00', '1:2': '2024-01-03 00:00:00' }
+		meta[db.meta_tags_key] = ['drama']
+		database.set_modified('1')
+		database.remove('2')
+		db.save(database)
+
+		database = db.load()
+		self.assertEqual(set(database.keys()), {db.meta_key, '1'})
+		self.assertEqual(database['1'], meta)
+		self.assertFalse(database.has_data('2'))
+
+	def test_on_demand(self) -> None:
+		database = db.load()
+		self.assertEqual(database['1'], self.json_db['1'])
+		# only that series' meta data was read
+		self.assertEqual(database.data._unloaded, {'2'})
+
+		self.assertEqual(list(database.items()), list(self.json_db.items()))
+		self.assertEqual(database.data._unloaded, set())
+
+	def test_undo(self) -> None:
+		database = db.load()
+		meta = database['1']
+		meta[db.meta_seen_key] = { '1:1': '2024-01-02 00:00:00' }
+		database.set_modified('1')
+		db.changelog_add(database, 'Marked', '1')
+		db.save(database)
+
+		database = db.load()
+		database.remove('2')
+		db.changelog_add(database, 'Removed', '2')
+		db.save(database)
+
+		remaining, _, changes = db.rollback()
+		self.assertEqual(remaining, 1)
+		self.assertEqual(changes, [ ['Marked', '1'], ['Removed', '2'] ])
+		database = db.load()
+		self.assertEqual(database['2'], self.json_db['2'])
+		self.assertEqual(database['1'], meta)
+
+		remaining, _, changes = db.rollback()
+		self.assertEqual(remaining, 0)
+		self.assertEqual(changes, [ ['Marked', '1'] ])
+		database = db.load()
+		self.assertEqual(database.data, self.json_db.data)
+
+		remaining, _, _ = db.rollback()
+		self.assertIsNone(remaining)
+
+	def test_episodes_airing(self) -> None:
+		database = db.load()
+		begin, end = date(2024, 1, 3), date(2024, 1, 5)
+		airing = database.episodes_airing(begin, end)
+		self.assertEqual(airing, self.json_db.episodes_airing(begin, end))
+		self.assertEqual([ (series_id, ep['date']) for series_id, ep in airing ], [
+			('1', '2024-01-03'), ('1', '2024-01-04'), ('2', '2024-01-03'), ('2', '2024-01-04'),
+		])
+
+
+class TestSeriesCache(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+
+	def tearDown(self) -> None:
+		shutil.rmtree(self.path)
+
+	def test_merge_seasons(self) -> None:
+		cache = db.SeriesCache(self.path)
+		def ep(season, episode, **kw):
+			return { 'season': season, 'episode': episode, **kw }
+
+		cache._cache['42'] = {
+			'title': 'Old',
+			'episodes': [ep(1, 1), ep(1, 2), ep(2, 1), ep(2, 2), ep('S', 1)],
+		}
+		series = { 'title': 'New', 'total_seasons': 3, 'specials': 1, 'active_status': 'active' }
+
+		merged = cache.merge_seasons('42', series, {
+			2: [ep(2, 1), ep(2, 2), ep(2, 3, finale='finale')],
+			3: [ep(3, 1)],
+		})
+
+		self.assertEqual(merged['title'], 'New')
+		self.assertEqual(
+			[(e['season'], e['episode']) for e in merged['episodes']],
+			[(1, 1), (1, 2), (2, 1), (2, 2), (2, 3), (3, 1), ('S', 1)]
+		)
+		self.assertEqual(merged['episodes'][1].get('finale'), 'season')
+		self.assertEqual(merged['episodes'][4].get('finale'), 'season')
+
+		self.assertIsNone(cache.merge_seasons('43', series, {}))
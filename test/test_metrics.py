@@ -0,0 +1,83 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+from episode_manager import tmdb, metrics
+from episode_manager.response_cache import ResponseCache
+from episode_manager.transport import SyntheticAPI
+
+
+class TestMetrics(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+
+	def tearDown(self) -> None:
+		shutil.rmtree(self.path)
+
+	def test_percentiles(self) -> None:
+		stats = metrics.Metrics()
+		for ms in range(1, 101):
+			stats.request('season', ms/1000, 10)
+		stats.count('season', 'retries')
+
+		summary = stats.summary()['season']
+		self.assertEqual(summary['requests'], 100)
+		self.assertEqual(summary['bytes'], 1000)
+		self.assertEqual(summary['retries'], 1)
+		self.assertAlmostEqual(summary['p50'], 0.050)
+		self.assertAlmostEqual(summary['p95'], 0.095)
+		self.assertAlmostEqual(summary['p99'], 0.099)
+		self.assertAlmostEqual(stats.latency('season', 95), 0.095)
+		self.assertIsNone(stats.latency('season', 95, min_samples=200))
+		self.assertIsNone(stats.latency('details', 95))
+		self.assertEqual(len(stats.report()), 2)
+
+	def test_persist(self) -> None:
+		filepath = os.path.join(self.path, 'net-stats.json')
+		stats = metrics.Metrics()
+		stats.request('details', 0.1, 100)
+
+		metrics.save(filepath, stats, 'add')
+		stats.count('details', 'cache_hits', 2)
+		metrics.save(filepath, stats, 'refresh')
+
+		stored = metrics.load(filepath)
+		self.assertEqual(stored['last']['command'], 'refresh')
+		total = metrics.Metrics(stored['total']).summary()['details']
+		self.assertEqual(total['requests'], 2)
+		self.assertEqual(total['cache_hits'], 2)
+		self.assertEqual(len(stored['total']['details']['latencies']), 2)
+
+
+class TestClientMetrics(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		tmdb.set_api_key('test-key')
+		tmdb.set_transport(SyntheticAPI(10, seasons=(2, 2)))
+		tmdb.set_cache(ResponseCache(self.path, max_size=1024*1024, ttl={'details': 60, 'season': 60}))
+		tmdb.net_stats().reset()
+		tmdb.__dict__['__details'].clear()
+
+	def tearDown(self) -> None:
+		tmdb.set_transport(None)
+		tmdb.set_cache(None)
+		tmdb.net_stats().reset()
+		tmdb.__dict__['__details'].clear()
+		shutil.rmtree(self.path)
+
+	def test_counted(self) -> None:
+		tmdb.episodes('3')
+		tmdb.episodes('3')
+		self.assertIsNone(tmdb.episodes('11'))
+
+		summary = tmdb.net_stats().summary()['details']
+		self.assertEqual(summary['requests'], 2)
+		self.assertEqual(summary['cache_hits'], 1)
+		self.assertEqual(summary['failures'], 0)  # not found isn't a failure
+		self.assertGreater(summary['bytes'], 0)
+		self.assertIsNotNone(summary['p95'])
+
+
+if __name__ == '__main__':
+	unittest.main()
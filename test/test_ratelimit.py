@@ -0,0 +1,138 @@
+import unittest
+import threading
+
+from episode_manager.ratelimit import TokenBucket, AdaptiveLimiter
+
+class FakeClock:
+	def __init__(self):
+		self.now = 1000.0
+		self.slept:list[float] = []
+
+	def __call__(self) -> float:
+		return self.now
+
+	def sleep(self, seconds:float) -> None:
+		self.slept.append(seconds)
+		self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+	def test_rate(self) -> None:
+		clock = FakeClock()
+		bucket = TokenBucket(10, burst=5, clock=clock, sleep=clock.sleep)
+
+		for _ in range(5):
+			bucket.acquire()
+		self.assertEqual(clock.slept, [])
+
+		# burst used up; the rest are spaced at the rate
+		for _ in range(10):
+			bucket.acquire()
+		self.assertAlmostEqual(clock.now - 1000, 1.0)
+
+	def test_pause(self) -> None:
+		clock = FakeClock()
+		bucket = TokenBucket(10, burst=5, clock=clock, sleep=clock.sleep)
+
+		bucket.pause(3)
+		bucket.acquire()
+		self.assertGreaterEqual(clock.now - 1000, 3)
+
+	def test_try_acquire(self) -> None:
+		clock = FakeClock()
+		bucket = TokenBucket(10, burst=2, clock=clock, sleep=clock.sleep)
+
+		self.assertTrue(bucket.try_acquire())
+		self.assertTrue(bucket.try_acquire())
+		self.assertFalse(bucket.try_acquire())
+		clock.now += 0.1
+		self.assertTrue(bucket.try_acquire())
+
+		bucket.pause(1)
+		clock.now += 0.5
+		self.assertFalse(bucket.try_acquire())
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+	def test_aimd(self) -> None:
+		clock = FakeClock()
+		limiter = AdaptiveLimiter(16, initial=8, clock=clock)
+
+		# healthy latency: additive increase
+		for _ in range(40):
+			limiter.acquire()
+			limiter.release(0.1)
+		self.assertGreater(limiter.limit, 8)
+		self.assertLessEqual(limiter.limit, 16)
+		before = limiter.limit
+
+		# overload: halved, but only once for a burst of failures
+		for _ in range(5):
+			limiter.acquire()
+			limiter.release(overloaded=True)
+		self.assertEqual(limiter.limit, before//2)
+
+		clock.now += 10
+		limiter.acquire()
+		limiter.release(overloaded=True)
+		self.assertEqual(limiter.limit, before//4)
+
+	def test_slow_no_increase(self) -> None:
+		limiter = AdaptiveLimiter(16, initial=4)
+		limiter.acquire()
+		limiter.release(0.1)
+		for _ in range(20):
+			limiter.acquire()
+			limiter.release(1.0)
+		self.assertEqual(limiter.limit, 4)
+
+	def test_baseline_per_endpoint(self) -> None:
+		limiter = AdaptiveLimiter(16, initial=4)
+		# one very fast response (e.g. of a tiny endpoint) doesn't hold back the others
+		limiter.acquire()
+		limiter.release(0.001, endpoint='config')
+		for _ in range(20):
+			limiter.acquire()
+			limiter.release(0.2, endpoint='season')
+		self.assertGreater(limiter.limit, 4)
+
+	def test_recover(self) -> None:
+		clock = FakeClock()
+		limiter = AdaptiveLimiter(16, initial=8, clock=clock)
+		limiter.acquire()
+		limiter.release(0.01, endpoint='season')
+		limiter.acquire()
+		limiter.release(overloaded=True, endpoint='season')
+		self.assertEqual(limiter.limit, 4)
+
+		# the fast outlier is forgotten, and the limit grows again
+		for _ in range(200):
+			limiter.acquire()
+			limiter.release(0.2, endpoint='season')
+		self.assertGreater(limiter.limit, 8)
+
+	def test_try_acquire(self) -> None:
+		limiter = AdaptiveLimiter(16, initial=2)
+		self.assertTrue(limiter.try_acquire())
+		self.assertTrue(limiter.try_acquire())
+		self.assertFalse(limiter.try_acquire())
+		limiter.release()
+		self.assertTrue(limiter.try_acquire())
+
+	def test_headroom(self) -> None:
+		limiter = AdaptiveLimiter(16, initial=4)
+		limiter.acquire(headroom=1)
+		limiter.acquire(headroom=1)
+		limiter.acquire(headroom=1)
+		# the last slot is left for requests without headroom
+		self.assertTrue(limiter.try_acquire())
+
+		acquired = threading.Event()
+		def background():
+			limiter.acquire(headroom=1)
+			acquired.set()
+		threading.Thread(target=background, daemon=True).start()
+		limiter.release()
+		self.assertFalse(acquired.wait(0.05))
+		limiter.release()
+		self.assertTrue(acquired.wait(1))
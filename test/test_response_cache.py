@@ -0,0 +1,89 @@
+import unittest
+import os
+import time
+import tempfile
+import shutil
+
+from episode_manager.response_cache import ResponseCache
+
+class TestResponseCache(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		self.ttl = { 'search': 60, 'details': 60, 'season': 60, 'changes': 60 }
+
+	def tearDown(self) -> None:
+		shutil.rmtree(self.path)
+
+	def test_roundtrip(self) -> None:
+		cache = ResponseCache(self.path, max_size=1024*1024, ttl=self.ttl)
+		self.assertIsNone(cache.get('details', 'tv/1'))
+
+		cache.put('details', 'tv/1', {'name': 'One', 'seasons': [1, 2]})
+		self.assertEqual(cache.get('details', 'tv/1'), {'name': 'One', 'seasons': [1, 2]})
+		self.assertIsNone(cache.get('details', 'tv/2'))
+
+		# a new instance (i.e. process) finds it as well
+		cache = ResponseCache(self.path, max_size=1024*1024, ttl=self.ttl)
+		self.assertEqual(cache.get('details', 'tv/1'), {'name': 'One', 'seasons': [1, 2]})
+
+	def test_expired(self) -> None:
+		cache = ResponseCache(self.path, max_size=1024*1024, ttl=self.ttl)
+		cache.put('search', 'search/tv?query=x', {'results': []})
+		self.assertIsNotNone(cache.get('search', 'search/tv?query=x'))
+		self.assertIsNone(cache.get('search', 'search/tv?query=x', max_age=0))
+
+		# pretend it was stored two minutes ago
+		filepath = os.path.join(self.path, cache._filename('search', 'search/tv?query=x'))
+		stored = time.time() - 120
+		os.utime(filepath, (stored, stored))
+		self.assertIsNone(cache.get('search', 'search/tv?query=x'))
+
+		self.assertEqual(cache.info()['search']['expired'], 1)
+		self.assertEqual(cache.purge(expired_only=True), 1)
+		self.assertEqual(cache.info()['search']['entries'], 0)
+
+	def test_evict_lru(self) -> None:
+		payload = { 'data': os.urandom(2000).hex() }  # not very compressible
+		cache = ResponseCache(self.path, max_size=10*1024, ttl=self.ttl)
+
+		for n in range(4):
+			cache.put('season', 'tv/1/season/%d' % n, payload)
+		# make season 0 the least recently used
+		for n in range(1, 4):
+			filepath = os.path.join(self.path, cache._filename('season', 'tv/1/season/%d' % n))
+			os.utime(filepath, (time.time() + n, os.stat(filepath).st_mtime))
+		cache._entries = None
+
+		for n in range(4, 8):
+			cache.put('season', 'tv/1/season/%d' % n, payload)
+
+		info = cache.info()['season']
+		self.assertLessEqual(info['size'], 10*1024)
+		self.assertIsNone(cache.get('season', 'tv/1/season/0'))
+		self.assertIsNotNone(cache.get('season', 'tv/1/season/7'))
+
+	def test_purge_endpoint(self) -> None:
+		cache = ResponseCache(self.path, max_size=1024*1024, ttl=self.ttl)
+		cache.put('search', 'a', [1])
+		cache.put('details', 'b', [2])
+
+		self.assertEqual(cache.purge(['search']), 1)
+		self.assertIsNone(cache.get('search', 'a'))
+		self.assertEqual(cache.get('details', 'b'), [2])
+
+	def test_revalidate(self) -> None:
+		cache = ResponseCache(self.path, max_size=1024*1024, ttl=self.ttl)
+		cache.put('season', 'tv/1/season/1', {'episodes': []}, validators={'etag': '"abc"'})
+
+		filepath = os.path.join(self.path, cache._filename('season', 'tv/1/season/1'))
+		stored = time.time() - 120
+		os.utime(filepath, (stored, stored))
+		self.assertIsNone(cache.get('season', 'tv/1/season/1'))
+
+		# expired entries can still be looked up, with their validators
+		entry = cache.lookup('season', 'tv/1/season/1')
+		self.assertEqual(entry.validators, {'etag': '"abc"'})
+		self.assertEqual(entry.data(), {'episodes': []})
+
+		cache.touch('season', 'tv/1/season/1', revalidated=True)
+		self.assertEqual(cache.get('season', 'tv/1/season/1'), {'episodes': []})
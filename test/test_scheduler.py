@@ -0,0 +1,162 @@
+import unittest
+import threading
+import time
+
+from episode_manager.scheduler import Scheduler, Priority
+
+class TestScheduler(unittest.TestCase):
+	def test_submit(self) -> None:
+		sched = Scheduler(2)
+		promise = sched.submit(lambda a, b: a + b, 1, b=2)
+		self.assertEqual(sched.result(promise), 3)
+
+	def test_exception(self) -> None:
+		sched = Scheduler(1)
+		def fail():
+			raise ValueError('nope')
+		promise = sched.submit(fail)
+		with self.assertRaises(ValueError):
+			sched.result(promise)
+
+	def test_nested(self) -> None:
+		# more nested waiting tasks than workers must not deadlock
+		sched = Scheduler(2)
+		threads = set()
+
+		def leaf(n):
+			threads.add(threading.current_thread().name)
+			return n
+
+		def parent(n):
+			children = [sched.submit(leaf, n*10 + c) for c in range(5)]
+			sched.wait(children)
+			return sum(c.result() for c in children)
+
+		parents = [sched.submit(parent, n) for n in range(8)]
+		sched.wait(parents)
+
+		self.assertEqual([p.result() for p in parents], [n*50 + 10 for n in range(8)])
+		self.assertLessEqual(len(threads), 2)
+
+		stats = sched.stats()
+		self.assertEqual(stats['queued'], 0)
+		self.assertEqual(stats['in_flight'], 0)
+		self.assertLessEqual(stats['workers'], 2)
+
+	def test_blocking(self) -> None:
+		# a single worker, waiting for a task it doesn't run itself
+		sched = Scheduler(1)
+
+		def waiting():
+			with sched.blocking():
+				child = sched.submit_first(lambda: 'child')
+				return child.result(timeout=5)
+
+		queued = sched.submit(lambda: 'queued')
+		promise = sched.submit_first(waiting)
+		self.assertEqual(sched.result(promise), 'child')
+		self.assertEqual(sched.result(queued), 'queued')
+
+	def test_as_completed(self) -> None:
+		sched = Scheduler(2)
+		gate = threading.Event()
+
+		def slow():
+			gate.wait()
+			return 'slow'
+
+		promises = [sched.submit(slow), sched.submit(lambda: 'fast')]
+		completed = sched.as_completed(promises)
+
+		# the fast one is available before the slow one has finished
+		self.assertEqual(next(completed).result(), 'fast')
+		gate.set()
+		self.assertEqual(next(completed).result(), 'slow')
+
+	def test_burst(self) -> None:
+		# tasks submitted in a burst must not all end up with the same (idle) worker
+		sched = Scheduler(4)
+		sched.result(sched.submit(lambda: None))
+		while sched.stats()['idle'] == 0:
+			time.sleep(0.01)
+
+		gate = threading.Event()
+		blocked = sched.submit(gate.wait)
+		others = [sched.submit(lambda n=n: n) for n in range(3)]
+
+		self.assertEqual([sched.result(p) for p in others], [0, 1, 2])
+		gate.set()
+		sched.result(blocked)
+
+	def test_priority(self) -> None:
+		sched = Scheduler(1)
+		gate = threading.Event()
+		blocked = sched.submit(gate.wait)
+		while sched.stats()['in_flight'] == 0:
+			time.sleep(0.01)
+
+		order = []
+		promises = []
+		for priority in (Priority.BACKGROUND, Priority.NORMAL, Priority.INTERACTIVE, Priority.NORMAL):
+			with sched.priority(priority):
+				promises.append(sched.submit(lambda p=priority: order.append((p, sched.current_priority()))))
+		self.assertEqual(sched.current_priority(), Priority.NORMAL)
+
+		gate.set()
+		sched.wait(promises + [blocked])
+		# most urgent first, each running with its own priority
+		self.assertEqual(order, [(p, p) for p in (Priority.INTERACTIVE, Priority.NORMAL, Priority.NORMAL, Priority.BACKGROUND)])
+
+	def test_background_throttled(self) -> None:
+		sched = Scheduler(4, background_share=0.5)
+		gate = threading.Event()
+
+		# more urgent work is running
+		normal = sched.submit(gate.wait)
+		while sched.stats()['foreground'] < 1:
+			time.sleep(0.01)
+
+		with sched.priority(Priority.BACKGROUND):
+			bulk = [sched.submit(gate.wait) for _ in range(4)]
+		while sched.stats()['background'] < 2:
+			time.sleep(0.01)
+
+		# the others wait, leaving room for more urgent work
+		self.assertEqual(sched.stats()['queued'], 2)
+		with sched.priority(Priority.INTERACTIVE):
+			self.assertEqual(sched.result(sched.submit(lambda: 'urgent')), 'urgent')
+		self.assertEqual(sched.stats()['background'], 2)
+
+		gate.set()
+		sched.wait(bulk + [normal])
+		self.assertEqual(sched.stats()['background'], 0)
+
+	def test_background_alone(self) -> None:
+		# nothing more urgent: all workers
+		sched = Scheduler(4, background_share=0.5)
+		gate = threading.Event()
+
+		with sched.priority(Priority.BACKGROUND):
+			bulk = [sched.submit(gate.wait) for _ in range(4)]
+		while sched.stats()['background'] < 4:
+			time.sleep(0.01)
+		self.assertEqual(sched.stats()['queued'], 0)
+
+		gate.set()
+		sched.wait(bulk)
+
+	def test_background_nested(self) -> None:
+		# throttled background tasks waiting for their children must not deadlock
+		sched = Scheduler(2, background_share=0.5)
+
+		def parent(n):
+			children = [sched.submit(lambda c=c: (c, sched.current_priority())) for c in range(3)]
+			sched.wait(children)
+			return [c.result() for c in children]
+
+		with sched.priority(Priority.BACKGROUND):
+			parents = [sched.submit(parent, n) for n in range(4)]
+		sched.wait(parents)
+
+		for p in parents:
+			self.assertEqual(p.result(), [(c, Priority.BACKGROUND) for c in range(3)])
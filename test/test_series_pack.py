@@ -0,0 +1,155 @@
+import unittest
+import os
+import tempfile
+import shutil
+import multiprocessing as mp
+from datetime import date
+
+from episode_manager import series_pack, db, config
+
+
+def _write_many(filepath:str, prefix:str) -> None:
+	pack = series_pack.Pack(filepath)
+	for n in range(200):
+		pack.write('%s%d' % (prefix, n), b'%s%d' % (prefix.encode(), n)*100)
+	pack.close()
+
+
+class TestPack(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		self.filepath = os.path.join(self.path, 'series.pack')
+
+	def tearDown(self) -> None:
+		shutil.rmtree(self.path)
+
+	def test_read_write(self) -> None:
+		pack = series_pack.Pack(self.filepath)
+		for n in range(20):
+			pack.write(str(n), b'{"n":%d}' % n)
+		pack.write('3', b'{"n":"three"}')
+		pack.remove('4')
+
+		self.assertEqual(pack.read('3'), b'{"n":"three"}')
+		self.assertIsNone(pack.read('4'))
+		self.assertEqual(list(pack.read_many(['2', '4', '1'])), ['1', '2'])
+		pack.close()
+
+		pack = series_pack.Pack(self.filepath)
+		self.assertEqual(pack.read('3'), b'{"n":"three"}')
+		self.assertNotIn('4', pack)
+		pack.close()
+
+	def test_unindexed(self) -> None:
+		pack = series_pack.Pack(self.filepath)
+		pack.write('1', b'{}')
+		pack.flush()
+		# not in the index, and an interrupted write
+		pack.write('2', b'[]')
+		pack.remove('1')
+		os.close(pack._fd)
+		with open(self.filepath, 'ab') as fp:
+			fp.write(b'EPMS\x01\x01\x00')
+
+		pack = series_pack.Pack(self.filepath)
+		self.assertNotIn('1', pack)
+		self.assertEqual(pack.read('2'), b'[]')
+		self.assertEqual(os.path.getsize(self.filepath), pack._size)
+		pack.close()
+
+	def test_new_directory(self) -> None:
+		filepath = os.path.join(self.path, 'not', 'yet', 'series.pack')
+		pack = series_pack.Pack(filepath)
+		pack.write('1', b'{}')
+		pack.close()
+		self.assertEqual(series_pack.Pack(filepath).read('1'), b'{}')
+
+	def test_processes(self) -> None:
+		pack = series_pack.Pack(self.filepath)
+		pack.write('x', b'{}')
+
+		workers = [ mp.Process(target=_write_many, args=(self.filepath, prefix)) for prefix in 'ab' ]
+		for worker in workers:
+			worker.start()
+		for n in range(200):
+			pack.write('c%d' % n, b'c%d' % n*100)
+		for worker in workers:
+			worker.join()
+		pack.close()
+
+		pack = series_pack.Pack(self.filepath)
+		for prefix in 'abc':
+			for n in range(200):
+				self.assertEqual(pack.read('%s%d' % (prefix, n)), b'%s%d' % (prefix.encode(), n)*100)
+		pack.close()
+
+	def test_repack(self) -> None:
+		pack = series_pack.Pack(self.filepath)
+		data = os.urandom(200*1024)
+		for _ in range(10):
+			pack.write('1', data)
+		pack.write('2', b'{}')
+		size = os.path.getsize(self.filepath)
+
+		pack.flush()
+		self.assertLess(os.path.getsize(self.filepath), size/5)
+		self.assertEqual(pack.read('1'), data)
+		pack.close()
+
+		pack = series_pack.Pack(self.filepath)
+		self.assertEqual(pack.read('2'), b'{}')
+		pack.close()
+
+
+class TestSeriesCache(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		config.set('paths/series-db', os.path.join(self.path, 'series'), store=config.Store.Memory)
+		config.set('paths/series-cache', os.path.join(self.path, 'cache'), store=config.Store.Memory)
+
+		database = db.load()
+		database.meta[db.meta_version_key] = db.DB_VERSION
+		for series_id in ('1', '2'):
+			database[series_id] = { 'title': 'Series %s' % series_id }
+			database.set_series(series_id, {
+				'title': 'Series %s' % series_id,
+				'episodes': [ { 'season': 1, 'episode': 1, 'date': '2024-01-0%s' % series_id } ],
+			})
+		db.set_dirty()
+		db.save(database)
+
+	def tearDown(self) -> None:
+		config.set('series-storage', 'files', store=config.Store.Memory)
+		db.load()  # closes the pack
+		config.remove('series-storage')
+		config.remove('paths/series-db')
+		config.remove('paths/series-cache')
+		shutil.rmtree(self.path)
+
+	def test_empty(self) -> None:
+		shutil.rmtree(self.path)
+		config.set('series-storage', 'pack', store=config.Store.Memory)
+		database = db.load()
+		database.meta[db.meta_version_key] = db.DB_VERSION
+		database['1'] = { 'title': 'Series 1' }
+		database.set_series('1', { 'title': 'Series 1', 'episodes': [] })
+		db.save(database)
+		self.assertEqual(db.load().series('1')['title'], 'Series 1')
+
+	def test_import(self) -> None:
+		config.set('series-storage', 'pack', store=config.Store.Memory)
+		database = db.load()
+		self.assertTrue(os.path.exists(os.path.join(self.path, 'cache', 'series.pack')))
+		self.assertEqual(database.series('2')['title'], 'Series 2')
+		self.assertEqual(
+			database.episodes_airing(date(2024, 1, 2), date(2024, 1, 3)),
+			[('2', { 'season': 1, 'episode': 1, 'date': '2024-01-02' })]
+		)
+
+		database.set_series('1', { 'title': 'Changed', 'episodes': [] })
+		database.remove('2')
+		db.save(database)
+
+		database = db.load()
+		self.assertEqual(database.series('1')['title'], 'Changed')
+		self.assertFalse(database.has_data('2'))
@@ -0,0 +1,826 @@
+import unittest
+import threading
+import time
+import json
+import tempfile
+import shutil
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qs
+
+from episode_manager import tmdb
+from episode_manager.ratelimit import AdaptiveLimiter
+from episode_manager.response_cache import ResponseCache
+
+class TestSessionPool(unittest.TestCase):
+	def test_reuse(self) -> None:
+		pool = tmdb._SessionPool(2)
+
+		with pool.session() as first:
+			pass
+		with pool.session() as second:
+			pass
+
+		self.assertIs(first, second)
+		pool.close()
+
+	def test_bounded(self) -> None:
+		pool = tmdb._SessionPool(2)
+		used = []
+
+		def worker():
+			with pool.session() as sess:
+				used.append(sess)
+
+		threads = [threading.Thread(target=worker) for _ in range(8)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+		self.assertEqual(len(used), 8)
+		self.assertLessEqual(len(set(map(id, used))), 2)
+		pool.close()
+
+	def test_shrink(self) -> None:
+		pool = tmdb._SessionPool(4)
+		with pool.session(), pool.session(), pool.session():
+			pass
+		self.assertEqual(pool._num_sessions, 3)
+
+		pool.resize(1)
+		self.assertEqual(pool._num_sessions, 1)
+		pool.close()
+
+
+def _fake_series(num_seasons:int) -> dict:
+	return {
+		'id': 42,
+		'name': 'Some Series',
+		'first_air_date': '2001-02-03',
+		'last_air_date': '2003-04-05',
+		'status': 'Ended',
+		'origin_country': ['US'],
+		'genres': [{'name': 'Drama'}, {'name': 'Crime'}],
+		'number_of_seasons': num_seasons,
+		'number_of_episodes': num_seasons*3,
+		'overview': 'Things happen.',
+		'seasons': [{'season_number': 0, 'episode_count': 1}] + [
+			{'season_number': n, 'episode_count': 3}
+			for n in range(1, num_seasons + 1)
+		],
+	}
+
+def _fake_season(season:int) -> dict:
+	num_eps = 1 if season == 0 else 3
+	return {
+		'season_number': season,
+		'episodes': [
+			{
+				'id': season*100 + ep,
+				'name': 'Episode %d' % ep,
+				'air_date': '2001-%02d-%02d' % (season + 1, ep),
+				'season_number': season,
+				'episode_number': ep,
+				'episode_type': 'finale' if ep == num_eps else 'standard',
+				'runtime': 45,
+				'crew': [{'job': 'Director', 'name': 'D %d' % ep}, {'job': 'Writer', 'name': 'W'}],
+				'guest_stars': [{'name': 'Guest'}],
+				'vote_count': 3,
+			}
+			for ep in range(1, num_eps + 1)
+		],
+	}
+
+_fake_external_ids = {'imdb_id': 'tt0000042'}
+_fake_credits = {'cast': [{'name': 'Actor'}], 'crew': [{'job': 'Director', 'name': 'Boss'}]}
+
+
+class FakeAPI:
+	def __init__(self, num_seasons:int):
+		self.num_seasons = num_seasons
+		self.urls:list[str] = []
+
+	def query(self, url:str, max_age:int|None=None):
+		from urllib.parse import urlparse, parse_qs
+		self.urls.append(url)
+		parsed = urlparse(url)
+		path = parsed.path.split('/3/', 1)[1].split('/')
+		query = parse_qs(parsed.query)
+
+		if len(path) == 2:
+			data = _fake_series(self.num_seasons)
+			for item in ','.join(query.get('append_to_response', [])).split(','):
+				if item == 'external_ids':
+					data[item] = _fake_external_ids
+				elif item == 'credits':
+					data[item] = _fake_credits
+				elif item.startswith('season/'):
+					season = int(item.split('/')[1])
+					if season <= self.num_seasons:
+						data[item] = _fake_season(season)
+			return data
+		if path[2] == 'external_ids':
+			return _fake_external_ids
+		if path[2] == 'credits':
+			return _fake_credits
+		if path[2] == 'season':
+			return _fake_season(int(path[3]))
+		return None
+
+
+class TestAppendToResponse(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		self._query = tmdb._query
+
+	def tearDown(self) -> None:
+		tmdb._query = self._query
+		tmdb.set_append_to_response(True)
+		tmdb.__dict__['__details'].clear()
+
+	def fetch(self, num_seasons:int, append:bool):
+		api = FakeAPI(num_seasons)
+		tmdb._query = api.query
+		tmdb.set_append_to_response(append)
+		tmdb.__dict__['__details'].clear()
+		return tmdb.episodes('42', with_details=True), api.urls
+
+	def test_identical(self) -> None:
+		for num_seasons in (1, 3, 25, 45):
+			separate, separate_urls = self.fetch(num_seasons, append=False)
+			appended, appended_urls = self.fetch(num_seasons, append=True)
+
+			self.assertEqual(json.dumps(separate, sort_keys=True), json.dumps(appended, sort_keys=True))
+			self.assertEqual(len(separate_urls), 3 + num_seasons + 1)
+			self.assertEqual(len(appended_urls), 1 + (max(0, num_seasons - 17) + 19)//20)
+
+	def test_seasons(self) -> None:
+		for append, num_requests in ((True, 1), (False, 3 + 1)):
+			api = FakeAPI(25)
+			tmdb._query = api.query
+			tmdb.set_append_to_response(append)
+			tmdb.__dict__['__details'].clear()
+
+			ser_details, seasons = tmdb.seasons('42', [20])
+			self.assertEqual(list(seasons.keys()), [20])
+			self.assertEqual([ep['episode'] for ep in seasons[20]], [1, 2, 3])
+			self.assertEqual(ser_details['total_seasons'], 25)
+			self.assertEqual(len(api.urls), num_requests)
+
+	def test_failed_season(self) -> None:
+		for append in (False, True):
+			api = FakeAPI(25)
+			query = api.query
+			# one of the seasons can't be fetched
+			api.query = lambda url, max_age=None: None if ('season/20' in url or 'season/19' in url) else query(url, max_age)  # type: ignore
+			tmdb._query = api.query
+			tmdb.set_append_to_response(append)
+			tmdb.__dict__['__details'].clear()
+
+			self.assertIsNone(tmdb.episodes('42', with_details=True))
+
+	def test_details(self) -> None:
+		api = FakeAPI(2)
+		tmdb._query = api.query
+		tmdb.__dict__['__details'].clear()
+		data = tmdb.details('42')
+
+		self.assertEqual(len(api.urls), 1)
+		self.assertEqual(data['imdb_id'], 'tt0000042')
+		self.assertEqual(data['cast'], ['Actor'])
+		self.assertEqual(data['year'], [2001, 2003])
+
+
+class FakeResponse:
+	def __init__(self, status_code:int, data=None, headers:dict|None=None):
+		self.status_code = status_code
+		self.content = json.dumps(data, indent=1).encode('utf-8') if data is not None else b''
+		self.headers = headers or {}
+		self.url = ''
+
+
+class TestConditionalRequests(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		self.path = tempfile.mkdtemp()
+		ttl = { 'search': 60, 'details': 60, 'season': 60, 'changes': 60 }
+		tmdb.set_cache(ResponseCache(self.path, max_size=1024*1024, ttl=ttl))
+		self._request = tmdb._request
+		self.sent:list[dict|None] = []
+
+	def tearDown(self) -> None:
+		tmdb._request = self._request
+		tmdb.set_cache(None)
+		shutil.rmtree(self.path)
+
+	def respond(self, resp:FakeResponse):
+		def request(url:str, headers:dict|None=None):
+			self.sent.append(headers)
+			return resp
+		tmdb._request = request
+
+	def test_not_modified(self) -> None:
+		url = tmdb._qurl('tv/42/season/1')
+
+		self.respond(FakeResponse(200, {'episodes': [1, 2]}, {'ETag': '"v1"', 'Last-Modified': 'Sat, 01 Jan 2000 00:00:00 GMT'}))
+		self.assertEqual(tmdb._query(url), {'episodes': [1, 2]})
+		self.assertEqual(self.sent, [None])
+
+		# fresh: served from the cache
+		self.assertEqual(tmdb._query(url), {'episodes': [1, 2]})
+		self.assertEqual(len(self.sent), 1)
+
+		# forced revalidation: conditional request, body reused
+		self.respond(FakeResponse(304))
+		self.assertEqual(tmdb._query(url, max_age=0), {'episodes': [1, 2]})
+		self.assertEqual(self.sent[-1], {'If-None-Match': '"v1"', 'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT'})
+
+		# modified: new body and validators stored
+		resp = FakeResponse(200, {'episodes': [1, 2, 3]}, {'ETag': '"v2"'})
+		self.respond(resp)
+		self.assertEqual(tmdb._query(url, max_age=0), {'episodes': [1, 2, 3]})
+		cached = tmdb.cache().lookup('season', tmdb._cache_key(url))
+		self.assertEqual(cached.validators, {'etag': '"v2"'})
+		# the body is stored as received
+		self.assertEqual(cached._body, resp.content)
+
+	def test_bad_body(self) -> None:
+		resp = FakeResponse(200)
+		resp.content = b'{"trunc'
+		self.respond(resp)
+		self.assertIsNone(tmdb._query(tmdb._qurl('tv/42/season/1')))
+
+
+class FakeSessions:
+	def __init__(self, responses:list[FakeResponse]):
+		self.responses = responses
+		self.num_requests = 0
+
+	@contextmanager
+	def session(self):
+		yield self
+
+	def get(self, url:str, headers:dict|None=None, timeout:int=0):
+		self.num_requests += 1
+		resp = self.responses.pop(0)
+		if isinstance(resp, Exception):
+			raise resp
+		return resp
+
+
+class TestThrottling(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		self._sessions = tmdb._sessions
+		self._rate_limit = tmdb._rate_limit
+		self.paused:list[float] = []
+		tmdb._rate_limit.pause = self.paused.append  # type: ignore
+		# the overloaded responses decrease the concurrency
+		self._concurrency = tmdb._concurrency
+		tmdb._concurrency = AdaptiveLimiter(self._concurrency._max)
+
+	def tearDown(self) -> None:
+		tmdb._sessions = self._sessions
+		tmdb._concurrency = self._concurrency
+		del tmdb._rate_limit.pause
+		tmdb.set_retries(3, delay=0.5)
+		tmdb.set_deadline(None)
+
+	def test_retry_after(self) -> None:
+		tmdb._sessions = FakeSessions([
+			FakeResponse(429, headers={'Retry-After': '2'}),
+			FakeResponse(429),
+			FakeResponse(200, {'id': 42}),
+		])
+
+		self.assertEqual(tmdb._fetch(tmdb._qurl('tv/42')), {'id': 42})
+		self.assertEqual(tmdb._sessions.num_requests, 3)
+		self.assertEqual(self.paused, [2.0, 1.0])
+
+	def test_give_up(self) -> None:
+		tmdb._sessions = FakeSessions([FakeResponse(429) for _ in range(tmdb._MAX_THROTTLED)])
+
+		self.assertIsNone(tmdb._fetch(tmdb._qurl('tv/42')))
+		self.assertEqual(tmdb._sessions.num_requests, tmdb._MAX_THROTTLED)
+
+	def test_retry(self) -> None:
+		tmdb.set_retries(3, delay=0)
+		tmdb._sessions = FakeSessions([
+			tmdb.ReadTimeout(),
+			FakeResponse(502),
+			FakeResponse(200, {'id': 42}),
+		])
+
+		self.assertEqual(tmdb._fetch(tmdb._qurl('tv/42')), {'id': 42})
+		self.assertEqual(tmdb._sessions.num_requests, 3)
+
+	def test_retries_exhausted(self) -> None:
+		tmdb.set_retries(2, delay=0)
+		tmdb._sessions = FakeSessions([FakeResponse(503) for _ in range(3)])
+
+		self.assertIsNone(tmdb._fetch(tmdb._qurl('tv/42')))
+		self.assertEqual(tmdb._sessions.num_requests, 3)
+
+	def test_deadline(self) -> None:
+		tmdb.set_retries(5, delay=1)
+		tmdb.set_deadline(0)
+		tmdb._sessions = FakeSessions([tmdb.ReadTimeout()])
+
+		self.assertIsNone(tmdb._fetch(tmdb._qurl('tv/42')))
+		self.assertEqual(tmdb._sessions.num_requests, 1)
+
+
+class TestChangedSeries(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		self._query = tmdb._query
+		self.urls:list[str] = []
+
+	def tearDown(self) -> None:
+		tmdb._query = self._query
+
+	def query(self, url:str, max_age:int|None=None):
+		from urllib.parse import urlparse, parse_qs
+		self.urls.append(url)
+		page = int(parse_qs(urlparse(url).query)['page'][0])
+		return {
+			'page': page,
+			'total_pages': 3,
+			'results': [{'id': page*100 + n} for n in range(3)],
+		}
+
+	def test_pages(self) -> None:
+		from datetime import datetime, timedelta
+		tmdb._query = self.query
+
+		changed = tmdb.changed_series(datetime.now() - timedelta(days=3))
+		self.assertEqual(len(self.urls), 3)
+		self.assertEqual(changed, {'100', '101', '102', '200', '201', '202', '300', '301', '302'})
+
+		# too long ago; must check per series
+		self.assertIsNone(tmdb.changed_series(datetime.now() - timedelta(days=30)))
+		self.assertEqual(len(self.urls), 3)
+
+	def test_max_pages(self) -> None:
+		from datetime import datetime, timedelta
+		tmdb._query = self.query
+
+		# more pages than checking the series one by one; only the first was fetched
+		self.assertIsNone(tmdb.changed_series(datetime.now() - timedelta(days=3), max_pages=2))
+		self.assertEqual(len(self.urls), 1)
+		self.assertIsNotNone(tmdb.changed_series(datetime.now() - timedelta(days=3), max_pages=3))
+
+
+class TestParallel(unittest.TestCase):
+	def test_stream(self) -> None:
+		gate = threading.Event()
+
+		def func(n):
+			if n == 0:
+				gate.wait()
+			return n*10
+
+		results = tmdb._parallel_iter(func, [((n,), {}) for n in range(4)])
+		self.assertEqual(len(results), 4)
+
+		received = []
+		for idx, args, res in results:
+			received.append((idx, args, res))
+			if len(received) == 3:
+				gate.set()
+
+		self.assertEqual(received[-1], (0, (0,), 0))
+		self.assertEqual(sorted(received), [(n, (n,), n*10) for n in range(4)])
+
+		self.assertEqual(tmdb._parallel_query(func, [((n,), {}) for n in range(4)]), [0, 10, 20, 30])
+
+
+class TestSchema(unittest.TestCase):
+	# the compiled schemas must produce exactly the same as the previous transforms (including key order)
+	def test_season(self) -> None:
+		import copy
+		from bench_transform import legacy_season, sample_season
+
+		for season in (0, 1, 7):
+			data = sample_season(season)
+			data['episodes'][0]['air_date'] = None
+			data['episodes'][1].pop('guest_stars')
+
+			expected = legacy_season(copy.deepcopy(data))
+			self.assertEqual(json.dumps(tmdb._transform_season(copy.deepcopy(data))), json.dumps(expected))
+
+	def test_details(self) -> None:
+		import copy
+		from bench_transform import legacy_details, sample_details
+
+		credits = {'cast': [{'name': 'A'}, {'name': None}], 'crew': [{'job': 'Director', 'name': 'D'}, {'job': 'Writer', 'name': 'W'}]}
+		for status, ext_id, creds in (('Ended', {'imdb_id': 'tt1'}, credits), ('Returning Series', {}, {}), ('Canceled', {}, credits)):
+			data = sample_details(status)
+			expected = legacy_details(copy.deepcopy(data), ext_id, creds)
+			self.assertEqual(json.dumps(tmdb._transform_details(copy.deepcopy(data), ext_id, creds)), json.dumps(expected))
+
+	def test_search(self) -> None:
+		import copy
+		from bench_transform import legacy_search, sample_hits
+
+		hits = sample_hits(6)
+		self.assertEqual(json.dumps(tmdb._search_schema.all(copy.deepcopy(hits))), json.dumps(legacy_search(copy.deepcopy(hits))))
+
+
+class TestSingleFlight(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		self._fetch = tmdb._fetch
+
+	def tearDown(self) -> None:
+		tmdb._fetch = self._fetch
+
+	def test_coalesced(self) -> None:
+		import time
+		num_fetched = 0
+
+		def fetch(url:str):
+			nonlocal num_fetched
+			num_fetched += 1
+			time.sleep(0.2)
+			return {'id': 42, 'seasons': []}
+		tmdb._fetch = fetch
+
+		url = tmdb._qurl('tv/42')
+		results = []
+		threads = [threading.Thread(target=lambda: results.append(tmdb._query(url))) for _ in range(5)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+		self.assertEqual(num_fetched, 1)
+		self.assertEqual(results, [{'id': 42, 'seasons': []}]*5)
+		# not shared
+		self.assertEqual(len(set(map(id, results))), 5)
+
+		# not in flight anymore; performed again
+		tmdb._query(url)
+		self.assertEqual(num_fetched, 2)
+
+	def test_leader_modifies(self) -> None:
+		gate = threading.Event()
+
+		def fetch(url:str):
+			gate.wait(5)
+			return {'id': 42, 'seasons': [ {'season': n, 'episodes': list(range(50))} for n in range(50) ]}
+		tmdb._fetch = fetch
+
+		url = tmdb._qurl('tv/42')
+		results = []
+		errors = []
+		def query(modify:bool):
+			try:
+				data = tmdb._query(url)
+				if modify:
+					# as e.g. details() does, right away
+					while data['seasons']:
+						data['seasons'].pop()['episodes'].clear()
+				else:
+					results.append(data)
+			except Exception as e:
+				errors.append(e)
+
+		leader = threading.Thread(target=query, args=(True, ))
+		leader.start()
+		while (url, None) not in tmdb._in_flight:
+			time.sleep(0.001)
+		threads = [threading.Thread(target=query, args=(False, )) for _ in range(16)]
+		for t in threads:
+			t.start()
+		while tmdb._in_flight[(url, None)][1] < len(threads):
+			time.sleep(0.001)
+		gate.set()
+		for t in [leader] + threads:
+			t.join()
+
+		self.assertEqual(errors, [])
+		self.assertEqual(len(results), 16)
+		self.assertTrue(all(len(data['seasons']) == 50 and len(data['seasons'][0]['episodes']) == 50 for data in results))
+
+
+
+class GatedAPI:
+	"""
+	Holds back the requests matching 'held' until released: by release(), or once
+	'release_after' other requests arrived. Records the other requests that arrived
+	before that ('early'), and the order of all requests ('events'). Requests are
+	named by their path, and the first item appended to the response (if any),
+	e.g. 'tv/3+external_ids'.
+	"""
+	def __init__(self, api, held, release_after:int|None=None):
+		self.api = api
+		self.held = held
+		self.release_after = release_after
+		self.released = release_after == 0
+		self.timed_out = False
+		self.early:list[str] = []
+		self.events:list[tuple[str, str]] = []
+		self.cond = threading.Condition()
+
+	def release(self) -> None:
+		with self.cond:
+			self.released = True
+			self.cond.notify_all()
+
+	def get(self, url:str, headers:dict|None=None, timeout:float|None=None):
+		parts = urlsplit(url)
+		path = parts.path.split('/3/', 1)[-1]
+		appended = parse_qs(parts.query).get('append_to_response')
+		if appended:
+			path += '+' + appended[0].split(',')[0]
+
+		with self.cond:
+			self.events.append(('start', path))
+			if self.held(path):
+				if not self.cond.wait_for(lambda: self.released, timeout=5):
+					self.timed_out = True
+			elif not self.released:
+				self.early.append(path)
+				if self.release_after is not None and len(self.early) >= self.release_after:
+					self.released = True
+					self.cond.notify_all()
+
+		resp = self.api.get(url, headers, timeout)
+		with self.cond:
+			self.events.append(('end', path))
+		return resp
+
+
+def _fresh_limits(test:unittest.TestCase) -> None:
+	# independent of the state left by other tests (e.g. a decreased concurrency)
+	concurrency = tmdb._concurrency
+	tmdb._concurrency = AdaptiveLimiter(concurrency._max, initial=concurrency._max)
+	tmdb.set_rate_limit(1000)
+	def restore():
+		tmdb._concurrency = concurrency
+		tmdb.set_rate_limit(tmdb._default_rate_limit)
+	test.addCleanup(restore)
+
+
+class TestSearchHits(unittest.TestCase):
+	def setUp(self) -> None:
+		from episode_manager.transport import SyntheticAPI
+		tmdb.set_api_key('test-key')
+		_fresh_limits(self)
+		# 'series 1' matches 1, 10..19, 100..199, ...
+		self.api = SyntheticAPI(200)
+		tmdb.set_transport(self.api)
+		tmdb.__dict__['__details'].clear()
+		tmdb.__dict__['__recent_searches'].clear()
+
+	def tearDown(self) -> None:
+		tmdb.set_transport(None)
+		tmdb.set_rate_limit(tmdb._default_rate_limit)
+		tmdb.__dict__['__details'].clear()
+		tmdb.__dict__['__recent_searches'].clear()
+
+	def test_pipelined(self) -> None:
+		# the first page is available while the details are still being fetched
+		gated = GatedAPI(self.api, held=lambda path: path.startswith('tv/'))
+		tmdb.set_transport(gated)
+		results = tmdb.SearchHits('series 1', max_hits=50)
+		for _ in range(100):
+			if results.total is not None:
+				break
+			results.poll(timeout=0.05)
+		self.assertIsNotNone(results.total)
+		self.assertGreaterEqual(len(results.hits), 20)
+		self.assertFalse(any('total_episodes' in hit for hit in results.hits))
+		gated.release()
+
+		while not results.done:
+			results.poll(timeout=None)
+
+		self.assertEqual(results.total, 111)
+		self.assertEqual(len(results.hits), 50)
+		self.assertEqual([hit['id'] for hit in results.hits[:3]], ['1', '10', '11'])
+		self.assertEqual(results.hits[-1]['id'], '138')
+		self.assertTrue(all('total_episodes' in hit for hit in results.hits))
+		self.assertFalse(gated.timed_out)
+
+	def test_errors(self) -> None:
+		from http import HTTPStatus
+		from episode_manager.transport import Response
+
+		# the second page and the details of one hit fail, and a hit has no details
+		class FailingAPI:
+			def get(api, url:str, headers:dict|None=None, timeout:float|None=None):
+				if 'page=2' in url or '/tv/10?' in url:
+					return Response(url, HTTPStatus.UNAUTHORIZED, {'Content-Type': 'application/json'}, b'{}')
+				if '/tv/11?' in url:
+					return Response(url, HTTPStatus.NOT_FOUND, {'Content-Type': 'application/json'}, b'{}')
+				return self.api.get(url, headers, timeout)
+		tmdb.set_transport(FailingAPI())
+
+		results = tmdb.SearchHits('series 1', max_hits=50)
+		while not results.done:
+			results.poll(timeout=None)
+
+		self.assertTrue(results.pages_done)
+		self.assertIsInstance(results.error, tmdb.APIAuthError)
+		# the third page is still applied (as far as needed)
+		self.assertEqual(len(results.hits), 30)
+		self.assertEqual(results.hits[20]['id'], '129')
+		self.assertTrue(all('total_episodes' in hit or 'error' in hit for hit in results.hits))
+		hits = { hit['id']: hit for hit in results.hits }
+		self.assertIn('error', hits['10'])
+		self.assertEqual(hits['11']['error'], 'no details')
+		self.assertIn('total_episodes', hits['1'])
+
+	def test_search_result(self) -> None:
+		hits, total = tmdb.search('series 2')
+		# again, from the recent searches
+		self.assertEqual(tmdb.search('series 2'), (hits, total))
+
+		self.api.num_series = 0
+		self.assertEqual(tmdb.search('series 3'), ([], 0))
+
+
+class TestSeasonHint(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		_fresh_limits(self)
+
+	def tearDown(self) -> None:
+		tmdb.set_transport(None)
+		tmdb.set_append_to_response(True)
+		tmdb.__dict__['__details'].clear()
+
+	def fetch(self, api, season_hint:int|None, release_after:int):
+		# the details are held back until the requests not depending on them were made
+		tmdb.__dict__['__details'].clear()
+		gated = GatedAPI(api, held=lambda path: path in ('tv/3', 'tv/3+external_ids'), release_after=release_after)
+		tmdb.set_transport(gated)
+		result = tmdb.episodes('3', with_details=True, season_hint=season_hint)
+		self.assertFalse(gated.timed_out)
+		return result, gated
+
+	def after_details(self, gated:GatedAPI) -> list[str]:
+		return [ path for event, path in gated.events if event == 'start' and path not in gated.early ][1:]
+
+	def test_separate(self) -> None:
+		from episode_manager.transport import SyntheticAPI
+		api = SyntheticAPI(10, seasons=(3, 3))
+		tmdb.set_append_to_response(False)
+
+		# details, then seasons
+		expected, gated = self.fetch(api, None, 2)
+		self.assertEqual(sorted(gated.early), ['tv/3/credits', 'tv/3/external_ids'])
+		self.assertEqual(sorted(self.after_details(gated)), [ 'tv/3/season/%d' % season for season in range(4) ])
+
+		# the seasons up to the hint right away (as well as the specials)
+		for hint, after in ((3, []), (2, ['tv/3/season/3']), (6, [])):
+			result, gated = self.fetch(api, hint, 2 + 1 + hint)
+			self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(expected, sort_keys=True))
+			self.assertEqual(self.after_details(gated), after)
+
+	def test_appended(self) -> None:
+		from episode_manager.transport import SyntheticAPI
+		api = SyntheticAPI(10, seasons=(30, 30))
+
+		# the seasons that don't fit in the first request after it
+		expected, gated = self.fetch(api, None, 0)
+		self.assertEqual(self.after_details(gated), ['tv/3+season/18'])
+
+		# the requests for the seasons up to the hint right away; only those above it depend on the details
+		for hint, num_speculative, num_after in ((30, 1, 0), (20, 1, 1), (45, 2, 0)):
+			result, gated = self.fetch(api, hint, num_speculative)
+			self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(expected, sort_keys=True))
+			self.assertEqual(len(gated.early), num_speculative)
+			self.assertEqual(len(self.after_details(gated)), num_after)
+
+	def test_appended_hint(self) -> None:
+		from episode_manager.transport import SyntheticAPI
+		api = SyntheticAPI(10, seasons=(3, 3))
+		tmdb.set_transport(api)
+		expected = tmdb.episodes('3', with_details=True)
+
+		# only the seasons up to the hint are appended
+		urls = []
+		class Recording:
+			def get(self, url:str, headers:dict|None=None, timeout:float|None=None):
+				urls.append(url)
+				return api.get(url, headers, timeout)
+		tmdb.set_transport(Recording())
+		tmdb.__dict__['__details'].clear()
+		result = tmdb.episodes('3', with_details=True, season_hint=3)
+		self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(expected, sort_keys=True))
+		self.assertEqual(len(urls), 1)
+		self.assertEqual(parse_qs(urlsplit(urls[0]).query)['append_to_response'], ['external_ids,credits,season/1,season/2,season/3,season/0'])
+
+	def test_appended_missing(self) -> None:
+		from episode_manager.transport import SyntheticAPI
+		api = SyntheticAPI(10, seasons=(3, 3))
+		tmdb.set_transport(api)
+		expected = tmdb.episodes('3', with_details=True)
+
+		# a season missing from the response is fetched on its own
+		class MissingSeason(SyntheticAPI):
+			def data(self, path:list[str], query:dict[str, str]) -> dict|None:
+				data = super().data(path, query)
+				if data is not None and len(path) == 2:
+					data.pop('season/2', None)
+				return data
+		gated = GatedAPI(MissingSeason(10, seasons=(3, 3)), held=lambda path: False)
+		tmdb.set_transport(gated)
+		tmdb.__dict__['__details'].clear()
+		result = tmdb.episodes('3', with_details=True)
+		self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(expected, sort_keys=True))
+		self.assertEqual([ path for event, path in gated.events if event == 'start' ], ['tv/3+external_ids', 'tv/3/season/2'])
+
+
+class StallingAPI:
+	"""The first request for each URL stalls."""
+	def __init__(self, stall:float):
+		from episode_manager.transport import SyntheticAPI
+		self.api = SyntheticAPI(10)
+		self.stall = stall
+		self.seen:set[str] = set()
+		self.lock = threading.Lock()
+
+	def get(self, url:str, headers:dict|None=None, timeout:float|None=None):
+		with self.lock:
+			first = url not in self.seen
+			self.seen.add(url)
+		time.sleep(self.stall if first else 0.01)
+		return self.api.get(url, headers, timeout)
+
+
+class TestHedging(unittest.TestCase):
+	def setUp(self) -> None:
+		tmdb.set_api_key('test-key')
+		_fresh_limits(self)
+		tmdb.set_transport(StallingAPI(1.0))
+		tmdb.set_hedging(0.5)
+		tmdb.net_stats().reset()
+		for _ in range(20):
+			tmdb.net_stats().request('details', 0.01)
+		tmdb.__dict__['__details'].clear()
+
+	def tearDown(self) -> None:
+		tmdb.set_transport(None)
+		tmdb.set_hedging(None)
+		tmdb.set_rate_limit(tmdb._default_rate_limit)
+		tmdb.net_stats().reset()
+		tmdb.__dict__['__details'].clear()
+
+	def test_hedged(self) -> None:
+		for title_id in ('3', '4'):
+			result = tmdb.details(title_id)
+			self.assertEqual(result['imdb_id'], 'tt000000%s' % title_id)
+
+		# the duplicates answered first
+		stats = tmdb.net_stats().summary()['details']
+		self.assertEqual(stats['hedged'], 2)
+		self.assertEqual(stats['hedge_won'], 2)
+
+	def test_first_wins(self) -> None:
+		tmdb.set_transport(StallingAPI(3.0))
+		started = time.monotonic()
+		result = tmdb.details('3')
+		# the duplicate's response is used, without waiting for the original
+		self.assertLess(time.monotonic() - started, 1.5)
+		self.assertEqual(result['imdb_id'], 'tt0000003')
+		self.assertEqual(tmdb.net_stats().summary()['details']['hedge_won'], 1)
+
+	def test_original_wins(self) -> None:
+		# the duplicate is slower
+		class SlowDuplicate(StallingAPI):
+			def get(self, url:str, headers:dict|None=None, timeout:float|None=None):
+				with self.lock:
+					first = url not in self.seen
+					self.seen.add(url)
+				time.sleep(0.2 if first else 1.0)
+				return self.api.get(url, headers, timeout)
+		tmdb.set_transport(SlowDuplicate(0))
+		tmdb.details('3')
+		stats = tmdb.net_stats().summary()['details']
+		self.assertEqual(stats['hedged'], 1)
+		self.assertEqual(stats['hedge_won'], 0)
+
+	def test_not_needed(self) -> None:
+		tmdb.set_transport(StallingAPI(0.01))
+		tmdb.net_stats().reset()
+		for _ in range(20):
+			tmdb.net_stats().request('details', 1.0)
+
+		for title_id in ('3', '4'):
+			tmdb.details(title_id)
+		# no duplicate was sent (nor even queued)
+		self.assertEqual(tmdb.net_stats().summary()['details']['hedged'], 0)
+		self.assertEqual(tmdb.scheduler_stats()['queued'], 0)
+
+	def test_budget(self) -> None:
+		tmdb.set_hedging(0.01)
+		for title_id in ('3', '4'):
+			tmdb.details(title_id)
+		# only the first one fits in the budget
+		stats = tmdb.net_stats().summary()['details']
+		self.assertEqual(stats['hedged'], 1)
+		self.assertEqual(stats['hedge_won'], 1)
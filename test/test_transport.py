@@ -0,0 +1,80 @@
+import unittest
+import json
+import time
+import tempfile
+import shutil
+
+from episode_manager import tmdb
+from episode_manager.transport import Recorder, Replayer, SyntheticAPI, StandInServer
+
+
+class TestTransport(unittest.TestCase):
+	def setUp(self) -> None:
+		self.path = tempfile.mkdtemp()
+		tmdb.set_api_key('test-key')
+		tmdb.set_rate_limit(1000)
+		tmdb.__dict__['__details'].clear()
+
+	def tearDown(self) -> None:
+		tmdb.set_transport(None)
+		tmdb.set_rate_limit(tmdb._default_rate_limit)
+		tmdb.__dict__['__details'].clear()
+		shutil.rmtree(self.path)
+
+	def test_synthetic(self) -> None:
+		api = SyntheticAPI(20, seasons=(3, 3), episodes=(4, 4))
+		tmdb.set_transport(api)
+
+		ser_details, episodes = tmdb.episodes('7', with_details=True)
+		self.assertEqual(ser_details['title'], 'Series 7')
+		self.assertEqual(ser_details['imdb_id'], 'tt0000007')
+		self.assertEqual(len(episodes), 3*4 + 1)
+
+		hits, total = tmdb.search('series 1')
+		self.assertEqual(total, 11)  # 1, 10..19
+		self.assertIsNone(tmdb.episodes('21'))
+
+		api.changed = {'4', '7'}
+		self.assertEqual(tmdb.changed_series(tmdb.datetime.now()), {'4', '7'})
+		self.assertEqual(tmdb.changes('7', None)[0]['key'], 'season')
+
+	def test_stand_in(self) -> None:
+		api = SyntheticAPI(50, seasons=(3, 3), episodes=(3, 3))
+		tmdb.set_transport(api)
+		expected = tmdb.episodes('42', with_details=True)
+		tmdb.set_transport(None)
+		tmdb.__dict__['__details'].clear()
+
+		# the same, over HTTP
+		server = StandInServer(api, chunk_size=100).start()
+		tmdb.set_api_root(server.root)
+		try:
+			result = tmdb.episodes('42', with_details=True)
+		finally:
+			tmdb.set_api_root(tmdb.default_api_root)
+			server.close()
+		self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(expected, sort_keys=True))
+		self.assertGreater(server.num_requests, 0)
+
+	def test_record_replay(self) -> None:
+		tmdb.set_transport(Recorder(self.path, SyntheticAPI(20)))
+		recorded = tmdb.episodes(['3', '4', '99'], with_details=True)
+		self.assertIsNone(recorded[2])
+
+		tmdb.__dict__['__details'].clear()
+		replayer = Replayer(self.path, latency=0.05)
+		waits = []
+		replayer._latency.wait = lambda: waits.append(0.05)  # type: ignore
+		tmdb.set_transport(replayer)
+		replayed = tmdb.episodes(['3', '4', '99'], with_details=True)
+
+		# with the latency, for each request
+		self.assertGreaterEqual(len(waits), 3)
+		self.assertEqual(json.dumps(replayed, sort_keys=True), json.dumps(recorded, sort_keys=True))
+
+		# not recorded
+		self.assertIsNone(tmdb.episodes('5'))
+
+
+if __name__ == '__main__':
+	unittest.main()